@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""A local, OpenAI-compatible chat completions endpoint for offline benchmarks.
+
+Point OPENAI_BASE_URL at http://127.0.0.1:<port>/v1 to use it. Every call sleeps for
+latency + completion_tokens / tokens_per_second and fails with a 429 or 500 at error_rate.
+Requests with "stream": true are answered with server-sent events, one word per event.
+GET /stats returns the call counters and resets them.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockOpenAIServer:
+    """
+    Serves /v1/chat/completions from a background thread.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.2,
+        tokens_per_second: float = 500.0,
+        completion_tokens: int = 400,
+        error_rate: float = 0.0,
+    ):
+        """
+        :param host: Interface to listen on.
+        :param port: Port to listen on (default: any free port).
+        :param latency: Seconds before the first token of every response.
+        :param tokens_per_second: Simulated generation speed.
+        :param completion_tokens: Words generated per response (capped by the request's max_tokens).
+        :param error_rate: Fraction of requests that fail with a 429 or 500.
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._reset_stats()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _reset_stats(self):
+        self.stats = {
+            "calls": 0,
+            "errors": 0,
+            "prompt_chars": 0,
+            "completion_tokens": 0,
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict, headers: dict = None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/stats"):
+                    with server._lock:
+                        stats = server.stats
+                        server._reset_stats()
+                    self._send_json(200, stats)
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                prompt_chars = sum(len(m["content"]) for m in body["messages"])
+                with server._lock:
+                    server.stats["calls"] += 1
+                    server.stats["prompt_chars"] += prompt_chars
+
+                if random.random() < server.error_rate:
+                    with server._lock:
+                        server.stats["errors"] += 1
+                    time.sleep(server.latency)
+                    status = random.choice([429, 500])
+                    self._send_json(
+                        status,
+                        {"error": {"message": "mock failure", "type": "mock"}},
+                        {"retry-after-ms": "100"} if status == 429 else None,
+                    )
+                    return
+
+                completion_tokens = min(
+                    server.completion_tokens, body.get("max_tokens") or server.completion_tokens
+                )
+                with server._lock:
+                    server.stats["completion_tokens"] += completion_tokens
+                usage = {
+                    "prompt_tokens": prompt_chars // 4,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_chars // 4 + completion_tokens,
+                }
+                if body.get("stream"):
+                    self._send_stream(body, completion_tokens, usage)
+                    return
+
+                time.sleep(server.latency + completion_tokens / server.tokens_per_second)
+                content = " ".join(f"word{i % 97}" for i in range(completion_tokens))
+                self._send_json(
+                    200,
+                    {
+                        "id": "chatcmpl-mock",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get("model", "mock"),
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": content},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": usage,
+                    },
+                )
+
+            def _send_stream(self, body: dict, completion_tokens: int, usage: dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+
+                def send_event(data: str):
+                    self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                def chunk(choices: list, chunk_usage: dict = None) -> str:
+                    return json.dumps(
+                        {
+                            "id": "chatcmpl-mock",
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": body.get("model", "mock"),
+                            "choices": choices,
+                            "usage": chunk_usage,
+                        }
+                    )
+
+                time.sleep(server.latency)
+                for i in range(completion_tokens):
+                    delta = {"content": f"word{i % 97} "}
+                    send_event(chunk([{"index": 0, "delta": delta, "finish_reason": None}]))
+                    time.sleep(1 / server.tokens_per_second)
+                send_event(chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    send_event(chunk([], usage))
+                send_event("[DONE]")
+
+        return Handler
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--completion-tokens", type=int, default=400)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        port=args.port,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+    )
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Offline benchmarks for file-summarizer.
+
+Runs tools.reader.read_file against a local mock OpenAI endpoint (see mock_openai_server.py)
+and an in-memory stand-in for the GPTScript workspace, for every combination of document size and
+concurrency. Each case runs in a fresh subprocess so that peak RSS is measured per case.
+
+The tokenizer must already be cached (python -m tools.tokens, or TIKTOKEN_CACHE_DIR) since the benchmarks run offline.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 1KB,1MB,100MB --concurrency 4,32 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FILE_SUMMARIZER_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, FILE_SUMMARIZER_DIR)
+
+DEFAULT_SIZES = "1KB,10KB,100KB,1MB,10MB,100MB"
+DEFAULT_CONCURRENCY = "4,16,64"
+_UNITS = {"KB": 1_000, "MB": 1_000_000, "GB": 1_000_000_000, "B": 1}
+_WORDS = (
+    "the of and to in is for that on with as by at from config server request token chunk "
+    "summary error warning user file model latency value table index cache worker queue"
+).split()
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().upper()
+    for unit, factor in _UNITS.items():
+        if value.endswith(unit):
+            return int(float(value[: -len(unit)]) * factor)
+    return int(value)
+
+
+def generate_document(size: int, seed: int = 0) -> bytes:
+    """Generate a deterministic markdown-ish document of about `size` bytes."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(2000):
+        if i % 50 == 0:
+            lines.append(f"## Section {i // 50}")
+        words = " ".join(rng.choices(_WORDS, k=rng.randint(5, 25)))
+        lines.append(f"{words} {rng.randint(0, 10**6)}.")
+    block = ("\n".join(lines) + "\n").encode("utf-8")
+    parts = []
+    total = 0
+    n = 0
+    while total < size:
+        # number every block so that no two chunks are identical
+        part = f"# Part {n}\n".encode("utf-8") + block
+        parts.append(part)
+        total += len(part)
+        n += 1
+    return b"".join(parts)[:size]
+
+
+def install_workspace_stub(files: dict):
+    """Replace the GPTScript workspace functions with an in-memory dict, in every module that imported them."""
+    from tools import gptscript_workspace
+
+    async def read_file_in_workspace(filepath: str) -> bytes:
+        return files[gptscript_workspace._prepend_base_path(filepath)]
+
+    async def write_file_in_workspace(filepath: str, content: str) -> bool:
+        files[gptscript_workspace._prepend_base_path(filepath)] = content.encode("utf-8")
+        return True
+
+    stubs = {
+        "read_file_in_workspace": read_file_in_workspace,
+        "write_file_in_workspace": write_file_in_workspace,
+    }
+    for name, module in list(sys.modules.items()):
+        if name == "tools" or name.startswith("tools."):
+            for attr, stub in stubs.items():
+                if hasattr(module, attr):
+                    setattr(module, attr, stub)
+
+
+def _fetch_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(f"{base_url}/stats") as response:
+        return json.loads(response.read())
+
+
+def run_case(size: int, base_url: str) -> dict:
+    """Run one benchmark case in this process and return its measurements."""
+    import asyncio
+    from tools import reader, tokens
+
+    document = generate_document(size)
+    files = {"files/benchmark.log": document}
+    del document
+    install_workspace_stub(files)
+
+    # time every tokenizer call, wherever it comes from
+    encoder = tokens.get_encoder()
+    tokenize_seconds = 0.0
+    encode = encoder.encode
+
+    def timed_encode(*args, **kwargs):
+        nonlocal tokenize_seconds
+        start = time.perf_counter()
+        try:
+            return encode(*args, **kwargs)
+        finally:
+            tokenize_seconds += time.perf_counter() - start
+
+    encoder.encode = timed_encode
+
+    first_byte = None
+
+    def on_text(text: str):
+        nonlocal first_byte
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+
+    _fetch_stats(base_url)
+    start = time.perf_counter()
+    result = asyncio.run(reader.read_file("benchmark.log", on_text=on_text))
+    elapsed = time.perf_counter() - start
+    stats = _fetch_stats(base_url)
+
+    return {
+        "size_bytes": size,
+        "summarized": result.startswith("The original file"),
+        "end_to_end_seconds": round(elapsed, 3),
+        "first_byte_seconds": round(first_byte, 3),
+        "tokenize_seconds": round(tokenize_seconds, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "model_calls": stats["calls"],
+        "model_errors": stats["errors"],
+        "completion_tokens": stats["completion_tokens"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated document sizes, e.g. 1KB,10MB")
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="comma-separated FILE_SUMMARIZER_MAX_CONCURRENCY values")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock time to first token, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0, help="mock generation speed")
+    parser.add_argument("--completion-tokens", type=int, default=400, help="mock tokens per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock requests failing with 429/500")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--case", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case, args.base_url)))
+        return
+
+    from benchmarks.mock_openai_server import MockOpenAIServer
+
+    server = MockOpenAIServer(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+    ).start()
+
+    results = []
+    header = f"{'size':>10} {'conc':>5} {'calls':>6} {'errors':>6} {'e2e_s':>8} {'ttfb_s':>8} {'tok_s':>7} {'rss_mb':>8} summarized"
+    print(header)
+    try:
+        for size_label in args.sizes.split(","):
+            for concurrency in args.concurrency.split(","):
+                env = dict(
+                    os.environ,
+                    OPENAI_BASE_URL=server.base_url,
+                    OPENAI_API_KEY="benchmark",
+                    FILE_SUMMARIZER_MAX_CONCURRENCY=concurrency.strip(),
+                    FILE_SUMMARIZER_CACHE="off",
+                    # the synthetic document repeats itself, which pre-compression would mostly remove
+                    FILE_SUMMARIZER_PRECOMPRESS="off",
+                )
+                completed = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--case", str(parse_size(size_label)), "--base-url", server.base_url],
+                    env=env,
+                    cwd=FILE_SUMMARIZER_DIR,
+                    capture_output=True,
+                    text=True,
+                )
+                if completed.returncode != 0:
+                    print(f"{size_label:>10} {concurrency:>5} FAILED: {completed.stderr.strip().splitlines()[-1:]}")
+                    continue
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+                result.update(size=size_label.strip(), concurrency=int(concurrency))
+                results.append(result)
+                print(
+                    f"{result['size']:>10} {result['concurrency']:>5} {result['model_calls']:>6} {result['model_errors']:>6} "
+                    f"{result['end_to_end_seconds']:>8} {result['first_byte_seconds']:>8} {result['tokenize_seconds']:>7} {result['peak_rss_mb']:>8} {result['summarized']}"
+                )
+    finally:
+        server.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,85 @@
 import os
+import sys
 import asyncio
-from tools.reader import read_file
-from tools.gptscript_workspace import write_file_in_workspace
+from typing import Dict
+from tools.worker import (
+    REQUEST_VARIABLES,
+    WORKER_MODE,
+    run_in_worker,
+    serve,
+    spawn_worker,
+)
 
-async def main():
-    input_file = os.getenv("INPUT_FILE", "")
+# with OUTPUT_FILE=NONE, print the final summary while it is generated
+STREAM_OUTPUT = os.getenv("FILE_SUMMARIZER_STREAM", "true").lower() not in ("0", "false", "off", "no")
+
+
+async def batch_main(input_pattern: str, output: str, topic: str, client=None, scheduler=None):
+    from tools.batch import resolve_batch_input, summarize_files
+
+    input_files = await resolve_batch_input(input_pattern)
+    if not input_files:
+        raise ValueError(f"Error: no workspace files match {input_pattern}")
+
+    results = await summarize_files(input_files, output, topic, client=client, scheduler=scheduler)
+    failures = [(input_file, error) for input_file, _, error in results if error]
+    if failures:
+        raise Exception(
+            f"Failed to summarize {len(failures)} of {len(results)} files: "
+            + "; ".join(f"{input_file}: {error}" for input_file, error in failures)
+        )
+
+
+async def main(request: Dict[str, str], client=None, scheduler=None):
+    """Run the tool for one call.
+
+    Args:
+        request (Dict[str, str]): The tool's parameters (INPUT_FILE, OUTPUT_FILE, TOPIC) that are set.
+        client: The AsyncOpenAI client to summarize with; created on demand if not given.
+        scheduler: The RequestScheduler for model calls; one per read if not given.
+    """
+    # the reader (and everything it imports) is only loaded when the call runs in this process
+    from tools.batch import is_batch_input, summary_file_name
+    from tools.gptscript_workspace import write_file_in_workspace
+    from tools.reader import read_file
+    from tools.summary_tree import summary_tree_file_name
+
+    input_file = request.get("INPUT_FILE", "")
     if not input_file:
         raise ValueError("Error: INPUT_FILE environment variable is not set")
+    topic = request.get("TOPIC", "")
+
+    if await is_batch_input(input_file):
+        await batch_main(input_file, request.get("OUTPUT_FILE", ""), topic, client, scheduler)
+        return
+
+    output_file = request.get("OUTPUT_FILE", "NONE")
+    if output_file.upper() == "NONE" and STREAM_OUTPUT:
+        await read_file(
+            input_file,
+            client=client,
+            scheduler=scheduler,
+            on_text=lambda text: print(text, end="", flush=True),
+            topic=topic,
+        )
+        print()
+        return
 
-    final_summary = await read_file(input_file)
-    output_file = os.getenv("OUTPUT_FILE", "NONE")
     # Handle output
     if output_file.upper() == "NONE":
-        print(final_summary)
+        print(await read_file(input_file, client=client, scheduler=scheduler, topic=topic))
     else:
         if output_file == "":
-            directory, file_name = os.path.split(input_file)
-            name, ext = os.path.splitext(file_name)
-            summary_file_name = f"{name}_summary{ext}"
-            output_file = os.path.join(directory, summary_file_name)
+            output_file = summary_file_name(input_file)
 
+        # the summary tree is kept next to the summary so that the next run only re-summarizes what changed
+        final_summary = await read_file(
+            input_file,
+            client=client,
+            scheduler=scheduler,
+            summary_tree_file=summary_tree_file_name(output_file),
+            topic=topic,
+        )
         try:
             await write_file_in_workspace(output_file, final_summary)
             print(f"Summary written to workspace file: {output_file}")
@@ -30,5 +90,52 @@ async def main():
             )
 
 
+async def run():
+    """Run the call in the warm worker for this environment if there is one (see tools.worker), in-process otherwise."""
+    request = {name: os.environ[name] for name in REQUEST_VARIABLES if name in os.environ}
+    if await run_in_worker(request, lambda text: print(text, end="", flush=True)):
+        return
+    if WORKER_MODE == "spawn":
+        spawn_worker()
+
+    from tools.gptscript_workspace import close_gptscript_client
+
+    try:
+        await main(request)
+    finally:
+        close_gptscript_client()
+
+
+async def serve_main():
+    """Serve calls from a long-lived worker that keeps the encoder, the HTTP connection pools and the caches warm."""
+    from tools.gptscript_workspace import (
+        close_call_gptscript_client,
+        close_gptscript_client,
+        open_call_gptscript_client,
+    )
+    from tools.helper import call_environment, get_async_openai_client
+    from tools.scheduler import RequestScheduler
+    from tools.summarizer import MAX_CONCURRENCY
+    from tools.tokens import get_encoder
+
+    get_encoder()
+    # all calls share one client (and its connections) and one concurrency limit
+    client = get_async_openai_client()
+    scheduler = RequestScheduler(MAX_CONCURRENCY)
+
+    async def handle(request: Dict[str, str]):
+        token = open_call_gptscript_client(call_environment())
+        try:
+            await main(request, client, scheduler)
+        finally:
+            close_call_gptscript_client(token)
+
+    try:
+        await serve(handle)
+    finally:
+        await client.close()
+        close_gptscript_client()
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(serve_main() if sys.argv[1:] == ["--serve"] else run())
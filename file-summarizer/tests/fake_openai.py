@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""A fake model behind a real AsyncOpenAI client, for tests that run the summarizer without a network.
+
+Test documents are paragraphs that each start with a marker such as "P00042". The fake "summarizes" any input
+into the range of markers it covers ("P00040-P00047") and a digest of the input, followed by filler,
+so the final summary shows whether every paragraph was covered, and each call checks that the ranges
+it was given are in document order.
+
+The tests run from the file-summarizer directory: python -m unittest discover -s tests
+"""
+import hashlib
+import json
+import random
+import re
+from typing import List, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from tools.summarizer import DocumentSummarizer
+
+MARKER = re.compile(r"P(\d{5})(?:-P(\d{5}))?")
+WORDS = "alpha beta gamma delta epsilon zeta theta kappa lambda sigma omega river stone cloud field".split()
+
+
+def make_document(paragraphs: int, words: int = 30, seed: int = 0) -> str:
+    """A document of numbered paragraphs of pseudo-random words, separated by blank lines."""
+    rng = random.Random(seed)
+    return "".join(
+        f"P{i:05d} " + " ".join(rng.choice(WORDS) for _ in range(words)) + ".\n\n"
+        for i in range(paragraphs)
+    )
+
+
+def marker_range(paragraphs: int) -> str:
+    """The final summary of a document of that many paragraphs, if every one of them was covered in order."""
+    return f"P00000-P{paragraphs - 1:05d}"
+
+
+class FakeModel:
+    """
+    Answers chat completions from an httpx.MockTransport.
+
+    Summaries fill half of the call's max_tokens, like real ones tend to; with ignore_budget they are
+    several times larger than max_tokens instead.
+    """
+
+    def __init__(self, ignore_budget: bool = False):
+        """
+        :param ignore_budget: Whether summaries ignore the call's max_tokens.
+        """
+        self.ignore_budget = ignore_budget
+        # (kind, max_tokens) per call, kind being "chunk" or "final"
+        self.calls: List[Tuple[str, int]] = []
+        # inputs whose marker ranges were out of order, overlapping or had gaps
+        self.order_errors: List[str] = []
+
+    def client(self) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            api_key="test",
+            base_url="http://fake-model.test/v1",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(self._handle)),
+        )
+
+    def calls_of(self, kind: str) -> int:
+        return sum(1 for call_kind, _ in self.calls if call_kind == kind)
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        system_prompt, user_prompt = (message["content"] for message in body["messages"])
+        kind = "final" if "final consolidated summary" in system_prompt else "chunk"
+        max_tokens = body["max_tokens"]
+        self.calls.append((kind, max_tokens))
+
+        text = user_prompt.split("content to summarize:\n\n", 1)[1]
+        ranges = [
+            (int(first), int(last) if last else int(first)) for first, last in MARKER.findall(text)
+        ]
+        for (_, previous_last), (first, _) in zip(ranges, ranges[1:]):
+            if first != previous_last + 1:
+                self.order_errors.append(text)
+                break
+
+        content = f"P{ranges[0][0]:05d}-P{ranges[-1][1]:05d}" if ranges else "nothing"
+        # a changed input changes its summary, and so the inputs of the merges above it
+        content += " " + hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+        filler_words = max_tokens * 4 if self.ignore_budget else max_tokens // 2
+        content += " " + " ".join(WORDS[i % len(WORDS)] for i in range(filler_words))
+        return httpx.Response(
+            200,
+            json={
+                "id": f"fake-{len(self.calls)}",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            },
+        )
+
+
+def make_summarizer(model: FakeModel, **kwargs) -> DocumentSummarizer:
+    """A summarizer with small chunks and outputs, so that small documents take several reduction levels."""
+    options = dict(
+        model="fake-model",
+        max_context_tokens=2400,
+        max_output_tokens=100,
+        max_chunk_tokens=300,
+        max_final_input_tokens=300,
+        max_concurrency=8,
+        verbose=False,
+    )
+    options.update(kwargs)
+    return DocumentSummarizer(model.client(), **options)
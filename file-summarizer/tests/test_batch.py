@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+from tools import batch
+
+WORKSPACE = [
+    "notes/a.md",
+    "notes/a_summary.md",
+    "notes/a_summary.md.tree.json",
+    "notes/b.txt",
+    "notes/deep/c.md",
+    "notes/deep/deeper/d.md",
+    "notes2/e.md",
+    "reports/Invoice [2024].pdf",
+]
+
+
+async def list_files(directory: str = ""):
+    prefix = directory.rstrip("/") + "/" if directory.strip("/") else ""
+    return [p for p in WORKSPACE if p.startswith(prefix)]
+
+
+class GlobToRegexTest(unittest.TestCase):
+    def assertMatches(self, pattern: str, path: str, expected: bool = True):
+        self.assertEqual(bool(batch.glob_to_regex(pattern).match(path)), expected, f"{pattern} {path}")
+
+    def test_wildcards_stay_within_a_segment(self):
+        self.assertMatches("notes/*.md", "notes/a.md")
+        self.assertMatches("notes/*.md", "notes/deep/c.md", False)
+        self.assertMatches("notes/?.md", "notes/a.md")
+        self.assertMatches("notes?a.md", "notes/a.md", False)
+        self.assertMatches("*/a.md", "notes/a.md")
+
+    def test_double_star_crosses_directories(self):
+        self.assertMatches("notes/**/*.md", "notes/a.md")
+        self.assertMatches("notes/**/*.md", "notes/deep/deeper/d.md")
+        self.assertMatches("notes/**", "notes/deep/c.md")
+        self.assertMatches("notes/**/*.md", "notes2/e.md", False)
+
+    def test_character_classes(self):
+        self.assertMatches("r/[ab].txt", "r/a.txt")
+        self.assertMatches("r/[!ab].txt", "r/c.txt")
+        self.assertMatches("r/[!ab].txt", "r/a.txt", False)
+        self.assertMatches("r[!x]a.txt", "r/a.txt", False)
+        self.assertMatches("r/[]]", "r/]")
+        self.assertMatches("r/[a-c]", "r/b")
+        self.assertMatches("r/[^]", "r/^")
+
+    def test_other_characters_are_literal(self):
+        self.assertMatches("a.b/*", "a.b/c")
+        self.assertMatches("a.b/*", "axb/c", False)
+        self.assertMatches("r/[", "r/[")
+        self.assertMatches("notes/*.md", "notes/a.md.bak", False)
+
+
+class ResolveBatchInputTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        patcher = mock.patch.object(batch, "list_file_paths_in_workspace", list_files)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_glob_skips_summaries_and_their_trees(self):
+        self.assertEqual(await batch.resolve_batch_input("notes/*.md"), ["notes/a.md"])
+
+    async def test_recursive_glob(self):
+        self.assertEqual(
+            await batch.resolve_batch_input("notes/**/*.md"),
+            ["notes/a.md", "notes/deep/c.md", "notes/deep/deeper/d.md"],
+        )
+
+    async def test_directory_lists_everything_under_it(self):
+        self.assertEqual(
+            await batch.resolve_batch_input("notes/"),
+            ["notes/a.md", "notes/b.txt", "notes/deep/c.md", "notes/deep/deeper/d.md"],
+        )
+
+    async def test_batch_input_detection(self):
+        exists = mock.AsyncMock(side_effect=lambda path: path in WORKSPACE)
+        with mock.patch.object(batch, "file_exists_in_workspace", exists):
+            self.assertTrue(await batch.is_batch_input("notes/"))
+            self.assertTrue(await batch.is_batch_input("notes/*.md"))
+            self.assertFalse(await batch.is_batch_input("notes/a.md"))
+            self.assertFalse(await batch.is_batch_input("reports/Invoice [2024].pdf"))
+
+
+class SummarizeFilesTest(unittest.IsolatedAsyncioTestCase):
+    def test_summary_file_name(self):
+        self.assertEqual(batch.summary_file_name("notes/a.md"), "notes/a_summary.md")
+        self.assertEqual(batch.summary_file_name("notes/a.md", "out"), "out/notes/a_summary.md")
+        self.assertEqual(batch.summary_file_name("README"), "README_summary")
+
+    async def test_each_file_is_written_and_failures_are_reported(self):
+        async def read_file(input_file, **kwargs):
+            if input_file == "notes/b.txt":
+                raise ValueError("unreadable")
+            return f"summary of {input_file}"
+
+        write = mock.AsyncMock(return_value=True)
+        with mock.patch.object(batch, "read_file", read_file), mock.patch.object(
+            batch, "write_file_in_workspace", write
+        ), contextlib.redirect_stdout(io.StringIO()):
+            results = await batch.summarize_files(
+                ["notes/a.md", "notes/b.txt"], output="out", client=object(), scheduler=object()
+            )
+
+        self.assertEqual(
+            results,
+            [("notes/a.md", "out/notes/a_summary.md", None), ("notes/b.txt", None, "unreadable")],
+        )
+        write.assert_awaited_once_with("out/notes/a_summary.md", "summary of notes/a.md")
+
+
+if __name__ == "__main__":
+    unittest.main()
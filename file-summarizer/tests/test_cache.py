@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+
+from tools.cache import EVICTION_TARGET_FRACTION, SQLiteLRUCache, make_cache_key
+
+
+class MakeCacheKeyTest(unittest.TestCase):
+    def test_parts_are_length_prefixed(self):
+        self.assertNotEqual(make_cache_key("ab", "c"), make_cache_key("a", "bc"))
+        self.assertEqual(make_cache_key("model", 1, "text"), make_cache_key("model", "1", b"text"))
+
+
+class SQLiteLRUCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "nested", "cache.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self, max_bytes: int = 1000) -> SQLiteLRUCache:
+        cache = SQLiteLRUCache(self.path, max_bytes)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_values_persist(self):
+        cache = self.open()
+        cache.set("key", "value ü")
+        self.assertEqual(cache.get("key"), "value ü")
+        self.assertIsNone(cache.get("missing"))
+        cache.close()
+
+        self.assertEqual(self.open().get("key"), "value ü")
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = self.open(max_bytes=1000)
+        for i in range(10):
+            cache.set(f"key{i}", "x" * 100)
+        # reading key0 makes key1 the least recently used
+        cache.get("key0")
+        cache.set("key10", "x" * 100)
+
+        self.assertIsNotNone(cache.get("key0"))
+        self.assertIsNone(cache.get("key1"))
+        self.assertIsNotNone(cache.get("key10"))
+        self.assertLessEqual(cache._stored_total(), 1000 * EVICTION_TARGET_FRACTION)
+
+    def test_replacing_a_value_counts_its_size_once(self):
+        cache = self.open(max_bytes=1000)
+        for _ in range(20):
+            cache.set("key", "x" * 600)
+        cache.set("other", "y" * 300)
+
+        self.assertEqual(cache.get("key"), "x" * 600)
+        self.assertEqual(cache._total, 900)
+
+    def test_total_includes_other_connections(self):
+        cache = self.open(max_bytes=1000)
+        other = self.open(max_bytes=1000)
+        for i in range(5):
+            other.set(f"other{i}", "x" * 150)
+        cache.set("key", "x" * 300)
+
+        self.assertLessEqual(cache._stored_total(), 1000)
+        self.assertEqual(cache.get("key"), "x" * 300)
+
+    def test_values_larger_than_the_cache_are_not_stored(self):
+        cache = self.open(max_bytes=10)
+        cache.set("key", "x" * 11)
+        self.assertIsNone(cache.get("key"))
+
+    def test_database_errors_are_not_raised(self):
+        cache = self.open()
+        cache.set("key", "value")
+        cache._conn.close()
+
+        with self.assertLogs("tools.cache", "WARNING"):
+            cache.set("other", "value")
+        with self.assertLogs("tools.cache", "WARNING"):
+            self.assertIsNone(cache.get("key"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import json
+import unittest
+
+from tools.extractors import (
+    csv_to_text,
+    get_extractor,
+    html_to_text,
+    needs_knowledge_tool,
+    notebook_to_text,
+)
+
+
+class CsvToTextTest(unittest.TestCase):
+    def test_rows_are_compacted(self):
+        self.assertEqual(csv_to_text('a, b ,c\n"x\ny",2,\n,,\n1,2,3\n'), "a,b,c\nx y,2\n1,2,3\n")
+
+    def test_cells_with_commas_stay_quoted(self):
+        self.assertEqual(csv_to_text('name,note\nAda,"one, two"\n'), 'name,note\nAda,"one, two"\n')
+
+
+class NotebookToTextTest(unittest.TestCase):
+    def test_cells_without_outputs(self):
+        notebook = {
+            "metadata": {"kernelspec": {"language": "python"}},
+            "cells": [
+                {"cell_type": "markdown", "source": ["# Title\n", "text"]},
+                {"cell_type": "code", "source": "print(1)\n", "outputs": [{"text": "1"}]},
+                {"cell_type": "code", "source": "  \n"},
+            ],
+        }
+        self.assertEqual(notebook_to_text(json.dumps(notebook)), "# Title\ntext\n\n```python\nprint(1)\n```\n")
+
+    def test_invalid_notebook_raises(self):
+        with self.assertRaises(ValueError):
+            notebook_to_text("not json")
+
+
+class HtmlToTextTest(unittest.TestCase):
+    def test_visible_text_and_structure(self):
+        html = (
+            "<html><head><title>T</title><style>p{}</style><script>x()</script></head><body>"
+            "<h1>Head</h1><p>Some   <b>bold</b>\n text.</p><ul><li>one</li><li>two</li></ul>"
+            "<table><tr><th>a</th><th>b</th></tr><tr><td>1</td><td>2</td></tr></table>"
+            "<pre>  code\n   kept</pre>a<br>b &amp; c</body></html>"
+        )
+        self.assertEqual(
+            html_to_text(html),
+            "T\n\n# Head\n\nSome bold text.\n\n- one\n- two\n\n| a | b\n| 1 | 2\n\n  code\n   kept\n\na\nb & c\n",
+        )
+
+    def test_unclosed_tags(self):
+        self.assertEqual(html_to_text("<p>one<p>two<div>three"), "one\n\ntwo\nthree\n")
+
+
+class FileTypeTest(unittest.TestCase):
+    def test_binary_documents_by_content_and_extension(self):
+        self.assertTrue(needs_knowledge_tool("report.pdf", b"anything"))
+        self.assertTrue(needs_knowledge_tool("report.txt", b"%PDF-1.7\n"))
+        self.assertTrue(needs_knowledge_tool("slides", b"PK\x03\x04rest"))
+        self.assertTrue(needs_knowledge_tool("Letter.DOCX", b""))
+        self.assertFalse(needs_knowledge_tool("page.html", b"<html>"))
+        self.assertFalse(needs_knowledge_tool("notes.md", b"# Notes"))
+
+    def test_extractors_by_extension(self):
+        self.assertIs(get_extractor("data/Table.CSV"), csv_to_text)
+        self.assertIs(get_extractor("page.htm"), html_to_text)
+        self.assertIs(get_extractor("analysis.ipynb"), notebook_to_text)
+        self.assertIsNone(get_extractor("notes.md"))
+        self.assertIsNone(get_extractor("Makefile"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+
+from tools import load_text
+
+
+async def read_pieces(content: bytes, piece_size: int, file_path: str = "notes.txt"):
+    """The pieces iter_text_from_workspace_file yields for a workspace file with that content."""
+    with mock.patch.object(load_text, "read_file_in_workspace", mock.AsyncMock(return_value=content)):
+        return [piece async for piece in load_text.iter_text_from_workspace_file(file_path, piece_size=piece_size)]
+
+
+class IterTextFromWorkspaceFileTest(unittest.IsolatedAsyncioTestCase):
+    async def test_pieces_split_multibyte_characters_safely(self):
+        text = "naïve café 日本語 🙂\n" * 50
+        pieces = await read_pieces(text.encode("utf-8"), piece_size=7)
+
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual("".join(pieces), text)
+
+    async def test_invalid_utf8_falls_back_before_any_piece(self):
+        # valid for many pieces, then invalid near the end: nothing may be yielded before the fallback
+        content = "valid text\n".encode("utf-8") * 100 + b"\xff\xfe"
+        with mock.patch.object(
+            load_text, "_load_with_knowledge_tool", mock.AsyncMock(return_value="extracted")
+        ) as knowledge_tool:
+            pieces = await read_pieces(content, piece_size=16)
+
+        self.assertEqual(pieces, ["extracted"])
+        knowledge_tool.assert_awaited_once()
+
+    def test_is_utf8(self):
+        self.assertTrue(load_text._is_utf8(b"plain ascii", 4))
+        self.assertTrue(load_text._is_utf8("日本語".encode("utf-8"), 2))
+        self.assertFalse(load_text._is_utf8("日本語".encode("utf-8")[:-1], 2))
+
+
+class LocalExtractionTest(unittest.IsolatedAsyncioTestCase):
+    async def test_structured_text_is_extracted_locally(self):
+        with mock.patch.object(load_text, "_load_with_knowledge_tool", mock.AsyncMock()) as knowledge_tool:
+            pieces = await read_pieces(b"<p>Hello <b>world</b></p><script>x()</script>", 16, "page.html")
+
+        self.assertEqual("".join(pieces), "Hello world\n")
+        knowledge_tool.assert_not_awaited()
+
+    async def test_binary_documents_use_the_knowledge_tool(self):
+        with mock.patch.object(
+            load_text, "_load_with_knowledge_tool", mock.AsyncMock(return_value="pdf text")
+        ) as knowledge_tool:
+            pieces = await read_pieces(b"%PDF-1.7\n...", 16, "report.txt")
+
+        self.assertEqual(pieces, ["pdf text"])
+        knowledge_tool.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
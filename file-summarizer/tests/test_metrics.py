@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import asyncio
+import contextlib
+import io
+import json
+import time
+import unittest
+from typing import List
+
+from tools.metrics import (
+    JsonStderrExporter,
+    Span,
+    SpanExporter,
+    add_to_trace,
+    current_span,
+    record_span,
+    set_span_exporter,
+    span,
+)
+
+
+class _RecordingExporter(SpanExporter):
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.shut_down = False
+
+    def export(self, spans: List[Span]) -> None:
+        self.spans.extend(spans)
+
+    def shutdown(self) -> None:
+        self.shut_down = True
+
+
+class SpanTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.exporter = _RecordingExporter()
+        set_span_exporter(self.exporter)
+        self.addCleanup(set_span_exporter, None)
+
+    async def test_spans_nest_across_tasks(self):
+        async def call():
+            with span("model_call"):
+                add_to_trace("prompt_tokens", 10)
+
+        with span("summarize", file="a.txt") as root:
+            await asyncio.gather(call(), call())
+            self.assertIs(current_span(), root)
+        self.assertIsNone(current_span())
+
+        calls = [s for s in self.exporter.spans if s.name == "model_call"]
+        self.assertEqual(len(calls), 2)
+        for call_span in calls:
+            self.assertIs(call_span.parent, root)
+            self.assertEqual(call_span.trace_id, root.trace_id)
+        # children end, and are exported, before their parent
+        self.assertIs(self.exporter.spans[-1], root)
+        self.assertEqual(root.attributes, {"file": "a.txt", "prompt_tokens": 20})
+
+    def test_errors_are_recorded_and_raised(self):
+        with self.assertRaises(ValueError):
+            with span("workspace_read"):
+                raise ValueError("missing")
+        self.assertEqual(self.exporter.spans[0].attributes["error"], "ValueError: missing")
+
+    def test_spans_end_once(self):
+        with span("phase") as phase:
+            pass
+        phase.end()
+        self.assertEqual(self.exporter.spans, [phase])
+
+    def test_recorded_span_keeps_its_times(self):
+        with span("summarize") as root:
+            start = time.time() - 2
+            recorded = record_span("reduction_level", start, start + 1.5, level=1)
+
+        self.assertIs(recorded.parent, root)
+        self.assertEqual(recorded.start_time, start)
+        self.assertAlmostEqual(recorded.duration, 1.5, places=2)
+        self.assertEqual(recorded.to_dict()["parent_id"], root.span_id)
+
+    def test_add_to_trace_outside_a_span_does_nothing(self):
+        add_to_trace("retries", 1)
+        self.assertEqual(self.exporter.spans, [])
+
+
+class SpanExporterTest(unittest.TestCase):
+    def tearDown(self):
+        set_span_exporter(None)
+
+    def test_exporters_must_implement_export(self):
+        class Incomplete(SpanExporter):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_replaced_exporter_is_shut_down(self):
+        first = _RecordingExporter()
+        set_span_exporter(first)
+        set_span_exporter(_RecordingExporter())
+        self.assertTrue(first.shut_down)
+
+    def test_json_lines_on_stderr(self):
+        set_span_exporter(JsonStderrExporter())
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            with span("workspace_read", bytes=12):
+                pass
+
+        exported = json.loads(stderr.getvalue())["file_summarizer_span"]
+        self.assertEqual(exported["name"], "workspace_read")
+        self.assertEqual(exported["attributes"], {"bytes": 12})
+        self.assertIsNone(exported["parent_id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
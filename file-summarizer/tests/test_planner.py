@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+
+from tools import planner
+from tools.planner import (
+    MAX_REDUCTION_DEPTH,
+    OVERHEAD_TOKENS,
+    WORKING_CONTEXT_TOKENS,
+    WORKING_OUTPUT_TOKENS,
+    get_model_limits,
+    get_working_limits,
+    plan_summarization,
+)
+
+
+class ModelLimitsTest(unittest.TestCase):
+    def test_exact_names_before_prefixes(self):
+        self.assertEqual(get_model_limits("gpt-4"), (8192, 4096))
+        self.assertEqual(get_model_limits("gpt-4-turbo-2024-04-09"), (128000, 4096))
+        self.assertEqual(get_model_limits("gpt-4o-mini"), (128000, 16384))
+        self.assertEqual(get_model_limits("openai/GPT-4.1-mini"), (1047576, 32768))
+        self.assertEqual(get_model_limits("unknown-model"), planner.DEFAULT_MODEL_LIMITS)
+
+    def test_working_limits_bound_large_models(self):
+        self.assertEqual(get_working_limits("gpt-4.1"), (WORKING_CONTEXT_TOKENS, WORKING_OUTPUT_TOKENS))
+        self.assertEqual(get_working_limits("gpt-5"), (WORKING_CONTEXT_TOKENS, WORKING_OUTPUT_TOKENS))
+        self.assertEqual(get_working_limits("gpt-4"), (8192, 4096))
+
+    def test_working_limits_can_be_raised(self):
+        with mock.patch.object(planner, "WORKING_CONTEXT_TOKENS", 400000), mock.patch.object(
+            planner, "WORKING_OUTPUT_TOKENS", 32768
+        ):
+            self.assertEqual(get_working_limits("gpt-4.1"), (400000, 32768))
+            self.assertEqual(get_working_limits("gpt-4o"), (128000, 16384))
+
+
+class PlanSummarizationTest(unittest.TestCase):
+    def plan(self, model: str, document_tokens: int, **kwargs):
+        options = dict(max_concurrency=32, token_budget=None, latency_budget=None)
+        options.update(kwargs)
+        return plan_summarization(model, document_tokens, **options)
+
+    def test_prompts_stay_within_the_working_context(self):
+        for model in ("gpt-4.1", "gpt-5", "gemini-2.5-pro"):
+            plan = self.plan(model, 2_000_000)
+            self.assertLessEqual(
+                plan.chunk_tokens + plan.output_tokens + OVERHEAD_TOKENS, WORKING_CONTEXT_TOKENS, model
+            )
+            self.assertEqual(plan.output_tokens, WORKING_OUTPUT_TOKENS, model)
+
+    def test_small_models_get_a_plan_that_converges(self):
+        plan = self.plan("gpt-4", 500_000)
+        self.assertLessEqual(plan.chunk_tokens + plan.output_tokens + OVERHEAD_TOKENS, 8192)
+        self.assertGreaterEqual(plan.chunk_tokens, 2 * plan.output_tokens)
+        self.assertEqual(plan.level_calls[-1], 1)
+        self.assertLessEqual(len(plan.level_calls), MAX_REDUCTION_DEPTH + 1)
+        self.assertEqual(plan.level_calls, sorted(plan.level_calls, reverse=True))
+
+    def test_small_document_takes_one_call(self):
+        plan = self.plan("gpt-4o", 50_000)
+        self.assertEqual(plan.level_calls, [1])
+
+    def test_cheapest_and_fastest_chunk_size(self):
+        plan = self.plan("gpt-4o", 500_000)
+        for chunk_tokens in (plan.chunk_tokens // 2, plan.chunk_tokens // 4):
+            smaller = planner.SummaryPlan(500_000, chunk_tokens, plan.output_tokens, plan.context_tokens, 32)
+            self.assertGreater(smaller.tokens, plan.tokens)
+
+    def test_budgets_lower_the_output_limit(self):
+        unbounded = self.plan("gpt-4o", 500_000)
+        plan = self.plan("gpt-4o", 500_000, token_budget=unbounded.tokens - 10_000)
+        self.assertLess(plan.output_tokens, unbounded.output_tokens)
+        self.assertLessEqual(plan.tokens, unbounded.tokens - 10_000)
+
+        plan = self.plan("gpt-4o", 500_000, latency_budget=unbounded.seconds / 2)
+        self.assertLessEqual(plan.seconds, unbounded.seconds / 2)
+
+    def test_closest_plan_when_no_plan_fits(self):
+        with self.assertLogs("tools.planner", "WARNING"):
+            plan = self.plan("gpt-4o", 500_000, token_budget=1000)
+        self.assertEqual(plan.output_tokens, min(planner.OUTPUT_TOKEN_CHOICES))
+
+    def test_previous_plan_is_kept(self):
+        plan = self.plan("gpt-4o", 500_000)
+        previous = (plan.chunk_tokens // 2, plan.output_tokens)
+        kept = self.plan("gpt-4o", 520_000, previous=previous)
+        self.assertEqual((kept.chunk_tokens, kept.output_tokens), previous)
+
+        # unless it is no longer possible
+        kept = self.plan("gpt-4o", 520_000, previous=(1_000_000, 32768))
+        self.assertEqual((kept.chunk_tokens, kept.output_tokens), (plan.chunk_tokens, plan.output_tokens))
+
+    def test_context_too_small(self):
+        with mock.patch.object(planner, "WORKING_CONTEXT_TOKENS", 5000):
+            with self.assertRaises(ValueError):
+                self.plan("gpt-4o", 500_000)
+
+
+if __name__ == "__main__":
+    unittest.main()
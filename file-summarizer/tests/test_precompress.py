@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import random
+import unittest
+from unittest import mock
+
+from tools import precompress
+from tools.precompress import Precompressor
+
+LOG = "".join(
+    f"2024-01-01 12:00:{i:02d} INFO request {i} served in {i * 3}ms from host\n" for i in range(20)
+)
+TRACE = "Error: connection refused by the database server\n  at connect()\n  at main()\n\n"
+
+
+def compress(text: str, cuts=()) -> str:
+    """Pre-compress a text fed in pieces cut at the given offsets."""
+    precompressor = Precompressor()
+    output, start = "", 0
+    for cut in list(cuts) + [len(text)]:
+        output += precompressor.feed(text[start:cut])
+        start = cut
+    return output + precompressor.flush()
+
+
+class PrecompressorTest(unittest.TestCase):
+    def test_runs_of_similar_lines_keep_the_first_and_last(self):
+        lines = LOG.splitlines()
+        self.assertEqual(
+            compress("start\n" + LOG + "end\n"),
+            f"start\n{lines[0]}\n[18 similar lines omitted]\n{lines[-1]}\nend\n",
+        )
+
+    def test_repeated_paragraphs_are_counted(self):
+        self.assertEqual(
+            compress("first\n\n" + TRACE + "other\n\n" + TRACE + "last\n"),
+            "first\n\n" + TRACE + "other\n\n[3 repeated lines omitted]\nlast\n",
+        )
+
+    def test_noise_is_stripped(self):
+        self.assertEqual(compress("\x1b[31mred\x1b[0m text\nprogress 10%\rprogress 100%\n"), "red text\nprogress 100%\n")
+        self.assertEqual(compress("data: " + "aB3" * 100 + "\n"), "data: [300 characters of encoded data omitted]\n")
+
+    def test_distinct_text_is_unchanged(self):
+        text = "line one here\nline two\n\nline three\n  indented\nno newline at the end"
+        self.assertEqual(compress(text), text + "\n")
+
+    def test_output_does_not_depend_on_the_pieces(self):
+        text = "header\n" + LOG + TRACE + LOG + TRACE + "footer"
+        rng = random.Random(0)
+        for _ in range(20):
+            cuts = sorted(rng.sample(range(len(text)), 6))
+            self.assertEqual(compress(text, cuts), compress(text))
+
+    def test_statistics(self):
+        precompressor = Precompressor()
+        output = precompressor.feed(LOG) + precompressor.flush()
+        self.assertEqual(precompressor.chars_in, len(LOG))
+        self.assertEqual(precompressor.chars_out, len(output))
+
+
+class PrecompressStreamTest(unittest.IsolatedAsyncioTestCase):
+    async def test_stream(self):
+        async def pieces():
+            for i in range(0, len(LOG), 50):
+                yield LOG[i : i + 50]
+
+        output = "".join([piece async for piece in precompress.precompress(pieces())])
+        self.assertEqual(output, compress(LOG))
+
+
+class ShouldPrecompressTest(unittest.TestCase):
+    def test_only_log_output_when_enabled(self):
+        with mock.patch.object(precompress, "PRECOMPRESS_ENABLED", True):
+            self.assertTrue(precompress.should_precompress("logs/app.log"))
+            self.assertTrue(precompress.should_precompress("logs/app.log.1"))
+            self.assertTrue(precompress.should_precompress("build/STDERR.ERR"))
+            self.assertFalse(precompress.should_precompress("data/table.csv"))
+            self.assertFalse(precompress.should_precompress("logs.d/notes.md"))
+        with mock.patch.object(precompress, "PRECOMPRESS_ENABLED", False):
+            self.assertFalse(precompress.should_precompress("logs/app.log"))
+
+
+if __name__ == "__main__":
+    unittest.main()
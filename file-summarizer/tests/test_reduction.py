@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import asyncio
+import re
+import unittest
+
+from fake_openai import FakeModel, make_document, make_summarizer, marker_range
+from tools.reduction import SUMMARY_BUDGET_SLACK
+from tools.tokens import encode
+
+TIMEOUT_SECONDS = 60
+
+
+async def summarize(summarizer, document: str) -> str:
+    async def pieces():
+        yield document, encode(document)
+
+    return await asyncio.wait_for(summarizer.summarize_stream_async(pieces()), TIMEOUT_SECONDS)
+
+
+class OrderedTreeReducerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_keeps_document_order(self):
+        model = FakeModel()
+        summarizer = make_summarizer(model)
+        document = make_document(200)
+        summary = await summarize(summarizer, document)
+
+        self.assertTrue(summary.startswith(marker_range(200)), summary[:40])
+        self.assertEqual(model.order_errors, [])
+        self.assertEqual(model.calls_of("final"), 1)
+        # merges above the chunk summaries
+        chunks = len(encode(document)) // summarizer.max_chunk_size
+        self.assertGreater(model.calls_of("chunk"), chunks + 1)
+
+    async def test_converges_when_summaries_ignore_their_budget(self):
+        model = FakeModel(ignore_budget=True)
+        summarizer = make_summarizer(model)
+        document = make_document(200)
+        summary = await summarize(summarizer, document)
+
+        self.assertTrue(summary.startswith(marker_range(200)), summary[:40])
+        self.assertEqual(model.order_errors, [])
+        self.assertEqual(model.calls_of("final"), 1)
+        # every merge combines at least two summaries, so there are fewer merges than chunks;
+        # chunks are at least half full, as they are cut at the last paragraph that fits
+        max_chunks = 2 * len(encode(document)) // summarizer.max_chunk_size + 1
+        self.assertLessEqual(len(model.calls), 2 * max_chunks + 1)
+
+    async def test_truncation_is_logged_with_its_limit(self):
+        model = FakeModel(ignore_budget=True)
+        summarizer = make_summarizer(model)
+        with self.assertLogs("tools.reduction", "WARNING") as logs:
+            await summarize(summarizer, make_document(40))
+
+        # the limit is the budget with its slack, and at most half a chunk
+        limit = int(re.search(r"to (\d+) tokens \(its output budget is 100 tokens\)", logs.output[0]).group(1))
+        self.assertEqual(limit, min(int(100 * SUMMARY_BUDGET_SLACK), summarizer.max_chunk_size // 2))
+
+    async def test_summaries_close_to_the_chunk_size(self):
+        # outputs as large as a chunk: every merge still combines at least two summaries
+        model = FakeModel()
+        summary = await summarize(
+            make_summarizer(model, max_output_tokens=300), make_document(120)
+        )
+
+        self.assertTrue(summary.startswith(marker_range(120)), summary[:40])
+        self.assertEqual(model.order_errors, [])
+
+    async def test_small_document_is_summarized_in_one_call(self):
+        model = FakeModel()
+        summary = await summarize(make_summarizer(model), make_document(1))
+
+        self.assertTrue(summary.startswith(marker_range(1)), summary[:40])
+        self.assertEqual(model.calls, [("final", 100)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import unittest
+from array import array
+
+from fake_openai import make_document
+from tools.chunking import TextChunkingStrategy
+from tools.retrieval import BM25Index, query_terms, select_relevant_passages
+from tools.tokens import decode, encode
+
+
+class QueryTermsTest(unittest.TestCase):
+    def test_terms(self):
+        self.assertEqual(query_terms("What are the errors in the Billing service?"), ["error", "bill", "service"])
+        self.assertEqual(query_terms("is it on"), [])
+        # short stems keep the whole word
+        self.assertEqual(query_terms("uses bus buses"), ["uses", "bus"])
+
+
+class BM25IndexTest(unittest.TestCase):
+    def scores(self, query: str, passages):
+        index = BM25Index(query)
+        for passage in passages:
+            index.add(passage, len(passage.split()))
+        return index.scores()
+
+    def test_more_matches_rank_higher(self):
+        scores = self.scores(
+            "database errors",
+            ["the database failed with errors and more errors", "a database was used", "nothing relevant here"],
+        )
+        self.assertGreater(scores[0], scores[1])
+        self.assertGreater(scores[1], scores[2])
+        self.assertEqual(scores[2], 0)
+
+    def test_rare_terms_weigh_more(self):
+        scores = self.scores("common rare", ["common words", "rare words", "common text", "common lines"])
+        self.assertGreater(scores[1], scores[0])
+
+    def test_matches_are_prefixes_and_case_insensitive(self):
+        scores = self.scores("error", ["ERRORS everywhere", "terror is not an error prefix match", "none"])
+        self.assertGreater(scores[0], 0)
+        self.assertGreater(scores[1], 0)
+        self.assertEqual(scores[2], 0)
+
+    def test_no_terms_score_nothing(self):
+        self.assertEqual(self.scores("the of", ["the text of it"]), [0])
+        self.assertEqual(BM25Index("anything").scores(), [])
+
+
+class SelectRelevantPassagesTest(unittest.IsolatedAsyncioTestCase):
+    async def select(self, document: str, query: str, token_budget: int, pieces: int = 7):
+        tokens = encode(document)
+        step = len(tokens) // pieces + 1
+
+        async def token_pieces():
+            for start in range(0, len(tokens), step):
+                yield "", tokens[start : start + step]
+
+        passages, selected = await select_relevant_passages(
+            token_pieces(), query, TextChunkingStrategy(), token_budget, passage_tokens=200
+        )
+        return tokens, passages, selected
+
+    async def test_selects_matching_passages_in_document_order(self):
+        document = make_document(60)
+        middle = document.index("P00030 ")
+        document = document[:middle] + "P00030 the quarterly invoice totals were wrong. " + document[middle + 7 :]
+        tokens, passages, selected = await self.select(document, "invoice totals", token_budget=1000)
+
+        self.assertEqual(array("I", [t for passage in passages for t in passage]), tokens)
+        self.assertTrue(all(len(passage) <= 200 for passage in passages))
+        self.assertEqual(len(selected), 1)
+        self.assertIn("invoice totals", decode(passages[selected[0]]))
+
+    async def test_budget_is_respected(self):
+        tokens, passages, selected = await self.select(make_document(60), "alpha omega", token_budget=500)
+
+        self.assertGreater(len(selected), 0)
+        self.assertEqual(selected, sorted(selected))
+        self.assertLessEqual(sum(len(passages[i]) for i in selected), 500)
+
+    async def test_no_match(self):
+        _, passages, selected = await self.select(make_document(20), "unrelated query", token_budget=1000)
+
+        self.assertGreater(len(passages), 1)
+        self.assertIsNone(selected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+from typing import List
+from unittest import mock
+
+import httpx
+import openai
+
+from tools import scheduler as scheduler_module
+from tools.scheduler import (
+    BACKOFF_BASE_SECONDS,
+    RequestScheduler,
+    _Budget,
+    _retry_after_seconds,
+    parse_reset_duration,
+)
+
+
+class _RawResponse:
+    def __init__(self, headers=None):
+        self.headers = httpx.Headers(headers or {})
+
+    def parse(self):
+        return "parsed"
+
+
+def rate_limit_error(body=None, headers=None) -> openai.RateLimitError:
+    """A 429 as the OpenAI client raises it, with the error object of the response body."""
+    body = body or {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}
+    response = httpx.Response(
+        429, headers=headers or {}, request=httpx.Request("POST", "http://fake-model.test/v1/chat/completions")
+    )
+    return openai.RateLimitError(f"Error code: 429 - {{'error': {body}}}", response=response, body=body)
+
+
+def failing_request(errors: List[Exception], headers=None):
+    """A request that raises the given errors in turn, then succeeds; its calls are counted in request.calls."""
+    errors = list(errors)
+
+    async def request():
+        request.calls += 1
+        if errors:
+            raise errors.pop(0)
+        return _RawResponse(headers)
+
+    request.calls = 0
+    return request
+
+
+class ParseDurationTest(unittest.TestCase):
+    def test_reset_durations(self):
+        self.assertEqual(parse_reset_duration("20ms"), 0.02)
+        self.assertEqual(parse_reset_duration("1s"), 1.0)
+        self.assertEqual(parse_reset_duration("6m0s"), 360.0)
+        self.assertEqual(parse_reset_duration("1h2m3.5s"), 3723.5)
+        self.assertEqual(parse_reset_duration("1.5"), 1.5)
+        self.assertIsNone(parse_reset_duration(""))
+        self.assertIsNone(parse_reset_duration(None))
+        self.assertIsNone(parse_reset_duration("soon"))
+
+    def test_retry_after(self):
+        self.assertEqual(_retry_after_seconds({"retry-after-ms": "250", "retry-after": "3"}), 0.25)
+        self.assertEqual(_retry_after_seconds({"retry-after": "3"}), 3.0)
+        self.assertEqual(_retry_after_seconds({"retry-after-ms": "bad", "retry-after": "2s"}), 2.0)
+        self.assertIsNone(_retry_after_seconds({}))
+        self.assertIsNone(_retry_after_seconds(None))
+
+
+class BudgetTest(unittest.TestCase):
+    def test_configured_limit_waits_for_the_window(self):
+        budget = _Budget(per_minute=100)
+        self.assertEqual(budget.delay(60), 0.0)
+        budget.spend(60)
+        self.assertEqual(budget.delay(40), 0.0)
+        self.assertGreater(budget.delay(41), 59)
+
+    def test_a_request_larger_than_the_limit_is_not_held_forever(self):
+        self.assertEqual(_Budget(per_minute=100).delay(500), 0.0)
+
+    def test_headers_wait_for_the_reset(self):
+        budget = _Budget()
+        budget.update("1000", "10", "2s")
+        self.assertEqual(budget.per_minute, 1000)
+        self.assertEqual(budget.delay(10), 0.0)
+        self.assertAlmostEqual(budget.delay(11), 2.0, delta=0.5)
+
+    def test_expired_reset_no_longer_waits(self):
+        budget = _Budget()
+        budget.update(None, "0", "1ms")
+        time.sleep(0.01)
+        self.assertEqual(budget.delay(1), 0.0)
+
+    def test_unparsable_headers_are_ignored(self):
+        budget = _Budget()
+        budget.update("many", "some", "later")
+        self.assertIsNone(budget.per_minute)
+        self.assertIsNone(budget.remaining)
+        self.assertEqual(budget.delay(1), 0.0)
+
+
+class RequestSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # the scheduler's sleeps return at once and advance its clock instead
+        self.sleeps: List[float] = []
+        self.clock = 1000.0
+
+        async def sleep(delay):
+            self.sleeps.append(delay)
+            self.clock += delay
+
+        for patcher in (
+            mock.patch("tools.scheduler.asyncio.sleep", sleep),
+            mock.patch.object(scheduler_module, "time", SimpleNamespace(monotonic=lambda: self.clock)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_backoff_is_jittered_and_grows(self):
+        scheduler = RequestScheduler(max_concurrency=8, max_retries=5, verbose=False)
+        request = failing_request([rate_limit_error() for _ in range(4)])
+
+        self.assertEqual(await scheduler.run(request), "parsed")
+        self.assertEqual(request.calls, 5)
+        self.assertEqual(len(self.sleeps), 4)
+        for attempt, delay in enumerate(self.sleeps, start=1):
+            self.assertGreaterEqual(delay, 0.0)
+            self.assertLessEqual(delay, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+
+    async def test_retry_after_header_is_honoured(self):
+        scheduler = RequestScheduler(max_concurrency=8, verbose=False)
+        request = failing_request([rate_limit_error(headers={"retry-after-ms": "1500"})])
+
+        await scheduler.run(request)
+        self.assertEqual(self.sleeps, [1.5])
+
+    async def test_gives_up_after_max_retries(self):
+        scheduler = RequestScheduler(max_concurrency=8, max_retries=2, verbose=False)
+        request = failing_request([rate_limit_error() for _ in range(5)])
+
+        with self.assertRaises(openai.RateLimitError):
+            await scheduler.run(request)
+        self.assertEqual(request.calls, 3)
+
+    async def test_exhausted_quota_is_raised_at_once(self):
+        scheduler = RequestScheduler(max_concurrency=8, verbose=False)
+        error = rate_limit_error(
+            {"message": "You exceeded your current quota.", "type": "insufficient_quota", "code": "insufficient_quota"}
+        )
+        request = failing_request([error])
+
+        with self.assertRaises(openai.RateLimitError):
+            await scheduler.run(request)
+        self.assertEqual(request.calls, 1)
+        self.assertEqual(scheduler.concurrency_limit, 8)
+
+    async def test_request_too_large_is_raised_at_once(self):
+        scheduler = RequestScheduler(max_concurrency=8, verbose=False)
+        error = rate_limit_error(
+            {
+                "message": "Request too large for gpt-4o on tokens per min (TPM): Limit 30000, Requested 50000.",
+                "type": "tokens",
+                "code": "rate_limit_exceeded",
+            }
+        )
+        request = failing_request([error])
+
+        with self.assertRaises(openai.RateLimitError):
+            await scheduler.run(request)
+        self.assertEqual(request.calls, 1)
+
+    async def test_client_errors_are_not_retried(self):
+        scheduler = RequestScheduler(max_concurrency=8, verbose=False)
+        response = httpx.Response(400, request=httpx.Request("POST", "http://fake-model.test/v1"))
+        request = failing_request([openai.BadRequestError("Error code: 400", response=response, body=None)])
+
+        with self.assertRaises(openai.BadRequestError):
+            await scheduler.run(request)
+        self.assertEqual(request.calls, 1)
+
+    async def test_concurrency_is_halved_on_429_and_grows_back(self):
+        scheduler = RequestScheduler(max_concurrency=8, verbose=False)
+        await scheduler.run(failing_request([rate_limit_error(), rate_limit_error()]))
+        # halved twice, then one success adds 1/limit
+        self.assertAlmostEqual(scheduler.concurrency_limit, 2.5)
+
+        for _ in range(50):
+            await scheduler.run(failing_request([]))
+        self.assertEqual(scheduler.concurrency_limit, 8)
+
+    async def test_in_flight_requests_stay_under_the_limit(self):
+        scheduler = RequestScheduler(max_concurrency=3, verbose=False)
+        in_flight, peak = 0, 0
+        release = asyncio.Event()
+
+        async def request():
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await release.wait()
+            in_flight -= 1
+            return _RawResponse()
+
+        tasks = [asyncio.create_task(scheduler.run(request)) for _ in range(10)]
+        await asyncio.wait(tasks, timeout=0.1)
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(peak, 3)
+
+    async def test_waits_for_the_token_budget_from_headers(self):
+        scheduler = RequestScheduler(max_concurrency=8, verbose=False)
+        headers = {
+            "x-ratelimit-limit-tokens": "10000",
+            "x-ratelimit-remaining-tokens": "100",
+            "x-ratelimit-reset-tokens": "6s",
+        }
+        await scheduler.run(failing_request([], headers), estimated_tokens=50)
+        self.assertEqual(self.sleeps, [])
+
+        # 50 tokens are left until the reset
+        await scheduler.run(failing_request([]), estimated_tokens=500)
+        self.assertEqual(self.sleeps, [6.0])
+
+    async def test_configured_request_budget(self):
+        scheduler = RequestScheduler(max_concurrency=8, requests_per_minute=2, verbose=False)
+        await scheduler.run(failing_request([]))
+        self.clock += 10
+        await scheduler.run(failing_request([]))
+        self.assertEqual(self.sleeps, [])
+
+        # the third request of the minute waits for the first one to leave the window
+        await scheduler.run(failing_request([]))
+        self.assertEqual(self.sleeps, [50.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
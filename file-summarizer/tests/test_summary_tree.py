@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import unittest
+from array import array
+
+from fake_openai import FakeModel, make_document, make_summarizer, marker_range
+from tools.summary_tree import SummaryTree
+from tools.tokens import encode
+
+TIMEOUT_SECONDS = 60
+
+
+class _MemoryCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries[key] = value
+
+
+async def summarize_with_tree(document: str, previous: SummaryTree = None):
+    """Summarize a document with the summary tree of a previous run; returns (summary, new tree, model)."""
+    tree = SummaryTree(data=json.loads(previous.to_json()) if previous is not None else None)
+    model = FakeModel()
+    summarizer = make_summarizer(model, cache=tree, summary_tree=tree)
+
+    async def pieces():
+        yield document, encode(document)
+
+    summary = await asyncio.wait_for(summarizer.summarize_stream_async(pieces()), TIMEOUT_SECONDS)
+    return summary, tree, model
+
+
+class IncrementalSummarizationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.document = make_document(200)
+        _, self.tree, self.model = await summarize_with_tree(self.document)
+        self.full_calls = len(self.model.calls)
+
+    async def test_unchanged_file_makes_no_calls(self):
+        summary, _, model = await summarize_with_tree(self.document, self.tree)
+
+        self.assertTrue(summary.startswith(marker_range(200)), summary[:40])
+        self.assertEqual(model.calls, [])
+
+    async def test_appended_text_only_summarizes_the_end(self):
+        document = self.document + make_document(210, seed=1)[len(self.document) :]
+        summary, _, model = await summarize_with_tree(document, self.tree)
+
+        self.assertTrue(summary.startswith(marker_range(210)), summary[:40])
+        self.assertEqual(model.order_errors, [])
+        # the new chunks, the merges along the right edge of the tree, and the final reduction
+        self.assertLess(len(model.calls), self.full_calls // 3)
+
+    async def test_edit_only_summarizes_the_changed_chunk_and_its_merges(self):
+        # a longer paragraph in the middle shifts every cut after it
+        middle = self.document.index("P00100 ")
+        document = self.document[:middle] + "P00100 inserted words. " + self.document[middle + len("P00100 ") :]
+        summary, _, model = await summarize_with_tree(document, self.tree)
+
+        self.assertTrue(summary.startswith(marker_range(200)), summary[:40])
+        self.assertEqual(model.order_errors, [])
+        self.assertLess(len(model.calls), self.full_calls // 3)
+
+    async def test_tree_is_stable_across_runs(self):
+        _, tree, _ = await summarize_with_tree(self.document, self.tree)
+        _, _, model = await summarize_with_tree(self.document, tree)
+
+        self.assertEqual(model.calls, [])
+
+
+class FindChunkEndTest(unittest.TestCase):
+    def setUp(self):
+        self.tokens = array("I", range(1000, 2000))
+        previous = SummaryTree()
+        start = 0
+        for end in (300, 600, 900, 1000):
+            previous.add_chunk(self.tokens[start:], end - start)
+            start = end
+        self.data = json.loads(previous.to_json())
+
+    def test_unchanged_cuts_are_reused_in_order(self):
+        tree = SummaryTree(data=self.data)
+        self.assertEqual(tree.find_chunk_end(self.tokens, 400), 300)
+        self.assertEqual(tree.find_chunk_end(self.tokens[300:], 400), 300)
+        self.assertEqual(tree.find_chunk_end(self.tokens[600:], 400), 300)
+
+    def test_cut_is_found_after_an_insertion(self):
+        tokens = self.tokens[:100] + array("I", [7] * 25) + self.tokens[100:]
+        tree = SummaryTree(data=self.data)
+        self.assertEqual(tree.find_chunk_end(tokens, 400), 325)
+        # the cuts after it follow at their previous offsets
+        self.assertEqual(tree.find_chunk_end(tokens[325:], 400), 300)
+
+    def test_cut_is_found_after_a_deletion(self):
+        tokens = self.tokens[:100] + self.tokens[150:]
+        tree = SummaryTree(data=self.data)
+        self.assertEqual(tree.find_chunk_end(tokens, 400), 250)
+
+    def test_skipped_cut_is_not_used_again(self):
+        tree = SummaryTree(data=self.data)
+        # the first cut was deleted along with its surroundings; the second one is found instead
+        tokens = self.tokens[:250] + self.tokens[350:]
+        self.assertEqual(tree.find_chunk_end(tokens, 600), 500)
+        self.assertEqual(tree.find_chunk_end(tokens[500:], 400), 300)
+
+    def test_no_cut_outside_the_budget(self):
+        tree = SummaryTree(data=self.data)
+        self.assertIsNone(tree.find_chunk_end(self.tokens, 200))
+
+    def test_unknown_text_has_no_cut(self):
+        tree = SummaryTree(data=self.data)
+        self.assertIsNone(tree.find_chunk_end(array("I", range(5000, 5400)), 400))
+
+
+class SummaryTreeCacheTest(unittest.TestCase):
+    def test_summaries_fall_back_to_the_cache_and_are_kept(self):
+        cache = _MemoryCache()
+        cache.set("old", "cached summary")
+        tree = SummaryTree(cache, {"summaries": {"kept": "tree summary"}})
+
+        self.assertEqual(tree.get("kept"), "tree summary")
+        self.assertEqual(tree.get("old"), "cached summary")
+        self.assertIsNone(tree.get("missing"))
+        tree.set("new", "new summary")
+
+        self.assertEqual(cache.get("new"), "new summary")
+        self.assertEqual(tree.reused, 1)
+        self.assertEqual(
+            json.loads(tree.to_json())["summaries"],
+            {"kept": "tree summary", "old": "cached summary", "new": "new summary"},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
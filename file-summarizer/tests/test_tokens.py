@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+from tools.tokens import (
+    MIN_ENCODE_PART_CHARS,
+    TokenCountBounds,
+    encode,
+    find_safe_split,
+    get_encoder,
+    iter_encoded_pieces,
+    split_for_encoding,
+)
+
+# text that is hard to split or count: punctuation runs that absorb newlines and "/", CRLF, indented
+# and blank lines, numbers, non-ASCII letters, emoji and special-token markers
+SAMPLES = [
+    "Hello world.\nSecond line\n\nThird paragraph.\n",
+    "path:\n/usr/local/bin\n//comment\n...\n/etc\n",
+    "def f(x):\n    return x  \n\n\n  # indented\n\tTabbed\n",
+    "Windows\r\nline\r\n\r\n/endings\r\n",
+    "numbers 1234567890\n12,345.67\n-42\n",
+    "naïve café\n日本語のテキスト\nemoji 🙂🙂\n Ünïcödé\n",
+    "<|endoftext|>\nmarkers <|im_start|>\n",
+    "}\n}\n);\n--\n**bold**\n- item\n",
+    "no newline at all, just words and words",
+    "\n\n\nleading newlines\n   \n   trailing spaces   \n",
+]
+
+
+def random_text(seed: int, length: int) -> str:
+    rng = random.Random(seed)
+    parts = [
+        "word", " ", "  ", "\n", "\n\n", "\r\n", "/", "//", ".", "...", "\t", "x1", "123", "é", "日本",
+        "🙂", "'s", "A", "(", ")", "-", "\n/", " \n", "\n ",
+    ]
+    return "".join(rng.choice(parts) for _ in range(length))
+
+
+def exact_count(text: str) -> int:
+    return len(get_encoder().encode(text, disallowed_special=()))
+
+
+class FindSafeSplitTest(unittest.TestCase):
+    def assertSplitsExactly(self, text: str):
+        end = len(text)
+        while True:
+            split = find_safe_split(text, end)
+            if split == -1:
+                return
+            self.assertEqual(
+                list(encode(text[:split])) + list(encode(text[split:])),
+                list(encode(text)),
+                f"split at {split} of {text!r}",
+            )
+            self.assertEqual(text[split - 1], "\n")
+            end = split - 1
+
+    def test_every_split_point_keeps_the_tokenization(self):
+        for text in SAMPLES:
+            self.assertSplitsExactly(text)
+        for seed in range(50):
+            self.assertSplitsExactly(random_text(seed, 300))
+
+    def test_no_split_point(self):
+        self.assertEqual(find_safe_split("no newline"), -1)
+        self.assertEqual(find_safe_split("ends with a newline\n"), -1)
+        self.assertEqual(find_safe_split("a\n/b\n c\n\td"), -1)
+
+
+class EncodeTest(unittest.TestCase):
+    def test_parallel_encoding_is_identical(self):
+        text = "".join(random_text(seed, 2000) for seed in range(400))
+        self.assertGreater(len(text), 2 * MIN_ENCODE_PART_CHARS)
+        self.assertGreater(len(split_for_encoding(text, 4)), 1)
+        self.assertEqual("".join(split_for_encoding(text, 4)), text)
+        self.assertEqual(list(encode(text)), get_encoder().encode(text, disallowed_special=()))
+
+    def test_special_tokens_are_plain_text(self):
+        self.assertEqual(list(encode("<|endoftext|>")), get_encoder().encode("<|endoftext|>", disallowed_special=()))
+
+
+class IterEncodedPiecesTest(unittest.IsolatedAsyncioTestCase):
+    async def test_pieces_add_up_to_the_whole_encoding(self):
+        rng = random.Random(0)
+        for text in SAMPLES + [random_text(seed, 2000) for seed in range(10)]:
+            cuts = sorted(rng.sample(range(len(text) + 1), min(5, len(text) + 1)))
+
+            async def pieces():
+                start = 0
+                for cut in cuts + [len(text)]:
+                    yield text[start:cut]
+                    start = cut
+
+            texts, tokens = [], []
+            async for piece_text, piece_tokens in iter_encoded_pieces(pieces()):
+                texts.append(piece_text)
+                tokens.extend(piece_tokens)
+            self.assertEqual("".join(texts), text)
+            self.assertEqual(tokens, get_encoder().encode(text, disallowed_special=()))
+
+
+class TokenCountBoundsTest(unittest.TestCase):
+    def assertBounds(self, text: str, cuts):
+        bounds = TokenCountBounds()
+        start = 0
+        for cut in list(cuts) + [len(text)]:
+            if cut > start:
+                bounds.add(text[start:cut])
+            start = cut
+        count = exact_count(text)
+        self.assertLessEqual(bounds.lower, count, repr(text))
+        self.assertGreaterEqual(bounds.upper, count, repr(text))
+
+    def test_bounds_hold_for_any_pieces(self):
+        rng = random.Random(1)
+        for text in SAMPLES + [random_text(seed, 500) for seed in range(50)]:
+            self.assertBounds(text, [])
+            for _ in range(5):
+                self.assertBounds(text, sorted(rng.sample(range(len(text) + 1), min(8, len(text) + 1))))
+
+    def test_bounds_hold_between_newline_and_slash(self):
+        self.assertBounds("a.\n/b\n/c", [3])
+        self.assertBounds("a.\r\n/b", [3, 4])
+
+    def test_stop_above(self):
+        bounds = TokenCountBounds()
+        bounds.add("word " * 100_000, stop_above=10)
+        self.assertGreater(bounds.lower, 10)
+        self.assertLess(bounds.upper, len("word " * 100_000))
+
+
+if __name__ == "__main__":
+    unittest.main()
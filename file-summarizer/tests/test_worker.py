@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from tools import worker
+from tools.helper import call_environment, setup_logger
+
+
+class EnvironmentTest(unittest.TestCase):
+    def test_environment_key(self):
+        environ = {"OPENAI_API_KEY": "key", "FILE_SUMMARIZER_STREAM": "false", "OBOT_RUN_ID": "1"}
+        key = worker.environment_key(environ)
+
+        self.assertEqual(worker.environment_key({**environ, "OBOT_RUN_ID": "2", "HOME": "/tmp"}), key)
+        self.assertEqual(worker.environment_key({**environ, "FILE_SUMMARIZER_WORKER": "spawn"}), key)
+        self.assertNotEqual(worker.environment_key({**environ, "OPENAI_API_KEY": "other"}), key)
+        self.assertNotEqual(worker.environment_key({**environ, "FILE_SUMMARIZER_STREAM": "true"}), key)
+
+    def test_call_variables(self):
+        environ = {
+            "OBOT_RUN_ID": "1",
+            "GPTSCRIPT_CREDENTIAL_TOKEN": "token",
+            "GPTSCRIPT_INPUT": "{}",
+            "GPTSCRIPT_WORKSPACE_ID": "workspace",
+            "OPENAI_API_KEY": "key",
+            "HOME": "/tmp",
+        }
+        self.assertEqual(worker.call_variables(environ), {"OBOT_RUN_ID": "1", "GPTSCRIPT_CREDENTIAL_TOKEN": "token"})
+
+
+class PrivateDirectoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, self.directory)
+
+    def test_private_directory(self):
+        os.chmod(self.directory, 0o700)
+        self.assertTrue(worker._make_private_directory(self.directory))
+
+    def test_own_directory_is_made_private(self):
+        os.chmod(self.directory, 0o755)
+        self.assertFalse(worker._is_private_directory(self.directory))
+        self.assertTrue(worker._make_private_directory(self.directory))
+        self.assertEqual(os.stat(self.directory).st_mode & 0o777, 0o700)
+
+    def test_foreign_directory_is_refused(self):
+        os.chmod(self.directory, 0o700)
+        with mock.patch.object(worker.os, "getuid", return_value=os.getuid() + 1):
+            with self.assertLogs("tools.worker", "WARNING"):
+                self.assertFalse(worker._make_private_directory(self.directory))
+        self.assertEqual(os.stat(self.directory).st_mode & 0o777, 0o700)
+
+    def test_symlink_is_refused(self):
+        link = self.directory + ".link"
+        os.symlink(self.directory, link)
+        self.addCleanup(os.unlink, link)
+        self.assertFalse(worker._is_private_directory(link))
+
+
+@unittest.skipUnless(worker.workers_supported(), "needs Unix sockets")
+class ServeTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # short enough for a socket path
+        self.directory = tempfile.mkdtemp(prefix="fs-", dir="/tmp")
+        self.path = os.path.join(self.directory, "workers", "test.sock")
+        for patch in (
+            mock.patch.object(worker, "worker_socket_path", return_value=self.path),
+            mock.patch.object(worker, "WORKER_MODE", "on"),
+            mock.patch.dict(os.environ, {"OBOT_RUN_ID": "run-1"}),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def asyncTearDown(self):
+        workers = os.path.dirname(self.path)
+        for name in os.listdir(workers):
+            os.unlink(os.path.join(workers, name))
+        os.rmdir(workers)
+        os.rmdir(self.directory)
+
+    async def run_served(self, handler):
+        """Serve one request with handler; returns what the caller got: whether it was served, output, log."""
+        stderr = io.StringIO()
+        # the worker's own messages are not the request's
+        with contextlib.redirect_stderr(stderr), self.assertLogs("tools.worker", "INFO"):
+            # set up while the worker's stderr is in place, as the tools' loggers are
+            self.logger = setup_logger("test_worker.request")
+            server = asyncio.create_task(worker.serve(handler, idle_seconds=0.2))
+            while not os.path.exists(self.path):
+                await asyncio.sleep(0.01)
+            output, log = [], []
+            try:
+                served = await worker.run_in_worker({"INPUT_FILE": "a.txt"}, output.append, log.append)
+            finally:
+                await server
+        self.logger.handlers.clear()
+        self.assertNotIn("working on", stderr.getvalue())
+        return served, "".join(output), "".join(log)
+
+    async def test_output_log_and_environment_go_to_the_caller(self):
+        async def handler(request):
+            print(f"summary of {request['INPUT_FILE']}")
+            self.logger.info("working on it")
+            print(call_environment().get("OBOT_RUN_ID"))
+
+        served, output, log = await self.run_served(handler)
+
+        self.assertTrue(served)
+        self.assertEqual(output, "summary of a.txt\nrun-1\n")
+        self.assertIn("working on it", log)
+
+    async def test_errors_are_raised_by_the_caller(self):
+        async def handler(request):
+            raise ValueError("no such file")
+
+        with self.assertRaisesRegex(Exception, "no such file"):
+            await self.run_served(handler)
+
+    async def test_foreign_socket_is_not_used(self):
+        os.makedirs(os.path.dirname(self.path), mode=0o755)
+        open(self.path, "w").close()
+
+        with self.assertLogs("tools.worker", "WARNING"):
+            self.assertFalse(await worker.run_in_worker({"INPUT_FILE": "a.txt"}, print))
+
+
+if __name__ == "__main__":
+    unittest.main()
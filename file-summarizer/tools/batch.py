@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import re
+from typing import List, Optional, Tuple
+from tools.helper import setup_logger, get_async_openai_client
+from tools.gptscript_workspace import (
+    file_exists_in_workspace,
+    list_file_paths_in_workspace,
+    write_file_in_workspace,
+)
+from tools.reader import read_file
+from tools.summary_tree import SUMMARY_TREE_SUFFIX, summary_tree_file_name
+
+logger = setup_logger(__name__)
+
+# how many files are read and summarized at the same time; their model calls share one scheduler
+MAX_FILES_IN_FLIGHT = int(os.getenv("FILE_SUMMARIZER_MAX_FILES_IN_FLIGHT", "8"))
+GLOB_CHARACTERS = "*?["
+SUMMARY_SUFFIX = "_summary"
+
+
+async def is_batch_input(input_file: str) -> bool:
+    """Whether INPUT_FILE names a directory (trailing "/") or a glob pattern rather than a single file.
+
+    A file whose name only looks like a glob, such as "Invoice [2024].pdf", is read as that file.
+    """
+    if input_file.endswith("/"):
+        return True
+    if not any(c in input_file for c in GLOB_CHARACTERS):
+        return False
+    return not await file_exists_in_workspace(input_file)
+
+
+def _class_end(pattern: str, start: int) -> int:
+    # like fnmatch, a "]" right after "[" or "[!" is a member, not the end of the class
+    i = start + 1
+    if pattern[i : i + 1] == "!":
+        i += 1
+    if pattern[i : i + 1] == "]":
+        i += 1
+    return pattern.find("]", i)
+
+
+def glob_to_regex(pattern: str) -> "re.Pattern":
+    """Compile a workspace glob pattern into a regular expression that matches whole file paths.
+
+    "*", "?" and "[...]" match within one path segment, so "notes/*.md" does not match "notes/a/b.md";
+    "**/" matches any number of directories, so "notes/**/*.md" does.
+
+    Args:
+        pattern (str): The glob pattern, relative to the workspace files directory.
+
+    Returns:
+        re.Pattern: The compiled expression.
+    """
+    parts = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            parts.append("(?:[^/]*/)*")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            parts.append("[^/]*")
+        elif c == "?":
+            parts.append("[^/]")
+        elif c == "[" and _class_end(pattern, i) != -1:
+            end = _class_end(pattern, i)
+            members = pattern[i + 1 : end]
+            negate = members[:1] == "!"
+            if negate:
+                members = members[1:]
+            members = "".join("\\" + m if m in "\\^[]" else m for m in members)
+            # a class never matches the path separator, negated or not
+            parts.append(f"[^/{members}]" if negate else f"(?!/)[{members}]")
+            i = end + 1
+            continue
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return re.compile("".join(parts) + r"\Z", re.DOTALL)
+
+
+def summary_file_name(input_file: str, output_directory: str = "") -> str:
+    """The default summary file for an input file: "<name>_summary<ext>" next to it, or under output_directory.
+
+    Args:
+        input_file (str): The workspace file that was summarized.
+        output_directory (str): The directory to write summaries to, keeping the input's relative path.
+
+    Returns:
+        str: The summary file path.
+    """
+    directory, file_name = os.path.split(input_file)
+    name, ext = os.path.splitext(file_name)
+    return os.path.join(output_directory, directory, f"{name}{SUMMARY_SUFFIX}{ext}")
+
+
+async def resolve_batch_input(pattern: str) -> List[str]:
+    """List the workspace files matched by a directory or glob pattern, skipping earlier summary outputs and their trees.
+
+    Args:
+        pattern (str): A directory such as "notes/" or a glob such as "reports/*.md" (see glob_to_regex).
+
+    Returns:
+        List[str]: The matching file paths, sorted.
+    """
+    first_glob = min(
+        (pattern.index(c) for c in GLOB_CHARACTERS if c in pattern), default=len(pattern)
+    )
+    # list only the directory that contains the first glob character
+    directory = os.path.dirname(pattern[:first_glob])
+    paths = await list_file_paths_in_workspace(directory)
+
+    if first_glob < len(pattern):
+        matcher = glob_to_regex(pattern)
+        paths = [p for p in paths if matcher.match(p)]
+    return [
+        p
+        for p in paths
+        if not os.path.splitext(os.path.basename(p))[0].endswith(SUMMARY_SUFFIX)
+        and not p.endswith(SUMMARY_TREE_SUFFIX)
+    ]
+
+
+async def summarize_files(
+    input_files: List[str], output: str = "", topic: str = "", client=None, scheduler=None
+) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """Read (and summarize if needed) many workspace files with one client and one concurrency-limited scheduler.
+
+    Each summary is written as soon as its file is done.
+
+    Args:
+        input_files (List[str]): The workspace files.
+        output (str): "NONE" to print the summaries, "" to write them next to the inputs, or a directory to write them to.
+        topic (str): Optional topic or question to focus every summary on.
+        client: The AsyncOpenAI client to summarize with; created on demand if not given.
+        scheduler: The RequestScheduler shared by the files' model calls; created if not given.
+
+    Returns:
+        List[Tuple[str, Optional[str], Optional[str]]]: (input file, summary file or None, error or None) per input.
+    """
+    from tools.scheduler import RequestScheduler
+    from tools.summarizer import MAX_CONCURRENCY
+
+    if client is None:
+        client = get_async_openai_client()
+    if scheduler is None:
+        scheduler = RequestScheduler(MAX_CONCURRENCY)
+    files_in_flight = asyncio.Semaphore(MAX_FILES_IN_FLIGHT)
+
+    async def summarize_one(input_file: str):
+        output_file = None
+        if output.upper() != "NONE":
+            output_file = summary_file_name(input_file, output)
+        async with files_in_flight:
+            try:
+                final_summary = await read_file(
+                    input_file,
+                    client=client,
+                    scheduler=scheduler,
+                    summary_tree_file=summary_tree_file_name(output_file) if output_file else None,
+                    topic=topic,
+                )
+            except Exception as e:
+                logger.error(f"Failed to summarize {input_file}: {e}")
+                return input_file, None, str(e)
+
+        if output_file is None:
+            print(f"File Summary of {input_file}:\n{final_summary}\n", flush=True)
+            return input_file, None, None
+
+        if not await write_file_in_workspace(output_file, final_summary):
+            return input_file, None, f"Failed to write {output_file}"
+        print(f"Summary of {input_file} written to workspace file: {output_file}", flush=True)
+        return input_file, output_file, None
+
+    return await asyncio.gather(*(summarize_one(f) for f in input_files))
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from tools.helper import CACHE_DIR, setup_logger
+
+logger = setup_logger(__name__)
+
+CACHE_MAX_BYTES = int(os.getenv("FILE_SUMMARIZER_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_ENABLED = os.getenv("FILE_SUMMARIZER_CACHE", "true").lower() not in ("0", "false", "off", "no")
+# eviction frees space down to this fraction of max_bytes, so that it runs once per many inserts rather than on each one
+EVICTION_TARGET_FRACTION = 0.9
+# least-recently-used entries read per eviction query
+EVICTION_BATCH_SIZE = 64
+
+
+def make_cache_key(*parts) -> str:
+    """Build a content-addressed cache key from the given parts.
+
+    Args:
+        *parts: Strings (or anything str()-able) that identify the cached value, e.g. model, prompt version and text.
+
+    Returns:
+        str: The hex sha256 digest of the length-prefixed parts.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        # length-prefix each part so ("ab", "c") and ("a", "bc") never collide
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class SQLiteLRUCache:
+    """
+    A persistent, size-bounded key/value cache stored in a local SQLite database.
+    Entries are evicted least-recently-used first once the total value size exceeds max_bytes.
+    The total is kept as a running count, so inserts below capacity cost no scan of the table; it is only
+    recounted after other connections (e.g. other processes of the tool) changed the database.
+    """
+
+    def __init__(self, path: str, max_bytes: int = CACHE_MAX_BYTES):
+        """
+        :param path: Path of the SQLite database file. Parent directories are created if needed.
+        :param max_bytes: Maximum total size of the cached values, in bytes.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+        )
+        self._data_version = self._stored_data_version()
+        self._total = self._stored_total()
+
+    def get(self, key: str) -> Optional[str]:
+        """The cached value, or None if there is none or the database cannot be read (e.g. it is locked)."""
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT value FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to read from cache {self.path}: {e}")
+                return None
+            if row is None:
+                return None
+            try:
+                self._conn.execute(
+                    "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)
+                )
+            except sqlite3.Error as e:
+                # e.g. a read-only database: the value is still good
+                logger.warning(f"Failed to update cache {self.path}: {e}")
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        """Cache a value; failures (locked database, full disk, read-only file) are logged and ignored."""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                data_version = self._stored_data_version()
+                if data_version != self._data_version:
+                    self._data_version = data_version
+                    self._total = self._stored_total()
+                replaced = self._conn.execute(
+                    "SELECT size FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, size, time.time()),
+                )
+                self._total += size - (replaced[0] if replaced is not None else 0)
+                if self._total > self.max_bytes:
+                    self._evict()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to write to cache {self.path}: {e}")
+
+    def _stored_total(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _stored_data_version(self) -> int:
+        # changes whenever another connection commits to the database, but not for this connection's own commits
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _evict(self) -> None:
+        target = int(self.max_bytes * EVICTION_TARGET_FRACTION)
+        evicted = 0
+        while self._total > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access ASC LIMIT ?", (EVICTION_BATCH_SIZE,)
+            ).fetchall()
+            if not rows:
+                break
+            batch = []
+            for key, size in rows:
+                if self._total <= target:
+                    break
+                batch.append((key,))
+                self._total -= size
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", batch)
+            evicted += len(batch)
+        logger.debug(f"Evicted {evicted} entries from cache {self.path}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_caches = {}
+
+
+def get_cache(name: str) -> Optional[SQLiteLRUCache]:
+    """Get the shared on-disk cache with the given name, or None if caching is disabled or unavailable.
+
+    Args:
+        name (str): The cache name; used as the database file name under CACHE_DIR.
+
+    Returns:
+        Optional[SQLiteLRUCache]: The cache instance.
+    """
+    if not CACHE_ENABLED:
+        return None
+    if name not in _caches:
+        try:
+            _caches[name] = SQLiteLRUCache(os.path.join(CACHE_DIR, f"{name}.sqlite3"))
+        except Exception as e:
+            logger.error(f"Failed to open cache {name}, continuing without it: {e}")
+            _caches[name] = None
+    return _caches[name]
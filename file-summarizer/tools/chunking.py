@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+import os
+import re
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Iterator, List, Tuple
+from tools.tokens import get_encoder
+
+
+class ChunkingStrategy:
+    """
+    Decides where a chunk of at most max_tokens tokens ends.
+
+    The base strategy cuts at exactly max_tokens tokens. Subclasses list (pattern, priority) pairs in
+    `boundaries`; the chunk then ends at the highest-priority boundary found in the last
+    (1 - min_fill) part of the window, preferring the latest one among equal priorities.
+    Boundaries are matched on the UTF-8 bytes of the window's tokens and mapped back to token
+    indices with a bisect over the cumulative token byte offsets, so nothing is re-encoded.
+    """
+
+    name = "fixed"
+    # compiled bytes regexes; a match's start is where the next chunk would begin
+    boundaries: List[Tuple[re.Pattern, int]] = []
+    # only consider boundaries after this fraction of the token budget is filled
+    min_fill = 0.75
+
+    def find_boundaries(self, data: bytes) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (byte offset, priority) for every candidate boundary in data.
+        """
+        for pattern, priority in self.boundaries:
+            for match in pattern.finditer(data):
+                yield match.start(), priority
+
+    def chunk_end(self, window: array, max_tokens: int) -> int:
+        """
+        :param window: The tokens from the start of the chunk; only the first max_tokens are considered.
+        :param max_tokens: The token budget of the chunk.
+        :return: The number of tokens from window that make up the chunk (at least 1, at most max_tokens).
+        """
+        if len(window) <= max_tokens:
+            return len(window)
+        if not self.boundaries:
+            return max_tokens
+
+        search_from = int(max_tokens * self.min_fill)
+        enc = get_encoder()
+        token_bytes = [
+            enc.decode_single_token_bytes(token)
+            for token in window[search_from:max_tokens]
+        ]
+        # token_starts[i] is the byte offset of token i within data
+        token_starts = [0, *accumulate(map(len, token_bytes))]
+        data = b"".join(token_bytes)
+
+        best_position, best_priority = -1, -1
+        for position, priority in self.find_boundaries(data):
+            if position == 0:
+                continue
+            if (priority, position) > (best_priority, best_position):
+                best_position, best_priority = position, priority
+        if best_position == -1:
+            return max_tokens
+
+        # the first token starting at or after the boundary begins the next chunk
+        return search_from + bisect_left(token_starts, best_position)
+
+
+_PARAGRAPH = (re.compile(rb"(?<=\n\n)(?=\S)"), 2)
+_LINE = (re.compile(rb"(?<=\n)(?=\S)"), 1)
+_SENTENCE = (re.compile(rb"(?<=[.!?]) (?=[A-Z])"), 0)
+
+
+class TextChunkingStrategy(ChunkingStrategy):
+    """
+    Cuts plain text on paragraphs, then lines, then sentences.
+    """
+
+    name = "text"
+    boundaries = [_PARAGRAPH, _LINE, _SENTENCE]
+
+
+class MarkdownChunkingStrategy(ChunkingStrategy):
+    """
+    Cuts markdown on headings (top-level ones first), then paragraphs, lines and sentences.
+    """
+
+    name = "markdown"
+    boundaries = [
+        (re.compile(rb"(?m)^#{1,2} "), 4),
+        (re.compile(rb"(?m)^#{3,6} "), 3),
+        _PARAGRAPH,
+        _LINE,
+        _SENTENCE,
+    ]
+
+
+_DEFINITION = re.compile(
+    rb"(?m)^(?:async def|def|class|func|function|export|public|private|protected|static|interface|type|struct|template)\b"
+)
+_ATTACHED_LINE = re.compile(rb"[ \t]*(?://|#|/\*|\*|@)")
+
+
+class CodeChunkingStrategy(ChunkingStrategy):
+    """
+    Cuts source code before top-level definitions, then on blank lines between top-level statements,
+    then before any non-indented line. Comments and decorators directly above a definition stay with it.
+    """
+
+    name = "code"
+    boundaries = [
+        (re.compile(rb"(?<=\n\n)(?=[^\s)\]}])"), 2),
+        (re.compile(rb"(?<=\n)(?=[^\s)\]}])"), 1),
+    ]
+
+    def find_boundaries(self, data: bytes) -> Iterator[Tuple[int, int]]:
+        yield from super().find_boundaries(data)
+        for match in _DEFINITION.finditer(data):
+            start = match.start()
+            while start > 0:
+                previous_line = data.rfind(b"\n", 0, start - 1) + 1
+                if not _ATTACHED_LINE.match(data, previous_line):
+                    break
+                start = previous_line
+            yield start, 3
+
+
+class CsvChunkingStrategy(ChunkingStrategy):
+    """
+    Cuts CSV data between rows so that groups of whole rows are packed into each chunk.
+    """
+
+    name = "csv"
+    boundaries = [(re.compile(rb"(?<=\n)(?=.)"), 1)]
+
+
+CHUNKING_STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (
+        ChunkingStrategy,
+        TextChunkingStrategy,
+        MarkdownChunkingStrategy,
+        CodeChunkingStrategy,
+        CsvChunkingStrategy,
+    )
+}
+
+CHUNKING_STRATEGY_BY_EXTENSION = {
+    ".md": MarkdownChunkingStrategy,
+    ".markdown": MarkdownChunkingStrategy,
+    ".csv": CsvChunkingStrategy,
+    ".tsv": CsvChunkingStrategy,
+    ".py": CodeChunkingStrategy,
+    ".go": CodeChunkingStrategy,
+    ".js": CodeChunkingStrategy,
+    ".ts": CodeChunkingStrategy,
+    ".java": CodeChunkingStrategy,
+    ".c": CodeChunkingStrategy,
+    ".cpp": CodeChunkingStrategy,
+}
+
+
+def get_chunking_strategy(file_name: str = "") -> ChunkingStrategy:
+    """Pick the chunking strategy for a file.
+
+    The FILE_SUMMARIZER_CHUNKING environment variable (one of CHUNKING_STRATEGIES) overrides the choice by extension.
+
+    Args:
+        file_name (str): The name of the file being chunked.
+
+    Returns:
+        ChunkingStrategy: The strategy instance.
+    """
+    override = os.getenv("FILE_SUMMARIZER_CHUNKING", "")
+    if override in CHUNKING_STRATEGIES:
+        return CHUNKING_STRATEGIES[override]()
+    _, ext = os.path.splitext(file_name.lower())
+    return CHUNKING_STRATEGY_BY_EXTENSION.get(ext, TextChunkingStrategy)()
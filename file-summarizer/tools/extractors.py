@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import csv
+import io
+import json
+import os
+import re
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional
+
+LOCAL_EXTRACTION_ENABLED = os.getenv("FILE_SUMMARIZER_LOCAL_EXTRACTION", "true").lower() not in ("0", "false", "off", "no")
+
+# binary documents that only the knowledge file-loader tool can convert to text
+KNOWLEDGE_ONLY_FILE_TYPES = (".pdf", ".pptx", ".ppt", ".docx", ".doc", ".odt", ".rtf")
+# leading bytes of binary documents, whatever their file name: PDF, ZIP (docx, pptx, odt), OLE2 (doc, ppt) and RTF
+BINARY_DOCUMENT_SIGNATURES = (b"%PDF-", b"PK\x03\x04", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", b"{\\rtf")
+
+_SPACE = re.compile(r"\s+")
+_BLANK_LINES = re.compile(r"\n[ \t]*\n(?:[ \t]*\n)+")
+
+
+def csv_to_text(text: str) -> str:
+    """Render CSV compactly: one row per line, cells stripped of padding and line breaks, empty rows dropped."""
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    for row in csv.reader(io.StringIO(text)):
+        cells = [_SPACE.sub(" ", cell).strip() for cell in row]
+        while cells and not cells[-1]:
+            cells.pop()
+        if cells:
+            writer.writerow(cells)
+    return output.getvalue()
+
+
+def notebook_to_text(text: str) -> str:
+    """Render a Jupyter notebook as Markdown: markdown cells as they are, code cells fenced; outputs are dropped."""
+    notebook = json.loads(text)
+    metadata = notebook.get("metadata", {})
+    language = metadata.get("kernelspec", {}).get("language") or metadata.get("language_info", {}).get("name", "")
+    cells = []
+    for cell in notebook.get("cells", []):
+        source = cell.get("source", "")
+        if isinstance(source, list):
+            source = "".join(source)
+        source = source.strip("\n")
+        if not source.strip():
+            continue
+        if cell.get("cell_type") == "code":
+            source = f"```{language}\n{source}\n```"
+        cells.append(source)
+    return "\n\n".join(cells) + "\n"
+
+
+class _HTMLTextParser(HTMLParser):
+    """
+    Collects the visible text of an HTML document: paragraphs separated by blank lines, list items and table rows
+    on lines of their own, Markdown-style headings, list markers and cell separators,
+    and whitespace kept only inside <pre>.
+    """
+
+    # the text in <head> is only the <title> once scripts and styles are skipped
+    SKIPPED = {"script", "style", "noscript", "template", "svg"}
+    PARAGRAPHS = {
+        "address", "article", "aside", "blockquote", "dl", "figure", "footer", "form", "header", "hr", "main",
+        "nav", "ol", "p", "pre", "section", "table", "title", "ul", "h1", "h2", "h3", "h4", "h5", "h6",
+    }
+    LINES = {"br", "dd", "div", "dt", "figcaption", "li", "tr"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        # newlines at the end of the text so far; the start of the document counts as a blank line
+        self._newlines = 2
+        self._skipping = 0
+        self._pre = 0
+
+    def _write(self, text: str):
+        self.parts.append(text)
+        self._newlines = 0
+
+    def _break(self, newlines: int):
+        if self._newlines < newlines:
+            self.parts.append("\n" * (newlines - self._newlines))
+            self._newlines = newlines
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self._skipping += 1
+        if self._skipping:
+            return
+        if tag in self.PARAGRAPHS:
+            self._break(2)
+        elif tag in self.LINES:
+            self._break(1)
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self._write("#" * int(tag[1]) + " ")
+        elif tag == "li":
+            self._write("- ")
+        elif tag in ("td", "th"):
+            self._write("| " if self._newlines else " | ")
+        elif tag == "pre":
+            self._pre += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self._skipping = max(0, self._skipping - 1)
+            return
+        if self._skipping:
+            return
+        if tag == "pre":
+            self._pre = max(0, self._pre - 1)
+        if tag in self.PARAGRAPHS:
+            self._break(2)
+        elif tag in self.LINES:
+            self._break(1)
+
+    def handle_data(self, data):
+        if self._skipping:
+            return
+        if self._pre:
+            self._write(data)
+            return
+        data = _SPACE.sub(" ", data)
+        if self._newlines:
+            data = data.lstrip(" ")
+        if data:
+            self._write(data)
+
+
+def html_to_text(text: str) -> str:
+    """Extract the visible text of an HTML document; scripts, styles and markup are dropped."""
+    parser = _HTMLTextParser()
+    parser.feed(text)
+    parser.close()
+    lines = (line.rstrip() for line in "".join(parser.parts).split("\n"))
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip("\n") + "\n"
+
+
+# structured text formats that are converted locally; other text formats are used as they are
+EXTRACTOR_BY_EXTENSION: Dict[str, Callable[[str], str]] = {
+    ".csv": csv_to_text,
+    ".ipynb": notebook_to_text,
+    ".html": html_to_text,
+    ".htm": html_to_text,
+}
+
+
+def is_binary_document(content: bytes) -> bool:
+    """Whether the content starts like a binary document (PDF, Office, OpenDocument or RTF)."""
+    return content.startswith(BINARY_DOCUMENT_SIGNATURES)
+
+
+def needs_knowledge_tool(file_path: str, content: bytes) -> bool:
+    """Whether a file has to be converted to text by the knowledge file-loader tool,
+    judged by its leading bytes first and then by its extension.
+
+    Args:
+        file_path (str): The name of the file.
+        content (bytes): The file's content, or at least its first bytes.
+
+    Returns:
+        bool: True for binary documents, False for files that can be decoded (and extracted) locally.
+    """
+    return is_binary_document(content) or file_path.lower().endswith(KNOWLEDGE_ONLY_FILE_TYPES)
+
+
+def get_extractor(file_path: str) -> Optional[Callable[[str], str]]:
+    """The local extractor for a text file by its extension, or None if its decoded text is used as it is."""
+    _, ext = os.path.splitext(file_path.lower())
+    return EXTRACTOR_BY_EXTENSION.get(ext)
@@ -1,11 +1,84 @@
+import asyncio
+import contextvars
 import os
-import gptscript
 from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional
 from tools.helper import setup_logger
 
+if TYPE_CHECKING:
+    import gptscript
+
 logger = setup_logger(__name__)
 
 FILES_DIR = "files"
+# how many workspace operations run at the same time
+MAX_WORKSPACE_CONCURRENCY = int(os.getenv("FILE_SUMMARIZER_WORKSPACE_CONCURRENCY", "16"))
+
+_gptscript_client = None
+_workspace_slots = None
+# the client of the call that a worker is serving, see open_call_gptscript_client
+_call_gptscript_client: contextvars.ContextVar[Optional["gptscript.GPTScript"]] = contextvars.ContextVar(
+    "call_gptscript_client", default=None
+)
+
+
+def get_gptscript_client() -> "gptscript.GPTScript":
+    """Get the GPTScript client of the call that a worker is serving, or else the one shared by all workspace
+    operations and tool runs, creating it on first use.
+
+    Returns:
+        gptscript.GPTScript: The client.
+    """
+    client = _call_gptscript_client.get()
+    if client is not None:
+        return client
+    global _gptscript_client
+    if _gptscript_client is None:
+        import gptscript
+
+        _gptscript_client = gptscript.GPTScript()
+    return _gptscript_client
+
+
+def close_gptscript_client() -> None:
+    """Close the shared GPTScript client, if it was created."""
+    global _gptscript_client
+    if _gptscript_client is not None:
+        _gptscript_client.close()
+        _gptscript_client = None
+
+
+def open_call_gptscript_client(environment: Dict[str, str]) -> contextvars.Token:
+    """Give the current task its own GPTScript client, so that the workspace and the tools it runs are those of
+    the call that a worker is serving rather than those of the call that started the worker.
+
+    Args:
+        environment (Dict[str, str]): The per-call variables, which override the worker's environment.
+
+    Returns:
+        contextvars.Token: To pass to close_call_gptscript_client.
+    """
+    import gptscript
+    from gptscript.gptscript import GlobalOptions
+
+    environ = {**os.environ, **environment}
+    client = gptscript.GPTScript(GlobalOptions(env=[f"{name}={value}" for name, value in environ.items()]))
+    return _call_gptscript_client.set(client)
+
+
+def close_call_gptscript_client(token: contextvars.Token) -> None:
+    """Close the client made by open_call_gptscript_client."""
+    client = _call_gptscript_client.get()
+    _call_gptscript_client.reset(token)
+    if client is not None:
+        client.close()
+
+
+def _get_workspace_slots() -> asyncio.Semaphore:
+    global _workspace_slots
+    if _workspace_slots is None:
+        _workspace_slots = asyncio.Semaphore(MAX_WORKSPACE_CONCURRENCY)
+    return _workspace_slots
 
 
 def _prepend_base_path(file_path: str, base_path: str = FILES_DIR):
@@ -49,11 +122,11 @@ def _prepend_base_path(file_path: str, base_path: str = FILES_DIR):
 # for gptscript workspace S/L, see https://github.com/gptscript-ai/py-gptscript/blob/main/gptscript/gptscript.py
 async def write_file_in_workspace(filepath: str, content: str) -> bool:
     try:
-        gptscript_client = gptscript.GPTScript()
         wksp_file_path = _prepend_base_path(filepath, FILES_DIR)
-        await gptscript_client.write_file_in_workspace(
-            wksp_file_path, content.encode("utf-8")
-        )
+        async with _get_workspace_slots():
+            await get_gptscript_client().write_file_in_workspace(
+                wksp_file_path, content.encode("utf-8")
+            )
         return True
     except Exception as e:
         logger.error(f"Failed to write file to GPTScript workspace: {e}")
@@ -61,10 +134,10 @@ async def write_file_in_workspace(filepath: str, content: str) -> bool:
 
 
 async def list_files_in_workspace(directory: str) -> str:
-    gptscript_client = gptscript.GPTScript()
-    files = await gptscript_client.list_files_in_workspace(
-        prefix=str(Path(FILES_DIR) / directory)
-    )
+    async with _get_workspace_slots():
+        files = await get_gptscript_client().list_files_in_workspace(
+            prefix=str(Path(FILES_DIR) / directory)
+        )
     if files is None:
         return ""
 
@@ -82,14 +155,50 @@ async def list_files_in_workspace(directory: str) -> str:
     return "\n".join(sorted(unique_dirs))
 
 
+async def list_file_paths_in_workspace(directory: str = "") -> List[str]:
+    """Recursively list the files under a workspace directory.
+
+    Args:
+        directory (str): The directory to list, relative to the workspace files directory. Defaults to all files.
+
+    Returns:
+        List[str]: The file paths, relative to the workspace files directory, sorted.
+    """
+    async with _get_workspace_slots():
+        files = await get_gptscript_client().list_files_in_workspace(
+            prefix=str(Path(FILES_DIR) / directory)
+        )
+    if files is None:
+        return []
+
+    directory_prefix = directory.rstrip("/") + "/" if directory.strip("/") else ""
+    paths = []
+    for file in files:
+        p = str(Path(file).relative_to(FILES_DIR))
+        # the prefix match also returns siblings such as "notes2/" for "notes"
+        if p.startswith(directory_prefix):
+            paths.append(p)
+    return sorted(paths)
+
+
+async def file_exists_in_workspace(filepath: str) -> bool:
+    """Whether a file exists in the workspace, without reading it."""
+    wksp_file_path = _prepend_base_path(filepath, FILES_DIR)
+    async with _get_workspace_slots():
+        files = await get_gptscript_client().list_files_in_workspace(prefix=wksp_file_path)
+    return wksp_file_path in (files or [])
+
+
 async def delete_file_in_workspace(filepath: str) -> None:
-    gptscript_client = gptscript.GPTScript()
     wksp_file_path = _prepend_base_path(filepath, FILES_DIR)
-    await gptscript_client.delete_file_in_workspace(wksp_file_path)
+    async with _get_workspace_slots():
+        await get_gptscript_client().delete_file_in_workspace(wksp_file_path)
 
 
 async def read_file_in_workspace(filepath: str) -> bytes:
-    gptscript_client = gptscript.GPTScript()
     wksp_file_path = _prepend_base_path(filepath, FILES_DIR)
-    file_content: bytes = await gptscript_client.read_file_in_workspace(wksp_file_path)
+    async with _get_workspace_slots():
+        file_content: bytes = await get_gptscript_client().read_file_in_workspace(
+            wksp_file_path
+        )
     return file_content
@@ -1,8 +1,46 @@
 #!/usr/bin/env python3
+import contextvars
 import os
 import logging
 import sys
-from openai import OpenAI
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+# local state (summary cache, encoder ranks) shared by all invocations of the tool
+CACHE_DIR = os.getenv(
+    "FILE_SUMMARIZER_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "obot-file-summarizer"),
+)
+
+# the per-call variables of the call that a worker is serving (see tools.worker), which override its own environment
+_call_environment: contextvars.ContextVar[Optional[Dict[str, str]]] = contextvars.ContextVar(
+    "call_environment", default=None
+)
+
+
+def getenv(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Same as os.getenv, but sees the per-call variables of the call that a worker is serving."""
+    environment = _call_environment.get()
+    if environment is not None and name in environment:
+        return environment[name]
+    return os.getenv(name, default)
+
+
+def call_environment() -> Dict[str, str]:
+    """The per-call variables of the call that a worker is serving, to pass on to the tools it runs;
+    empty when running in-process, where the tools inherit the environment as it is."""
+    return dict(_call_environment.get() or {})
+
+
+def set_call_environment(environment: Dict[str, str]) -> contextvars.Token:
+    """Set the per-call variables for the current task; see getenv."""
+    return _call_environment.set(environment)
+
+
+def reset_call_environment(token: contextvars.Token) -> None:
+    _call_environment.reset(token)
 
 
 def setup_logger(name):
@@ -36,14 +74,21 @@ def setup_logger(name):
 logger = setup_logger(__name__)
 
 
-def get_openai_client() -> OpenAI:
-    # Check for OPENAI_API_KEY
+def _check_openai_api_key():
     if "OPENAI_API_KEY" not in os.environ:
         sys.exit(
             "ERROR: OPENAI_API_KEY environment variable not found.\n"
             "Please set it before running the script, e.g.:\n\n"
             "  export OPENAI_API_KEY='sk-xxxxxxx'\n"
         )
+
+
+def get_openai_client() -> "OpenAI":
+    # Check for OPENAI_API_KEY
+    _check_openai_api_key()
+    # imported here so that files returned verbatim never pay for importing openai
+    from openai import OpenAI
+
     try:
         base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
         logger.debug(f"Using base_url: {base_url}")
@@ -52,3 +97,18 @@ def get_openai_client() -> OpenAI:
         return client
     except Exception as e:
         raise Exception(f"ERROR: Failed to initialize OpenAI client: {e}")
+
+
+def get_async_openai_client() -> "AsyncOpenAI":
+    """Same as get_openai_client, but returns an AsyncOpenAI client for use inside the asyncio event loop."""
+    _check_openai_api_key()
+    from openai import AsyncOpenAI
+
+    try:
+        base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+        logger.debug(f"Using base_url: {base_url}")
+        api_key = os.environ["OPENAI_API_KEY"]
+        client = AsyncOpenAI(base_url=base_url, api_key=api_key)
+        return client
+    except Exception as e:
+        raise Exception(f"ERROR: Failed to initialize AsyncOpenAI client: {e}")
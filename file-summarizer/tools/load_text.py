@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
-from tools.helper import setup_logger
-import gptscript
+from tools.helper import call_environment, getenv, setup_logger
+import codecs
 import os
 import json
-from gptscript.gptscript import Options
-from tools.gptscript_workspace import read_file_in_workspace
+from typing import AsyncIterator, Callable, Iterator, Optional
+from tools.extractors import LOCAL_EXTRACTION_ENABLED, get_extractor, needs_knowledge_tool
+from tools.gptscript_workspace import get_gptscript_client, read_file_in_workspace
+from tools.metrics import span
 
 logger = setup_logger(__name__)
 
@@ -33,6 +35,12 @@ SUPPORTED_KNOWLEDGE_DOC_FILE_TYPES = (
 )
 
 MAX_FILE_SIZE = 100_000_000
+# size of the slices the streaming loader decodes and yields at a time
+STREAM_PIECE_SIZE = 1_000_000
+
+KNOWLEDGE_LOADER_TOOL = "github.com/obot-platform/tools/knowledge/file-loader.gpt"
+# bump whenever the way documents are loaded changes, so that cached extractions are not reused
+KNOWLEDGE_LOADER_VERSION = "1"
 
 
 async def load_from_knowledge_tool(input_file: str) -> str:
@@ -44,14 +52,17 @@ async def load_from_knowledge_tool(input_file: str) -> str:
     Returns:
         str: The content of the file.
     """
+    from gptscript.gptscript import Options
+
     logger.info("Calling knowledge file-loader tool...")
-    gptscript_client = gptscript.GPTScript()
-    run = gptscript_client.run(
-        "github.com/obot-platform/tools/knowledge/file-loader.gpt",
+    run = get_gptscript_client().run(
+        KNOWLEDGE_LOADER_TOOL,
         Options(
             input=json.dumps({"input": input_file}),
             workspace=os.environ.get("GPTSCRIPT_WORKSPACE_ID"),
             env=[
+                # when served by a worker, the tool gets this call's variables rather than the worker's own
+                *(f"{name}={value}" for name, value in call_environment().items()),
                 f"OPENAI_MODEL={os.environ.get('OBOT_DEFAULT_VISION_MODEL')}", # knowledge tool expects the model env variable to be OPENAI_MODEL
             ],
         ),
@@ -59,6 +70,115 @@ async def load_from_knowledge_tool(input_file: str) -> str:
     text = await run.text()
     return text
 
+async def _read_workspace_bytes(file_path: str, max_file_size: int) -> bytes:
+    try:
+        with span("workspace_read", file=file_path) as read_span:
+            file_content: bytes = await read_file_in_workspace(file_path)
+            read_span.set_attribute("bytes", len(file_content))
+    except Exception as e:
+        logger.error(
+            f"Failed to load file from GPTScript workspace file {file_path}, Error: {e}"
+        )
+        raise ValueError(
+            f"Failed to load file from GPTScript workspace file {file_path}, Error: {e}"
+        )
+    if len(file_content) > max_file_size:
+        raise Exception(
+            f"File size exceeds {max_file_size} bytes"
+        )
+    return file_content
+
+
+async def _load_with_knowledge_tool(file_path: str, file_content: bytes) -> str:
+    # imported here so that plain text reads never open the cache
+    from tools.cache import get_cache, make_cache_key
+
+    try:
+        with span("knowledge_load", file=file_path) as load_span:
+            cache = get_cache("knowledge")
+            key = None
+            if cache is not None:
+                # the extraction depends on the bytes, the loader (and the tools it runs) and the OCR model
+                key = make_cache_key(
+                    KNOWLEDGE_LOADER_TOOL,
+                    KNOWLEDGE_LOADER_VERSION,
+                    getenv("OBOT_SERVER_VERSIONS", ""),
+                    os.environ.get("OBOT_DEFAULT_VISION_MODEL", ""),
+                    os.path.splitext(file_path)[1].lower(),
+                    file_content,
+                )
+                text = cache.get(key)
+                if text is not None:
+                    load_span.set_attribute("cache_hit", True)
+                    load_span.set_attribute("chars", len(text))
+                    return text
+
+            text = await load_from_knowledge_tool(file_path)
+            load_span.set_attribute("cache_hit", False)
+            load_span.set_attribute("chars", len(text))
+            if key is not None and text:
+                cache.set(key, text)
+            return text
+    except Exception as e:
+        logger.error(
+            f"Failed to load file from GPTScript workspace file {file_path}, Error: {e}"
+        )
+        raise ValueError(
+            f"Failed to load file from GPTScript workspace file {file_path}, Error: {e}"
+        )
+
+
+def _uses_knowledge_tool(file_path: str, file_content: bytes) -> bool:
+    if LOCAL_EXTRACTION_ENABLED:
+        # only binary documents need the knowledge tool; text formats are decoded and extracted locally
+        return needs_knowledge_tool(file_path, file_content)
+    return file_path.endswith(SUPPORTED_KNOWLEDGE_DOC_FILE_TYPES)
+
+
+def _local_extractor(file_path: str) -> Optional[Callable[[str], str]]:
+    return get_extractor(file_path) if LOCAL_EXTRACTION_ENABLED else None
+
+
+def _extract_locally(file_path: str, extractor: Callable[[str], str], text: str) -> str:
+    try:
+        with span("local_extract", file=file_path, extractor=extractor.__name__) as extract_span:
+            extracted = extractor(text)
+            extract_span.set_attribute("chars", len(extracted))
+            return extracted
+    except Exception as e:
+        # e.g. a notebook that is not valid JSON: its text is still better than nothing
+        logger.warning(f"Failed to extract the text of {file_path} locally, using it as it is: {e}")
+        return text
+
+
+def _is_utf8(content: bytes, piece_size: int) -> bool:
+    """Whether the whole content is valid UTF-8, checked slice by slice so that the decoded text is never kept."""
+    if content.isascii():
+        return True
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    view = memoryview(content)
+    try:
+        for start in range(0, len(view), piece_size):
+            end = start + piece_size
+            decoder.decode(view[start:end], final=end >= len(view))
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _decode_utf8_incrementally(content: bytes, piece_size: int) -> Iterator[str]:
+    """Decode UTF-8 bytes in slices of piece_size bytes, without copying the whole buffer into one str.
+
+    Raises:
+        UnicodeDecodeError: If the content is not valid UTF-8.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    view = memoryview(content)
+    for start in range(0, len(view), piece_size):
+        end = start + piece_size
+        yield decoder.decode(view[start:end], final=end >= len(view))
+
+
 async def load_text_from_workspace_file(file_path: str, max_file_size: int = MAX_FILE_SIZE) -> str:
     """Logic to load text from a workspace file.
 
@@ -76,37 +196,77 @@ async def load_text_from_workspace_file(file_path: str, max_file_size: int = MAX
     """
 
     # first read from gptscript workspace
-    try:
-        file_content: bytes = await read_file_in_workspace(file_path)
-    except Exception as e:
-        logger.error(
-            f"Failed to load file from GPTScript workspace file {file_path}, Error: {e}"
-        )
-        raise ValueError(
-            f"Failed to load file from GPTScript workspace file {file_path}, Error: {e}"
-        )
-    if len(file_content) > max_file_size:
-        raise Exception(
-            f"File size exceeds {max_file_size} bytes"
-        )
+    file_content: bytes = await _read_workspace_bytes(file_path, max_file_size)
 
-    # if the file is not a supported knowledge doc file type, try to decode it as a plain text file using utf-8 encoding
-    if not file_path.endswith(SUPPORTED_KNOWLEDGE_DOC_FILE_TYPES):
+    # if the file is not a binary document, try to decode it as a text file using utf-8 encoding,
+    # and extract the text of structured formats (notebooks, CSV, HTML) locally
+    if not _uses_knowledge_tool(file_path, file_content):
         try:
-            file_content = file_content.decode("utf-8")
-            return file_content
-        except UnicodeDecodeError:
+            text = file_content.decode("utf-8")
+        except UnicodeDecodeError as e:
             logger.error(
                 f"Failed to decode file content from GPTScript workspace file {file_path}, Error: {e}"
             )
+        else:
+            extractor = _local_extractor(file_path)
+            return text if extractor is None else _extract_locally(file_path, extractor, text)
 
-    # if the file is a supported knowledge doc file type, or the file is not a plain text file, try to load it using the knowledge-load tool
-    try:
-        return await load_from_knowledge_tool(file_path)
-    except Exception as e:
-        logger.error(
-            f"Failed to load file from GPTScript workspace file {file_path}, Error: {e}"
-        )
-        raise ValueError(
-            f"Failed to load file from GPTScript workspace file {file_path}, Error: {e}"
-        )
+    # if the file is a binary document, or the file is not a text file, try to load it using the knowledge-load tool
+    return await _load_with_knowledge_tool(file_path, file_content)
+
+
+async def iter_text_from_workspace_file(
+    file_path: str,
+    max_file_size: int = MAX_FILE_SIZE,
+    piece_size: int = STREAM_PIECE_SIZE,
+    on_size: Optional[Callable[[int], None]] = None,
+) -> AsyncIterator[str]:
+    """Streaming variant of load_text_from_workspace_file.
+    Yields the text in pieces so that consumers can start working before the whole file is decoded,
+    and never holds a second full copy of the file as a str.
+
+    Plain text files are decoded incrementally, once the whole file is known to be valid UTF-8; otherwise the whole file
+    falls back to the knowledge-load tool, as with load_text_from_workspace_file. Structured text formats (see tools.extractors) are decoded and extracted as a whole.
+
+    Args:
+        file_path (str): The path to the file to load.
+        max_file_size (int): The maximum file size to load. defaults to 100MB
+        piece_size (int): The number of bytes decoded per yielded piece.
+        on_size (Optional[Callable[[int], None]]): Called with the approximate length of the text in characters
+            (its size in bytes for plain text files) before the first piece is yielded.
+
+    Raises:
+        ValueError: If the file is not found in the workspace.
+        ValueError: If the file is not valid UTF-8 and the knowledge-load tool fails to load it.
+
+    Yields:
+        str: Consecutive pieces of the file's text.
+    """
+    file_content: bytes = await _read_workspace_bytes(file_path, max_file_size)
+
+    text = None
+    if not _uses_knowledge_tool(file_path, file_content):
+        extractor = _local_extractor(file_path)
+        if extractor is not None:
+            try:
+                text = _extract_locally(file_path, extractor, file_content.decode("utf-8"))
+            except UnicodeDecodeError as e:
+                logger.error(
+                    f"Failed to decode file content from GPTScript workspace file {file_path}, Error: {e}"
+                )
+        elif _is_utf8(file_content, piece_size):
+            if on_size is not None:
+                on_size(len(file_content))
+            for piece in _decode_utf8_incrementally(file_content, piece_size):
+                yield piece
+            return
+        else:
+            logger.error(f"Failed to decode file content from GPTScript workspace file {file_path}: not valid UTF-8")
+
+    if text is None:
+        text = await _load_with_knowledge_tool(file_path, file_content)
+    del file_content
+    if on_size is not None:
+        on_size(len(text))
+    for start in range(0, len(text), piece_size):
+        yield text[start : start + piece_size]
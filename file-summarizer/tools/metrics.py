@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+# "json" writes one JSON object per finished span to stderr
+METRICS_EXPORTER = os.getenv("FILE_SUMMARIZER_METRICS", "").lower()
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar(
+    "file_summarizer_current_span", default=None
+)
+
+
+class Span:
+    """
+    A timed phase of the pipeline, e.g. a workspace read, a model call or a reduction level.
+    Spans nest through a context variable, so spans opened in asyncio tasks are children of the
+    span that was current when the task was created.
+    Use as a context manager, or use `add_to_trace` to accumulate totals on the root span.
+    """
+
+    def __init__(self, name: str, parent: "Span" = None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes: Dict[str, object] = dict(attributes)
+        self.start_time = time.time()
+        self.end_time: Optional[float] = None
+        self._start = time.perf_counter()
+        self._token = None
+
+    @property
+    def root(self) -> "Span":
+        span = self
+        while span.parent is not None:
+            span = span.parent
+        return span
+
+    @property
+    def duration(self) -> float:
+        end = self.end_time if self.end_time is not None else time.time()
+        return end - self.start_time
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add(self, key: str, amount):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def end(self):
+        if self.end_time is not None:
+            return
+        self.end_time = self.start_time + (time.perf_counter() - self._start)
+        if _exporter is not None:
+            _exporter.export([self])
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.set_attribute("error", f"{exc_type.__name__}: {exc}")
+        _current_span.reset(self._token)
+        self.end()
+        return False
+
+
+class SpanExporter(ABC):
+    """
+    Receives finished spans. Same shape as OpenTelemetry's SpanExporter (export/shutdown),
+    so an adapter to a real OpenTelemetry pipeline can be plugged in with set_span_exporter.
+    """
+
+    @abstractmethod
+    def export(self, spans: List[Span]) -> None:
+        """Handle spans that just ended; called synchronously as each span ends."""
+
+    def shutdown(self) -> None:
+        pass
+
+
+class JsonStderrExporter(SpanExporter):
+    """
+    Writes each finished span as one JSON line to stderr, which ends up in GPTScript's debugging logs.
+    """
+
+    def export(self, spans: List[Span]) -> None:
+        for span in spans:
+            sys.stderr.write(
+                json.dumps({"file_summarizer_span": span.to_dict()}, default=str) + "\n"
+            )
+        sys.stderr.flush()
+
+
+_exporter: Optional[SpanExporter] = JsonStderrExporter() if METRICS_EXPORTER == "json" else None
+
+
+def set_span_exporter(exporter: Optional[SpanExporter]) -> None:
+    """Install the exporter that receives finished spans, or None to stop exporting."""
+    global _exporter
+    if _exporter is not None:
+        _exporter.shutdown()
+    _exporter = exporter
+
+
+def span(name: str, **attributes) -> Span:
+    """Start a span that is a child of the current one; use it as a context manager.
+
+    Args:
+        name (str): The phase name, e.g. "workspace_read".
+        **attributes: Initial attributes of the span.
+
+    Returns:
+        Span: The span.
+    """
+    return Span(name, _current_span.get(), **attributes)
+
+
+def record_span(name: str, start_time: float, end_time: float, **attributes) -> Span:
+    """Record a span after the fact, e.g. for phases that overlap and cannot be wrapped in a with block.
+
+    Args:
+        name (str): The phase name.
+        start_time (float): Start, as a time.time() timestamp.
+        end_time (float): End, as a time.time() timestamp.
+        **attributes: Attributes of the span.
+
+    Returns:
+        Span: The finished span.
+    """
+    recorded = Span(name, _current_span.get(), **attributes)
+    recorded.start_time = start_time
+    recorded._start = time.perf_counter() - (end_time - start_time)
+    recorded.end()
+    return recorded
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def add_to_trace(key: str, amount) -> None:
+    """Add to a running total on the root span of the current trace (no-op outside of a span).
+
+    Args:
+        key (str): The attribute name, e.g. "prompt_tokens".
+        amount: The amount to add.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.root.add(key, amount)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+import math
+import os
+from typing import List, Optional, Tuple
+from tools.helper import setup_logger
+
+logger = setup_logger(__name__)
+
+# (context window, maximum completion tokens) by exact model name, for names that are prefixes of unrelated models
+EXACT_MODEL_LIMITS = {
+    "gpt-4": (8192, 4096),
+    "gpt-4-0314": (8192, 4096),
+    "gpt-4-0613": (8192, 4096),
+}
+# (context window, maximum completion tokens) by model name prefix; the longest matching prefix wins
+MODEL_LIMITS = {
+    "gpt-3.5-turbo": (16385, 4096),
+    "gpt-4-32k": (32768, 4096),
+    "gpt-4-turbo": (128000, 4096),
+    "gpt-4-0125-preview": (128000, 4096),
+    "gpt-4-1106-preview": (128000, 4096),
+    "gpt-4-vision-preview": (128000, 4096),
+    "gpt-4.5": (128000, 16384),
+    "gpt-4o": (128000, 16384),
+    "gpt-4.1": (1047576, 32768),
+    "gpt-5": (400000, 128000),
+    "o1": (200000, 100000),
+    "o3": (200000, 100000),
+    "o4-mini": (200000, 100000),
+    "claude-3-5": (200000, 8192),
+    "claude-3-7": (200000, 64000),
+    "claude-sonnet-4": (200000, 64000),
+    "claude-opus-4": (200000, 32000),
+    "gemini-1.5": (1048576, 8192),
+    "gemini-2": (1048576, 65536),
+}
+DEFAULT_MODEL_LIMITS = (128000, 16384)
+# overrides for models that are not listed, or deployments with smaller limits
+CONTEXT_TOKENS = int(os.getenv("FILE_SUMMARIZER_CONTEXT_TOKENS", "0")) or None
+OUTPUT_TOKENS = int(os.getenv("FILE_SUMMARIZER_OUTPUT_TOKENS", "0")) or None
+# the largest context and output a summarization uses, however large the model's are: a prompt near a 1M-token
+# context exceeds most accounts' tokens-per-minute limit and is rejected as too large however often it is retried
+WORKING_CONTEXT_TOKENS = int(os.getenv("FILE_SUMMARIZER_WORKING_CONTEXT_TOKENS", "128000"))
+WORKING_OUTPUT_TOKENS = int(os.getenv("FILE_SUMMARIZER_WORKING_OUTPUT_TOKENS", "16384"))
+
+# optional budgets for one summarization: total prompt + completion tokens, and wall-clock seconds
+TOKEN_BUDGET = int(os.getenv("FILE_SUMMARIZER_TOKEN_BUDGET", "0")) or None
+LATENCY_BUDGET_SECONDS = float(os.getenv("FILE_SUMMARIZER_LATENCY_BUDGET", "0")) or None
+
+OVERHEAD_TOKENS = 2000
+# rough model speed, used to compare the latency of plans
+CALL_OVERHEAD_SECONDS = 1.0
+PROMPT_TOKENS_PER_SECOND = 10_000.0
+COMPLETION_TOKENS_PER_SECOND = 60.0
+# summaries typically use about half of their output limit (the prompts ask for less than half as many words)
+SUMMARY_FILL = 0.5
+# output limits that are tried, besides the model's own
+OUTPUT_TOKEN_CHOICES = (16384, 8192, 4096, 2048, 1024)
+MIN_CHUNK_TOKENS = 4000
+# every call's output budget is at most its input divided by the reduction ratio (and at least this much smaller),
+# so the text shrinks geometrically from one reduction level to the next
+MIN_REDUCTION_RATIO = 2.0
+# summarization levels (chunk summaries included) before the final reduction; deeper documents are compressed harder
+MAX_REDUCTION_DEPTH = int(os.getenv("FILE_SUMMARIZER_MAX_REDUCTION_DEPTH", "4"))
+# no call is given a smaller output budget than this
+MIN_OUTPUT_TOKENS = 256
+# documents are planned before they are tokenized, from their length in characters
+CHARS_PER_TOKEN = 4
+
+
+def get_model_limits(model: str) -> Tuple[int, int]:
+    """Look up a model's context window and maximum completion tokens.
+
+    Args:
+        model (str): The model name, e.g. "gpt-4o-mini".
+
+    Returns:
+        Tuple[int, int]: (context tokens, output tokens), after FILE_SUMMARIZER_CONTEXT_TOKENS/OUTPUT_TOKENS overrides.
+    """
+    name = model.lower().split("/")[-1]
+    prefixes = [prefix for prefix in MODEL_LIMITS if name.startswith(prefix)]
+    if name in EXACT_MODEL_LIMITS:
+        context_tokens, output_tokens = EXACT_MODEL_LIMITS[name]
+    else:
+        context_tokens, output_tokens = (
+            MODEL_LIMITS[max(prefixes, key=len)] if prefixes else DEFAULT_MODEL_LIMITS
+        )
+    return CONTEXT_TOKENS or context_tokens, OUTPUT_TOKENS or output_tokens
+
+
+def get_working_limits(model: str) -> Tuple[int, int]:
+    """The context and output tokens a summarization with a model works with: its limits, bounded by the working context.
+
+    Args:
+        model (str): The model name.
+
+    Returns:
+        Tuple[int, int]: (context tokens, output tokens), at most FILE_SUMMARIZER_WORKING_CONTEXT_TOKENS/OUTPUT_TOKENS.
+    """
+    context_tokens, output_tokens = get_model_limits(model)
+    return min(context_tokens, WORKING_CONTEXT_TOKENS), min(output_tokens, WORKING_OUTPUT_TOKENS)
+
+
+def get_reduction_ratio(
+    document_tokens: int,
+    chunk_tokens: int,
+    output_tokens: int,
+    final_input_tokens: int,
+    max_depth: int = MAX_REDUCTION_DEPTH,
+) -> float:
+    """How many times smaller than its input a call's output budget is, i.e. the fan-in of the reduction tree.
+
+    It is the ratio of a full chunk to the output limit, at least MIN_REDUCTION_RATIO, and raised so that
+    the document fits in the final reduction after at most max_depth levels.
+
+    Args:
+        document_tokens (int): The (estimated) number of tokens of the document; 0 if unknown.
+        chunk_tokens (int): Maximum tokens per chunk.
+        output_tokens (int): Maximum completion tokens per call.
+        final_input_tokens (int): Maximum tokens given to the final reduction.
+        max_depth (int): Maximum number of summarization levels.
+
+    Returns:
+        float: The reduction ratio.
+    """
+    ratio = max(MIN_REDUCTION_RATIO, chunk_tokens / output_tokens)
+    if document_tokens > final_input_tokens:
+        # the text of level k is about document_tokens / ratio**k tokens
+        ratio = max(ratio, (document_tokens / final_input_tokens) ** (1 / max_depth))
+    return ratio
+
+
+def get_summary_budget(input_tokens: float, reduction_ratio: float, max_summary_tokens: int) -> int:
+    """The output token budget of a call that summarizes input_tokens tokens.
+
+    Args:
+        input_tokens (float): The tokens of the text to summarize.
+        reduction_ratio (float): See get_reduction_ratio.
+        max_summary_tokens (int): The largest budget, e.g. the output limit.
+
+    Returns:
+        int: input_tokens / reduction_ratio, but at least MIN_OUTPUT_TOKENS and at most max_summary_tokens.
+    """
+    return int(min(max_summary_tokens, max(MIN_OUTPUT_TOKENS, math.ceil(input_tokens / reduction_ratio))))
+
+
+def estimate_call_seconds(prompt_tokens: float, completion_tokens: float) -> float:
+    return (
+        CALL_OVERHEAD_SECONDS
+        + prompt_tokens / PROMPT_TOKENS_PER_SECOND
+        + completion_tokens / COMPLETION_TOKENS_PER_SECOND
+    )
+
+
+class SummaryPlan:
+    """
+    Chunk size and output limit for summarizing one document, with its expected cost and latency.
+    """
+
+    def __init__(
+        self,
+        document_tokens: int,
+        chunk_tokens: int,
+        output_tokens: int,
+        context_tokens: int,
+        max_concurrency: int,
+    ):
+        """
+        :param document_tokens: The (estimated) number of tokens of the document.
+        :param chunk_tokens: Maximum tokens per chunk.
+        :param output_tokens: Maximum completion tokens per call.
+        :param context_tokens: The context window to work with.
+        :param max_concurrency: Upper bound on in-flight calls, for the latency estimate.
+        """
+        self.document_tokens = document_tokens
+        self.chunk_tokens = chunk_tokens
+        self.output_tokens = output_tokens
+        self.context_tokens = context_tokens
+        # any level (or the whole document) that fits in the final reduction goes straight to it
+        final_input_tokens = context_tokens - output_tokens - OVERHEAD_TOKENS
+        self.reduction_ratio = get_reduction_ratio(
+            document_tokens, chunk_tokens, output_tokens, final_input_tokens
+        )
+        # calls per reduction level, the last one being the final reduction
+        self.level_calls: List[int] = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.seconds = 0.0
+
+        # two summaries always fit in a chunk, so that every merge combines at least two
+        max_summary_tokens = min(output_tokens, chunk_tokens // 2)
+        level_tokens = float(document_tokens)
+        while level_tokens > final_input_tokens:
+            calls = math.ceil(level_tokens / chunk_tokens)
+            budget = get_summary_budget(level_tokens / calls, self.reduction_ratio, max_summary_tokens)
+            output = min(budget * SUMMARY_FILL, level_tokens / calls)
+            self._add_level(calls, level_tokens, output, max_concurrency)
+            level_tokens = calls * output
+        self._add_level(1, level_tokens, min(output_tokens * SUMMARY_FILL, level_tokens), max_concurrency)
+
+    def _add_level(self, calls: int, level_tokens: float, output: float, max_concurrency: int):
+        self.level_calls.append(calls)
+        self.prompt_tokens += int(level_tokens + calls * OVERHEAD_TOKENS)
+        self.completion_tokens += int(calls * output)
+        rounds = math.ceil(calls / max_concurrency)
+        self.seconds += rounds * estimate_call_seconds(
+            level_tokens / calls + OVERHEAD_TOKENS, output
+        )
+
+    @property
+    def calls(self) -> int:
+        return sum(self.level_calls)
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def describe(self) -> str:
+        return (
+            f"chunks of {self.chunk_tokens} tokens, outputs of up to {self.output_tokens} tokens, "
+            f"reduction ratio {self.reduction_ratio:.1f}: "
+            f"{self.calls} calls over {len(self.level_calls)} levels {self.level_calls}, "
+            f"~{self.tokens} tokens, ~{self.seconds:.0f}s"
+        )
+
+
+def plan_summarization(
+    model: str,
+    document_tokens: int,
+    max_concurrency: int,
+    token_budget: Optional[int] = TOKEN_BUDGET,
+    latency_budget: Optional[float] = LATENCY_BUDGET_SECONDS,
+    previous: Optional[Tuple[int, int]] = None,
+) -> SummaryPlan:
+    """Choose the chunk size and output limit for a document from the model's working limits and the budgets.
+
+    Plans use the working output limit (see get_working_limits), unless the budgets need a smaller one; among
+    the chunk sizes for it, the plan with the lowest expected cost and latency is used. If no plan is within
+    the budgets, the one closest to them is used.
+    A previous run's plan is kept while it is still possible and within the budgets, so that an incremental
+    re-summarization (see tools.summary_tree) cuts the same chunks.
+
+    Args:
+        model (str): The model name.
+        document_tokens (int): The (estimated) number of tokens of the document.
+        max_concurrency (int): Upper bound on in-flight calls.
+        token_budget (Optional[int]): Maximum prompt + completion tokens, or None.
+        latency_budget (Optional[float]): Maximum seconds, or None.
+        previous (Optional[Tuple[int, int]]): (chunk tokens, output tokens) of a previous run of the same document, or None.
+
+    Returns:
+        SummaryPlan: The chosen plan.
+    """
+    context_tokens, max_output_tokens = get_working_limits(model)
+    plans = []
+    for output_tokens in sorted(
+        {max_output_tokens} | {o for o in OUTPUT_TOKEN_CHOICES if o < max_output_tokens},
+        reverse=True,
+    ):
+        chunk_tokens = context_tokens - output_tokens - OVERHEAD_TOKENS
+        # at least two summaries must fit in a chunk, or the reduction cannot converge
+        while chunk_tokens >= max(MIN_CHUNK_TOKENS, 2 * output_tokens):
+            plans.append(
+                SummaryPlan(
+                    document_tokens, chunk_tokens, output_tokens, context_tokens, max_concurrency
+                )
+            )
+            chunk_tokens //= 2
+    if not plans:
+        raise ValueError(
+            f"The context window of {model} ({context_tokens} tokens) is too small to summarize in chunks"
+        )
+
+    def over_budget(plan: SummaryPlan) -> float:
+        over = 0.0
+        if token_budget:
+            over += max(0.0, plan.tokens / token_budget - 1)
+        if latency_budget:
+            over += max(0.0, plan.seconds / latency_budget - 1)
+        return over
+
+    cheapest = min(p.tokens for p in plans)
+    fastest = min(p.seconds for p in plans)
+
+    def cost(plan: SummaryPlan) -> float:
+        # tokens and seconds relative to the best plan for each, so that neither dominates
+        return plan.tokens / cheapest + plan.seconds / fastest
+
+    # the largest output limit the budgets allow keeps the summaries as detailed as configured
+    plans.sort(key=lambda p: (-p.output_tokens, cost(p)))
+    within_budget = [p for p in plans if over_budget(p) == 0]
+    if previous is not None:
+        # moved to the front rather than filtered, so that it still has to be within the budgets
+        within_budget.sort(key=lambda p: (p.chunk_tokens, p.output_tokens) != tuple(previous))
+    if within_budget:
+        plan = within_budget[0]
+    else:
+        plan = min(plans, key=over_budget)
+        logger.warning(
+            f"No summarization plan for {model} fits the budget "
+            f"(tokens: {token_budget}, seconds: {latency_budget}); using the closest one"
+        )
+    logger.info(f"Summarization plan for ~{document_tokens} tokens with {model}: {plan.describe()}")
+    return plan
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import re
+from typing import AsyncIterable, AsyncIterator, List, Optional
+from tools.helper import setup_logger
+from tools.metrics import add_to_trace
+
+logger = setup_logger(__name__)
+
+# off by default: similar lines are collapsed even when they differ in numbers, which are data in most files
+PRECOMPRESS_ENABLED = os.getenv("FILE_SUMMARIZER_PRECOMPRESS", "false").lower() not in ("0", "false", "off", "no")
+# only log-like output is pre-compressed, never tables, code or extracted documents;
+# rotated logs such as app.log.1 count as well
+PRECOMPRESS_FILE_TYPES = (".log", ".out", ".err", ".trace")
+# lines (and paragraphs) shorter than this are never dropped as duplicates, e.g. "}" or "end"
+MIN_DEDUP_CHARS = 32
+# runs of at least this many similar lines are collapsed into the first, a count and the last
+MIN_RUN_LINES = 4
+# paragraphs with more lines than this are not deduplicated as a whole, to bound memory
+MAX_PARAGRAPH_LINES = 64
+# stop remembering lines after this many distinct ones, to bound memory
+MAX_SEEN = 1_000_000
+
+# base64 (or similar encoded binary) data: long runs of base64 characters with upper case, lower case and digits
+_BLOB = re.compile(r"(?=[A-Za-z0-9+/]*[0-9])(?=[A-Za-z0-9+/]*[a-z])(?=[A-Za-z0-9+/]*[A-Z])[A-Za-z0-9+/]{200,}={0,2}")
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+# near-identical lines differ only in numbers, hex ids and spacing
+_VARIABLE = re.compile(r"0[xX][0-9a-fA-F]+|[0-9a-fA-F]*[0-9][0-9a-fA-F]*")
+_SPACE = re.compile(r"\s+")
+
+
+def should_precompress(file_path: str) -> bool:
+    """Whether a file is pre-compressed before it is summarized: only if enabled, and only for log-like output."""
+    if not PRECOMPRESS_ENABLED:
+        return False
+    name = os.path.basename(file_path.lower())
+    return any(f"{ext}." in name or name.endswith(ext) for ext in PRECOMPRESS_FILE_TYPES)
+
+
+def _strip_noise(line: str) -> str:
+    if "\r" in line.rstrip("\r"):
+        # progress output redraws the line; keep what was shown last
+        line = line.rstrip("\r").rsplit("\r", 1)[-1]
+    line = _CONTROL.sub("", _ANSI_ESCAPE.sub("", line))
+    return _BLOB.sub(lambda m: f"[{len(m.group())} characters of encoded data omitted]", line)
+
+
+def _similarity_key(line: str) -> str:
+    return _SPACE.sub(" ", _VARIABLE.sub("#", line)).strip()
+
+
+class Precompressor:
+    """
+    Local, extractive pre-compression of text before it is tokenized and summarized.
+
+    Works line by line on a stream of text pieces:
+    - strips terminal escape codes, control characters and long base64 blobs,
+    - collapses runs of similar lines (equal but for numbers, hex ids and spacing) into the first line,
+      a count of the omitted ones and the last line,
+    - drops lines and multi-line paragraphs that are similar to earlier ones, leaving a count in their place.
+    Lines are compared by the hash of their similarity key, so memory grows with the number of distinct lines only.
+    """
+
+    def __init__(self):
+        self._partial = ""
+        self._paragraph: List[str] = []
+        self._seen = set()
+        self._run_key: Optional[str] = None
+        # the lines of the current run (blank ones included) until it is long enough to be collapsed
+        self._run: List[str] = []
+        self._run_last = ""
+        self._run_length = 0
+        self._run_blank = False
+        self._omitted = 0
+        self._out: List[str] = []
+        self.chars_in = 0
+        self.chars_out = 0
+
+    def feed(self, text: str) -> str:
+        """Compress the next piece of the text; returns the output that is complete so far."""
+        self.chars_in += len(text)
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._add_line(line)
+        return self._take_output()
+
+    def flush(self) -> str:
+        """Compress the rest of the text after the last piece."""
+        if self._partial:
+            self._add_line(self._partial)
+            self._partial = ""
+        self._end_paragraph()
+        self._end_run()
+        self._emit_omitted()
+        return self._take_output()
+
+    def _take_output(self) -> str:
+        output = "".join(self._out)
+        self._out.clear()
+        self.chars_out += len(output)
+        return output
+
+    def _remember(self, key: str) -> bool:
+        """Remember a key; returns whether it was seen before."""
+        h = hash(key)
+        if h in self._seen:
+            return True
+        if len(self._seen) < MAX_SEEN:
+            self._seen.add(h)
+        return False
+
+    def _add_line(self, line: str):
+        line = _strip_noise(line)
+        if not line.strip():
+            self._end_paragraph()
+            self._filter_line(line)
+            return
+        self._paragraph.append(line)
+        if len(self._paragraph) > MAX_PARAGRAPH_LINES:
+            for paragraph_line in self._paragraph:
+                self._filter_line(paragraph_line)
+            self._paragraph.clear()
+
+    def _end_paragraph(self):
+        lines = self._paragraph
+        if not lines:
+            return
+        self._paragraph = []
+        if len(lines) > 1 and sum(map(len, lines)) >= MIN_DEDUP_CHARS:
+            if self._remember("\n".join(map(_similarity_key, lines))):
+                self._end_run()
+                self._omitted += len(lines)
+                return
+        for line in lines:
+            self._filter_line(line)
+
+    def _filter_line(self, line: str):
+        if not line.strip():
+            # blank lines inside a run or between omitted lines add nothing
+            if self._run_key is not None:
+                self._run_blank = True
+                if self._run_length < MIN_RUN_LINES:
+                    self._run.append(line)
+            elif not self._omitted:
+                self._out.append(line + "\n")
+            return
+
+        key = _similarity_key(line)
+        if key == self._run_key:
+            self._run_length += 1
+            self._run_blank = False
+            if self._run_length <= MIN_RUN_LINES:
+                self._run.append(line)
+            self._run_last = line
+            return
+        self._end_run()
+
+        if len(line.strip()) >= MIN_DEDUP_CHARS and self._remember(key):
+            self._omitted += 1
+            return
+        self._emit_omitted()
+        self._out.append(line + "\n")
+        self._run_key, self._run, self._run_last, self._run_length = key, [line], line, 1
+
+    def _end_run(self):
+        if self._run_key is None:
+            return
+        if self._run_length >= MIN_RUN_LINES:
+            self._out.append(f"[{self._run_length - 2} similar lines omitted]\n")
+            self._out.append(self._run_last + "\n")
+            if self._run_blank:
+                self._out.append("\n")
+        else:
+            # the first line was already written
+            self._out.extend(line + "\n" for line in self._run[1:])
+        self._run_key, self._run, self._run_length, self._run_blank = None, [], 0, False
+
+    def _emit_omitted(self):
+        if self._omitted:
+            self._out.append(f"[{self._omitted} repeated lines omitted]\n")
+            self._omitted = 0
+
+
+async def precompress(
+    pieces: AsyncIterable[str], precompressor: Precompressor = None
+) -> AsyncIterator[str]:
+    """Run a stream of text pieces through a Precompressor.
+
+    Args:
+        pieces (AsyncIterable[str]): Consecutive pieces of a text.
+        precompressor (Precompressor): The instance to use, e.g. to read its statistics afterwards.
+
+    Yields:
+        str: Consecutive pieces of the compressed text.
+    """
+    if precompressor is None:
+        precompressor = Precompressor()
+    async for piece in pieces:
+        output = precompressor.feed(piece)
+        if output:
+            yield output
+        # let tasks started by the consumer make progress between pieces
+        await asyncio.sleep(0)
+    output = precompressor.flush()
+    if output:
+        yield output
+    add_to_trace("precompressed_chars_removed", precompressor.chars_in - precompressor.chars_out)
+    logger.debug(
+        f"Pre-compression kept {precompressor.chars_out} of {precompressor.chars_in} characters"
+    )
@@ -1,59 +1,249 @@
 #!/usr/bin/env python3
-from tools.load_text import load_text_from_workspace_file
-from tools.helper import setup_logger, get_openai_client
-
-import tiktoken
+from array import array
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from tools.load_text import iter_text_from_workspace_file
+from tools.helper import setup_logger, get_async_openai_client
+from tools.metrics import span
+from tools.precompress import Precompressor, precompress, should_precompress
+from tools.tokens import TokenCountBounds, iter_encoded_pieces
 
 logger = setup_logger(__name__)
 
-TIKTOKEN_MODEL = "gpt-4o"
-enc = tiktoken.encoding_for_model(TIKTOKEN_MODEL)
 TOKEN_THRESHOLD = 10000
 
 MAX_FILE_SIZE = 100_000_000
 
-async def read_file(input_file: str, max_file_size: int = MAX_FILE_SIZE):
+async def read_file(
+    input_file: str,
+    max_file_size: int = MAX_FILE_SIZE,
+    client=None,
+    scheduler=None,
+    on_text: Optional[Callable[[str], None]] = None,
+    summary_tree_file: Optional[str] = None,
+    topic: Optional[str] = None,
+):
     """the enhanced workspace_read tool
     This tool reads a file from the GPTScript workspace and returns the file content.
     If the file has too many tokens, it summarizes the file content and returns the summary instead.
 
+    Args:
+        input_file (str): The workspace file to read.
+        max_file_size (int): The maximum file size to load. defaults to 100MB
+        client: The AsyncOpenAI client to summarize with; created on demand if not given.
+        scheduler: A RequestScheduler shared with other reads, so that their model calls share one concurrency limit.
+        on_text: Called with consecutive pieces of the returned text as soon as they are available,
+            e.g. to stream the final summary to stdout while it is generated.
+        summary_tree_file: Workspace file to keep the summary tree in (see tools.summary_tree), so that the next read
+            of a grown or edited file only re-summarizes what changed. Usually next to the summary file.
+        topic: Optional topic or question to focus the summary on; only the most relevant parts of the file are summarized.
+
     Raises:
         ValueError: If the INPUT_FILE environment variable is not set
         Exception: If the file content is not a valid UTF-8 encoded string
     """
 
+    logger.info(f"Input file: {input_file}")
+    if not input_file:
+        raise ValueError("Error: INPUT_FILE environment variable is not set")
+
+    with span("read_file", file=input_file) as read_span:
+        return await _read_file(
+            input_file,
+            max_file_size,
+            read_span,
+            client,
+            scheduler,
+            on_text,
+            summary_tree_file,
+            topic,
+        )
+
+
+async def _read_file(
+    input_file: str,
+    max_file_size: int,
+    read_span,
+    client,
+    scheduler,
+    on_text,
+    summary_tree_file: Optional[str],
+    topic: Optional[str],
+) -> str:
+    # stream the file: read only as far as needed to decide whether it is over TOKEN_THRESHOLD.
+    # Cheap bounds decide files that are far from the threshold; only the rest is tokenized to count exactly.
+    document_size = 0
+
+    def on_size(size: int):
+        nonlocal document_size
+        document_size = size
+
+    text_pieces = iter_text_from_workspace_file(input_file, max_file_size, on_size=on_size)
+    head_text: List[str] = []
+    bounds = TokenCountBounds()
+    async for text_piece in text_pieces:
+        head_text.append(text_piece)
+        bounds.add(text_piece, stop_above=TOKEN_THRESHOLD)
+        if bounds.lower > TOKEN_THRESHOLD or bounds.upper > TOKEN_THRESHOLD:
+            break
+    else:
+        # at most TOKEN_THRESHOLD bytes, so at most TOKEN_THRESHOLD tokens: return it without tokenizing
+        read_span.set_attribute("max_tokens", bounds.upper)
+        read_span.set_attribute("summarized", False)
+        text = "".join(head_text)
+        if on_text is not None:
+            on_text(text)
+        return text
+
+    # with pre-compression, the raw text that is tokenized only for counting is kept to be compressed later
+    precompress_enabled = should_precompress(input_file)
+    counted_text: Optional[List[str]] = [] if precompress_enabled else None
+
+    async def remaining_text() -> AsyncIterator[str]:
+        while head_text:
+            text_piece = head_text.pop(0)
+            if counted_text is not None:
+                counted_text.append(text_piece)
+            yield text_piece
+        async for text_piece in text_pieces:
+            if counted_text is not None:
+                counted_text.append(text_piece)
+            yield text_piece
+
+    token_pieces = iter_encoded_pieces(remaining_text())
+    head: List[Tuple[str, array]] = []
+    if bounds.lower <= TOKEN_THRESHOLD:
+        head_token_count = 0
+        async for text_piece, token_piece in token_pieces:
+            head.append((text_piece, token_piece))
+            head_token_count += len(token_piece)
+            if head_token_count > TOKEN_THRESHOLD:
+                break
+        else:
+            # if the file has less than TOKEN_THRESHOLD tokens, directly return the file content
+            read_span.set_attribute("tokens", head_token_count)
+            read_span.set_attribute("summarized", False)
+            text = "".join(text_piece for text_piece, _ in head)
+            if on_text is not None:
+                on_text(text)
+            return text
+
+    # if the file has too many tokens, summarize it and return the summary;
+    # the summarizer (and openai) is only imported on this path to keep small reads fast
+    from tools.cache import get_cache
+    from tools.chunking import get_chunking_strategy
+    from tools.planner import CHARS_PER_TOKEN, plan_summarization
+    from tools.summary_tree import INCREMENTAL_ENABLED, load_summary_tree, save_summary_tree
     from tools.summarizer import (
         DocumentSummarizer,
         MODEL,
-        MAX_CHUNK_TOKENS,
         MAX_WORKERS,
+        MAX_CONCURRENCY,
     )
 
-    logger.info(f"Input file: {input_file}")
-    if not input_file:
-        raise ValueError("Error: INPUT_FILE environment variable is not set")
+    cache = get_cache("summaries")
+    tree = None
+    # a summary for a topic covers only part of the file, so it does not update the summary tree
+    if summary_tree_file and INCREMENTAL_ENABLED and not topic:
+        tree = await load_summary_tree(summary_tree_file, cache)
+        cache = tree
+
+    # plan before the first call, from the document's length (its exact token count is only known at the end)
+    plan = plan_summarization(
+        MODEL,
+        max(document_size // CHARS_PER_TOKEN, bounds.lower),
+        MAX_CONCURRENCY,
+        previous=tree.previous_plan if tree is not None else None,
+    )
+    if topic:
+        read_span.set_attribute("topic", topic)
+    read_span.set_attribute("planned_chunk_tokens", plan.chunk_tokens)
+    read_span.set_attribute("planned_output_tokens", plan.output_tokens)
+    read_span.set_attribute("planned_reduction_ratio", round(plan.reduction_ratio, 1))
+    read_span.set_attribute("planned_level_calls", ",".join(map(str, plan.level_calls)))
+    read_span.set_attribute("expected_calls", plan.calls)
+    read_span.set_attribute("expected_tokens", plan.tokens)
+    read_span.set_attribute("expected_seconds", round(plan.seconds, 1))
+
+    precompressor = None
+    if precompress_enabled:
+        # start over from the raw text; the tokens counted so far are of text that is now compressed
+        async def raw_text() -> AsyncIterator[str]:
+            while counted_text:
+                yield counted_text.pop(0)
+            while head_text:
+                yield head_text.pop(0)
+            async for text_piece in text_pieces:
+                yield text_piece
+
+        precompressor = Precompressor()
+        token_pieces = iter_encoded_pieces(precompress(raw_text(), precompressor))
+        head.clear()
 
-    file_content: str = await load_text_from_workspace_file(input_file, max_file_size)
-    tokens = enc.encode(file_content)
-
-    # if the file has too many tokens, summarize it and return the summary
-    if len(tokens) > TOKEN_THRESHOLD:
-        response_str = f"The original file {input_file} contains too many tokens ({len(tokens)}), summarizing it...\n"
-        summarizer = DocumentSummarizer(
-            get_openai_client(),
-            model=MODEL,
-            max_chunk_tokens=MAX_CHUNK_TOKENS,
-            max_workers=MAX_WORKERS,
+    total_token_count = 0
+
+    async def counted_pieces() -> AsyncIterator[Tuple[str, array]]:
+        nonlocal total_token_count
+        for piece in head:
+            total_token_count += len(piece[1])
+            yield piece
+        head.clear()
+        async for piece in token_pieces:
+            total_token_count += len(piece[1])
+            yield piece
+
+    def header() -> str:
+        token_count = f"{total_token_count}"
+        if precompressor is not None and precompressor.chars_out < precompressor.chars_in:
+            token_count += " after removing repeated lines and encoded data"
+        focus = f" relevant to {topic!r}" if topic else ""
+        return (
+            f"The original file {input_file} contains too many tokens ({token_count}), summarizing it...\n"
+            f"Here is the summary of the file {input_file}'s content{focus}:\n\n"
         )
-        try:
-            final_summary: str = summarizer.summarize(file_content)
-        except Exception as e:
-            logger.error(f"Summarization failed: {e}")
-            raise Exception(f"ERROR: Summarization failed: {e}")
 
-        response_str += f"Here is the summary of the file {input_file}'s content:\n\n{final_summary}"
-        return response_str
+    on_summary_text = None
+    if on_text is not None:
+        header_sent = False
 
-    # if the file has less than TOKEN_THRESHOLD tokens, directly return the file content
-    else:
-        return file_content
\ No newline at end of file
+        def on_summary_text(summary_text: str):
+            # the final reduction starts after the whole file was read, so the token count is complete by now
+            nonlocal header_sent
+            if not header_sent:
+                header_sent = True
+                on_text(header())
+            on_text(summary_text)
+
+    summarizer = DocumentSummarizer(
+        client if client is not None else get_async_openai_client(),
+        model=MODEL,
+        max_context_tokens=plan.context_tokens,
+        max_output_tokens=plan.output_tokens,
+        max_chunk_tokens=plan.chunk_tokens,
+        max_workers=MAX_WORKERS,
+        max_concurrency=MAX_CONCURRENCY,
+        cache=cache,
+        chunking_strategy=get_chunking_strategy(input_file),
+        scheduler=scheduler,
+        summary_tree=tree,
+        topic=topic,
+        reduction_ratio=plan.reduction_ratio,
+    )
+    try:
+        final_summary: str = await summarizer.summarize_stream_async(
+            counted_pieces(), on_summary_text
+        )
+    except Exception as e:
+        logger.error(f"Summarization failed: {e}")
+        raise Exception(f"ERROR: Summarization failed: {e}")
+
+    read_span.set_attribute("tokens", total_token_count)
+    read_span.set_attribute("summarized", True)
+    if precompressor is not None:
+        read_span.set_attribute("precompressed_chars", precompressor.chars_in)
+        read_span.set_attribute("compressed_chars", precompressor.chars_out)
+    if tree is not None:
+        read_span.set_attribute("reused_summaries", tree.reused)
+        tree.chunk_tokens, tree.output_tokens = plan.chunk_tokens, plan.output_tokens
+        if not await save_summary_tree(summary_tree_file, tree):
+            logger.warning(f"Failed to save the summary tree {summary_tree_file}")
+    return header() + final_summary
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+import asyncio
+import time
+from array import array
+from typing import AsyncIterable, Callable, Dict, List, Optional, Tuple
+from tools.helper import setup_logger
+from tools.metrics import record_span, span
+from tools.planner import MAX_REDUCTION_DEPTH, get_summary_budget
+from tools.tokens import decode, encode
+
+logger = setup_logger(__name__)
+
+# summaries are measured with tiktoken, not the model's tokenizer, so they may exceed their budgets by this much
+SUMMARY_BUDGET_SLACK = 1.25
+
+
+class _Level:
+    """Summaries of one reduction level, in document order."""
+
+    def __init__(self):
+        self.tasks: List[asyncio.Task] = []
+        self.tokens: Dict[int, array] = {}
+        # summaries before this index have been merged into the next level
+        self.consumed = 0
+        # no more summaries will be added to this level
+        self.closed = False
+        self.started_at: float = None
+        self.finished_at: float = None
+
+    def add(self, task: asyncio.Future):
+        if self.started_at is None:
+            self.started_at = time.time()
+        self.tasks.append(task)
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, _):
+        self.finished_at = time.time()
+
+    def summary_tokens(self, index: int) -> array:
+        if index not in self.tokens:
+            self.tokens[index] = encode(self.tasks[index].result())
+        return self.tokens[index]
+
+
+class OrderedTreeReducer:
+    """
+    Order-preserving, incremental map-reduce over chunk summaries.
+
+    Chunks are summarized concurrently into level 1. As soon as a run of neighbouring summaries
+    at the front of a level is ready and fills a chunk, it is merged and summarized into the next level,
+    without waiting for the rest of the level. Levels therefore overlap instead of being strict barriers,
+    and the text at every level keeps the document order.
+    The reduction stops when a complete level fits in the final reduction (max_final_input_tokens); that text is returned.
+    A level's first run is only merged once the level is known not to fit, so the last merge and the final
+    reduction are never two calls back to back.
+    Runs end at the summarizer's summary tree's group ends from a previous run, if any, so that unchanged
+    summaries are merged in the same groups again.
+
+    Every call's output budget is its input's size divided by the reduction ratio (see
+    tools.planner.get_summary_budget), so each level is about that many times smaller than the one below it.
+    Budgets are capped so that two summaries always fit in a chunk: every merge combines at least two summaries,
+    and a lone summary left at the end of a level is carried up to the next level without a call.
+    Each level therefore has at most half as many summaries as the one below it; and as summaries that exceed
+    their budgets are truncated, no call's output is larger than its input. The reduction converges
+    even when summaries come out larger than planned.
+    """
+
+    def __init__(self, summarizer, separator: str = "\n\n", reduction_ratio: float = None):
+        """
+        :param summarizer: The DocumentSummarizer whose summarize_chunk_async, chunk_tokens and limits are used.
+        :param separator: The text placed between merged summaries.
+        :param reduction_ratio: How many times smaller than its input each call's output budget is
+            (default: the summarizer's reduction_ratio).
+        """
+        self.summarizer = summarizer
+        self.separator = separator
+        self.separator_token_count = len(encode(separator))
+        self.reduction_ratio = (
+            reduction_ratio if reduction_ratio is not None else summarizer.reduction_ratio
+        )
+        # the largest summary of which two still fit in a chunk
+        self.max_pair_tokens = max(1, (summarizer.max_chunk_size - self.separator_token_count) // 2)
+        self.max_summary_tokens = min(summarizer.max_output_tokens, self.max_pair_tokens)
+
+    def summary_budget(self, input_tokens: int) -> int:
+        """The output token budget of a call that summarizes input_tokens tokens."""
+        return get_summary_budget(input_tokens, self.reduction_ratio, self.max_summary_tokens)
+
+    async def reduce(self, chunks: AsyncIterable[Tuple[str, array]]) -> str:
+        """
+        :param chunks: The level-0 (chunk, chunk tokens) pairs, in document order.
+        :return: The merged summaries of the first level that fits in the final reduction.
+        """
+        levels: List[_Level] = [_Level()]
+        pending = set()
+
+        async def summarize(level_index: int, chunk: str, max_tokens: int) -> str:
+            with span("summarize_chunk", level=level_index + 1, max_tokens=max_tokens):
+                summary = await self.summarizer.summarize_chunk_async(chunk, max_tokens)
+            # a summary that ignores its budget could keep a level from shrinking; even with the slack,
+            # two summaries must fit in a chunk so that every merge combines at least two of them
+            limit = min(int(max_tokens * SUMMARY_BUDGET_SLACK), self.max_pair_tokens)
+            summary_tokens = encode(summary)
+            if len(summary_tokens) > limit:
+                logger.warning(
+                    f"Truncating a level-{level_index + 1} summary of {len(summary_tokens)} tokens "
+                    f"to {limit} tokens (its output budget is {max_tokens} tokens)"
+                )
+                summary = decode(summary_tokens[:limit])
+            return summary
+
+        def add_level(level_index: int):
+            while len(levels) <= level_index:
+                if len(levels) == MAX_REDUCTION_DEPTH:
+                    logger.warning(
+                        f"The reduction is deeper than {MAX_REDUCTION_DEPTH} levels; "
+                        f"summaries fill more of their budgets (1/{self.reduction_ratio:.1f} of their input) than planned"
+                    )
+                levels.append(_Level())
+
+        def start(level_index: int, chunk: str, chunk_token_count: int) -> asyncio.Task:
+            add_level(level_index)
+            task = asyncio.create_task(
+                summarize(level_index, chunk, self.summary_budget(chunk_token_count))
+            )
+            levels[level_index].add(task)
+            pending.add(task)
+            return task
+
+        def promote(level_index: int, summary: str):
+            # an already finished entry, so that the next level treats it like any other summary
+            add_level(level_index)
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(summary)
+            levels[level_index].add(future)
+
+        async def feed():
+            # at most max_concurrency level-1 chunks are held in memory awaiting their summaries
+            in_flight = set()
+            async for chunk, chunk_tokens in chunks:
+                while len(in_flight) >= self.summarizer.max_concurrency:
+                    _, in_flight = await asyncio.wait(
+                        in_flight, return_when=asyncio.FIRST_COMPLETED
+                    )
+                in_flight.add(start(0, chunk, len(chunk_tokens)))
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while True:
+                waiting = set(pending)
+                if not feeder.done():
+                    waiting.add(feeder)
+                if not waiting:
+                    # nothing was fed
+                    return ""
+                done, _ = await asyncio.wait(
+                    waiting, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    # re-raise the first failure
+                    task.result()
+                    pending.discard(task)
+                if feeder.done():
+                    levels[0].closed = True
+
+                result = self._advance(levels, start, promote)
+                if result is not None:
+                    for level_index, level in enumerate(levels):
+                        # levels overlap, so they are recorded after the fact
+                        record_span(
+                            "reduction_level",
+                            level.started_at,
+                            level.finished_at,
+                            level=level_index + 1,
+                            summaries=len(level.tasks),
+                        )
+                    return result
+        finally:
+            feeder.cancel()
+            for task in pending:
+                task.cancel()
+
+    def _exceeds_final_input(self, level: _Level) -> bool:
+        """Whether the finished summaries of a level are already too large for the final reduction."""
+        tokens = -self.separator_token_count
+        for index, task in enumerate(level.tasks):
+            if task.done():
+                tokens += len(level.summary_tokens(index)) + self.separator_token_count
+                if tokens > self.summarizer.max_final_input_tokens:
+                    return True
+        return False
+
+    def _advance(
+        self,
+        levels: List[_Level],
+        start: Callable[[int, str, int], asyncio.Task],
+        promote: Callable[[int, str], None],
+    ) -> Optional[str]:
+        """
+        Merge every ready, full run of summaries into the next level.
+        Returns the final text once a complete level fits in the final reduction.
+        """
+        max_chunk_size = self.summarizer.max_chunk_size
+        # a run is full once the largest possible next summary might not fit
+        full_threshold = max_chunk_size - self.max_summary_tokens - self.separator_token_count
+        tree = self.summarizer.summary_tree
+
+        level_index = 0
+        while level_index < len(levels):
+            level = levels[level_index]
+            if level.consumed == 0 and not self._exceeds_final_input(level):
+                if level.closed and all(task.done() for task in level.tasks):
+                    if self.summarizer.verbose:
+                        logger.debug(
+                            f"Level {level_index + 1} fits in the final reduction ({len(level.tasks)} summaries)"
+                        )
+                    return self.separator.join(task.result() for task in level.tasks)
+                # the level may still turn out to fit in the final reduction, so none of it is merged yet;
+                # nothing was started above it
+                return None
+            while True:
+                position = level.consumed
+                group_tokens = 0
+                # the run ends where its size or the summary tree says so, never where a summary happens to be
+                # unfinished, so that the same summaries are always merged in the same groups
+                ended = False
+                while position < len(level.tasks) and level.tasks[position].done():
+                    added = len(level.summary_tokens(position))
+                    if position > level.consumed:
+                        added += self.separator_token_count
+                    if position > level.consumed and group_tokens + added > max_chunk_size:
+                        ended = True
+                        break
+                    group_tokens += added
+                    position += 1
+                    if position - level.consumed > 1 and group_tokens > full_threshold:
+                        ended = True
+                        break
+                    if (
+                        tree is not None
+                        and position - level.consumed > 1
+                        and tree.is_group_end(level.tasks[position - 1].result())
+                    ):
+                        ended = True
+                        break
+
+                if position == level.consumed:
+                    break
+
+                complete = level.closed and position == len(level.tasks)
+                if position - level.consumed == 1 and group_tokens > max_chunk_size:
+                    # a single summary larger than a chunk is split on its own
+                    for piece in self.summarizer.chunk_tokens(
+                        level.summary_tokens(level.consumed)
+                    ):
+                        start(level_index + 1, self.summarizer.enc.decode(piece), len(piece))
+                elif complete and position - level.consumed == 1 and not ended:
+                    # summarizing the last summary on its own would barely shrink the level
+                    if self.summarizer.verbose:
+                        logger.debug(
+                            f"Carrying the last level-{level_index + 1} summary up to level {level_index + 2}"
+                        )
+                    promote(level_index + 1, level.tasks[level.consumed].result())
+                elif ended or complete:
+                    group = [
+                        level.tasks[i].result() for i in range(level.consumed, position)
+                    ]
+                    if self.summarizer.verbose:
+                        logger.debug(
+                            f"Merging {len(group)} level-{level_index + 1} summaries into level {level_index + 2}"
+                        )
+                    if tree is not None:
+                        tree.add_group_end(group[-1])
+                    start(level_index + 1, self.separator.join(group), group_tokens)
+                else:
+                    break
+
+                for i in range(level.consumed, position):
+                    level.tokens.pop(i, None)
+                level.consumed = position
+
+            if (
+                level.closed
+                and level.consumed == len(level.tasks)
+                and level_index + 1 < len(levels)
+            ):
+                levels[level_index + 1].closed = True
+            level_index += 1
+
+        return None
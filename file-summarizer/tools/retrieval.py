@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import math
+import re
+from array import array
+from typing import AsyncIterable, Dict, List, Optional, Tuple
+from tools.chunking import ChunkingStrategy
+from tools.helper import setup_logger
+from tools.metrics import add_to_trace, span
+from tools.tokens import decode
+
+logger = setup_logger(__name__)
+
+# size of the passages that are ranked against the topic
+PASSAGE_TOKENS = 1000
+BM25_K1 = 1.5
+BM25_B = 0.75
+STOPWORDS = frozenset(
+    "a an and are as at be by can did do does for from has have how i in is it its of on or "
+    "that the their there this to was were what when where which who why will with".split()
+)
+_WORD = re.compile(r"\w+")
+_SUFFIX = re.compile(r"(?:ing|ed|es|s)$")
+
+
+def query_terms(query: str) -> List[str]:
+    """The distinct search terms of a query: lower-cased words without stopwords, stripped of common suffixes."""
+    terms = []
+    for word in _WORD.findall(query.lower()):
+        if word in STOPWORDS:
+            continue
+        stem = _SUFFIX.sub("", word)
+        term = stem if len(stem) >= 3 else word
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+class BM25Index:
+    """
+    A minimal Okapi BM25 index over passages, for one query.
+
+    Only the frequencies of the query's terms are kept per passage, so a whole large document can be indexed
+    in a single streaming pass with little memory. A term matches words that start with it (so "error" matches
+    "errors"), case-insensitively. Passage lengths are measured in tokens.
+    """
+
+    def __init__(self, query: str, k1: float = BM25_K1, b: float = BM25_B):
+        """
+        :param query: The topic or question passages are ranked against.
+        :param k1: Term frequency saturation.
+        :param b: Passage length normalization.
+        """
+        self.terms = query_terms(query)
+        self.k1 = k1
+        self.b = b
+        self._pattern = (
+            re.compile(
+                r"\b(?:" + "|".join(f"({re.escape(term)})" for term in self.terms) + r")\w*",
+                re.IGNORECASE,
+            )
+            if self.terms
+            else None
+        )
+        self.term_counts: List[Dict[int, int]] = []
+        self.lengths: List[int] = []
+        self.document_frequencies = [0] * len(self.terms)
+
+    def add(self, text: str, length: int) -> None:
+        """Index the next passage.
+
+        :param text: The passage.
+        :param length: Its length in tokens.
+        """
+        counts: Dict[int, int] = {}
+        if self._pattern is not None:
+            for match in self._pattern.finditer(text):
+                term = match.lastindex - 1
+                counts[term] = counts.get(term, 0) + 1
+        for term in counts:
+            self.document_frequencies[term] += 1
+        self.term_counts.append(counts)
+        self.lengths.append(length)
+
+    def scores(self) -> List[float]:
+        """The BM25 score of every passage, in the order they were added."""
+        passages = len(self.lengths)
+        if passages == 0:
+            return []
+        average_length = sum(self.lengths) / passages or 1
+        idf = [
+            math.log((passages - df + 0.5) / (df + 0.5) + 1) for df in self.document_frequencies
+        ]
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / average_length)
+            scores.append(
+                sum(idf[term] * tf * (self.k1 + 1) / (tf + norm) for term, tf in counts.items())
+            )
+        return scores
+
+
+async def select_relevant_passages(
+    token_pieces: AsyncIterable[Tuple[str, array]],
+    query: str,
+    chunking_strategy: ChunkingStrategy,
+    token_budget: int,
+    passage_tokens: int = PASSAGE_TOKENS,
+    separator_tokens: int = 0,
+) -> Tuple[List[array], Optional[List[int]]]:
+    """Split a document into passages and pick the ones most relevant to a query, within a token budget.
+
+    Args:
+        token_pieces (AsyncIterable[Tuple[str, array]]): The document's (text, tokens) pieces.
+        query (str): The topic or question.
+        chunking_strategy (ChunkingStrategy): Where passages are cut.
+        token_budget (int): Maximum total tokens of the selected passages.
+        passage_tokens (int): Maximum tokens per passage.
+        separator_tokens (int): Tokens to set aside per selected passage, for what is placed between them.
+
+    Returns:
+        Tuple[List[array], Optional[List[int]]]: The tokens of all passages, and the indices of the selected ones
+            in document order, or None if no passage matches the query at all.
+    """
+    with span("retrieval", passage_tokens=passage_tokens, token_budget=token_budget) as retrieval_span:
+        index = BM25Index(query)
+        passages: List[array] = []
+
+        def add(passage: array):
+            passages.append(passage)
+            index.add(decode(passage), len(passage))
+
+        buffered = array("I")
+        async for _, piece_tokens in token_pieces:
+            buffered.extend(piece_tokens)
+            # passages are small, so the buffer is only trimmed once per piece
+            start = 0
+            while len(buffered) - start > passage_tokens:
+                end = start + chunking_strategy.chunk_end(
+                    buffered[start : start + passage_tokens + 1], passage_tokens
+                )
+                add(buffered[start:end])
+                start = end
+            del buffered[:start]
+        if len(buffered) > 0:
+            add(buffered)
+
+        scores = index.scores()
+        ranked = sorted(
+            (i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i]
+        )
+        selected = []
+        total_tokens = 0
+        for i in ranked:
+            if total_tokens + len(passages[i]) + separator_tokens > token_budget:
+                continue
+            selected.append(i)
+            total_tokens += len(passages[i]) + separator_tokens
+
+        retrieval_span.set_attribute("terms", len(index.terms))
+        retrieval_span.set_attribute("passages", len(passages))
+        retrieval_span.set_attribute("matching_passages", len(ranked))
+        retrieval_span.set_attribute("selected_passages", len(selected))
+        retrieval_span.set_attribute("selected_tokens", total_tokens)
+        add_to_trace("retrieved_passages", len(selected))
+        if not selected:
+            logger.info(f"No passage matches {query!r}")
+            return passages, None
+        logger.info(
+            f"Selected {len(selected)} of {len(passages)} passages ({total_tokens} tokens) relevant to {query!r}"
+        )
+        return passages, sorted(selected)
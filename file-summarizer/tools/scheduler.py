@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import Awaitable, Callable, Mapping, Optional
+import openai
+from tools.helper import setup_logger
+from tools.metrics import add_to_trace, current_span
+
+logger = setup_logger(__name__)
+
+MAX_RETRIES = int(os.getenv("FILE_SUMMARIZER_MAX_RETRIES", "6"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# optional client-side budgets, for providers that do not send rate limit headers
+REQUESTS_PER_MINUTE = int(os.getenv("FILE_SUMMARIZER_RPM", "0")) or None
+TOKENS_PER_MINUTE = int(os.getenv("FILE_SUMMARIZER_TPM", "0")) or None
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+# 429s that waiting cannot fix: the account is out of quota, or one request needs more than the whole
+# tokens-per-minute limit ("Request too large for gpt-4o ... on tokens per min (TPM): Limit 30000, Requested 50000")
+_QUOTA_ERROR_CODES = ("insufficient_quota",)
+_REQUEST_TOO_LARGE = re.compile(r"request too large", re.IGNORECASE)
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse a rate limit reset header value such as "20ms", "1s" or "6m0s" into seconds.
+
+    Args:
+        value (Optional[str]): The header value.
+
+    Returns:
+        Optional[float]: The duration in seconds, or None if it cannot be parsed.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    if headers is None:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    return parse_reset_duration(headers.get("retry-after"))
+
+
+def _is_permanent_rate_limit(error: openai.RateLimitError) -> bool:
+    body = error.body if isinstance(error.body, dict) else {}
+    if error.code in _QUOTA_ERROR_CODES or body.get("type") in _QUOTA_ERROR_CODES:
+        return True
+    return bool(_REQUEST_TOO_LARGE.search(f"{body.get('message') or ''} {error.message}"))
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, openai.RateLimitError):
+        return not _is_permanent_rate_limit(error)
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409) or error.status_code >= 500
+    return False
+
+
+class _Budget:
+    """A requests- or tokens-per-minute budget, fed by response headers or a configured limit."""
+
+    def __init__(self, per_minute: Optional[int] = None):
+        self.per_minute = per_minute
+        # sliding window of (timestamp, amount) for the configured limit
+        self.window = deque()
+        self.window_total = 0
+        # last values reported by the provider
+        self.remaining: Optional[float] = None
+        self.reset_at = 0.0
+
+    def update(self, limit: Optional[str], remaining: Optional[str], reset: Optional[str]):
+        try:
+            if remaining is not None:
+                self.remaining = float(remaining)
+            if limit is not None and self.per_minute is None:
+                self.per_minute = int(limit)
+        except ValueError:
+            return
+        reset_seconds = parse_reset_duration(reset)
+        if reset_seconds is not None:
+            self.reset_at = time.monotonic() + reset_seconds
+
+    def delay(self, amount: int) -> float:
+        """Seconds to wait before `amount` can be spent."""
+        now = time.monotonic()
+        if self.remaining is not None and now < self.reset_at and self.remaining < amount:
+            return self.reset_at - now
+        if self.per_minute is None:
+            return 0.0
+        while self.window and now - self.window[0][0] >= 60:
+            self.window_total -= self.window.popleft()[1]
+        if not self.window or self.window_total + amount <= self.per_minute:
+            return 0.0
+        return 60 - (now - self.window[0][0])
+
+    def spend(self, amount: int):
+        self.window.append((time.monotonic(), amount))
+        self.window_total += amount
+        if self.remaining is not None:
+            self.remaining -= amount
+
+
+class RequestScheduler:
+    """
+    Schedules model requests under the provider's rate limits.
+
+    - Waits for request-per-minute and token-per-minute budget, taken from the x-ratelimit-* response
+      headers or from FILE_SUMMARIZER_RPM / FILE_SUMMARIZER_TPM.
+    - Retries 429, 408, 409, 5xx and connection errors with jittered exponential backoff,
+      honouring retry-after headers. 429s for an exhausted quota or a request larger than the token
+      limit are raised at once, as no wait makes them succeed.
+    - Adapts concurrency (AIMD): the in-flight limit is halved on every 429 and grows back by
+      one request per limit's worth of successes, up to max_concurrency.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_retries: int = MAX_RETRIES,
+        requests_per_minute: Optional[int] = REQUESTS_PER_MINUTE,
+        tokens_per_minute: Optional[int] = TOKENS_PER_MINUTE,
+        verbose: bool = True,
+    ):
+        """
+        :param max_concurrency: Upper bound on in-flight requests.
+        :param max_retries: How many times a failed request is retried before giving up.
+        :param requests_per_minute: Client-side request budget (default: from headers only).
+        :param tokens_per_minute: Client-side token budget (default: from headers only).
+        :param verbose: Whether to log throttling and retries.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.verbose = verbose
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self.requests = _Budget(requests_per_minute)
+        self.tokens = _Budget(tokens_per_minute)
+        self._condition = None
+        self._condition_loop = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # created lazily so that it is bound to the running event loop
+        loop = asyncio.get_running_loop()
+        if self._condition_loop is not loop:
+            self._condition = asyncio.Condition()
+            self._condition_loop = loop
+            self.in_flight = 0
+        return self._condition
+
+    async def _acquire(self, estimated_tokens: int):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(
+                lambda: self.in_flight < max(1, int(self.concurrency_limit))
+            )
+            self.in_flight += 1
+        try:
+            while True:
+                delay = max(self.requests.delay(1), self.tokens.delay(estimated_tokens))
+                if delay <= 0:
+                    break
+                if self.verbose:
+                    logger.debug(f"Rate limit budget exhausted, waiting {delay:.2f}s")
+                add_to_trace("throttled_seconds", delay)
+                await asyncio.sleep(delay)
+        except BaseException:
+            await self._release()
+            raise
+        self.requests.spend(1)
+        self.tokens.spend(estimated_tokens)
+
+    async def _release(self):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def _record_headers(self, headers: Mapping[str, str]):
+        if headers is None:
+            return
+        self.requests.update(
+            headers.get("x-ratelimit-limit-requests"),
+            headers.get("x-ratelimit-remaining-requests"),
+            headers.get("x-ratelimit-reset-requests"),
+        )
+        self.tokens.update(
+            headers.get("x-ratelimit-limit-tokens"),
+            headers.get("x-ratelimit-remaining-tokens"),
+            headers.get("x-ratelimit-reset-tokens"),
+        )
+
+    async def run(self, request: Callable[[], Awaitable], estimated_tokens: int = 0):
+        """
+        Run a request under the rate limits, retrying it on transient failures.
+
+        :param request: Makes the request and returns a raw response (e.g. from `with_raw_response.create`).
+        :param estimated_tokens: Prompt plus maximum completion tokens, counted against the token budget.
+        :return: The parsed response.
+        """
+        attempt = 0
+        while True:
+            await self._acquire(estimated_tokens)
+            try:
+                raw_response = await request()
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            finally:
+                await self._release()
+
+            if error is None:
+                self._record_headers(raw_response.headers)
+                self.concurrency_limit = min(
+                    float(self.max_concurrency),
+                    self.concurrency_limit + 1 / max(1.0, self.concurrency_limit),
+                )
+                return raw_response.parse()
+
+            headers = getattr(getattr(error, "response", None), "headers", None)
+            self._record_headers(headers)
+            retryable = _is_retryable(error)
+            if isinstance(error, openai.RateLimitError) and retryable:
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+            if not retryable or attempt >= self.max_retries:
+                raise error
+            attempt += 1
+            call_span = current_span()
+            if call_span is not None:
+                call_span.set_attribute("retries", attempt)
+            add_to_trace("retries", 1)
+            delay = _retry_after_seconds(headers)
+            if delay is None:
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+                # full jitter, so that concurrent retries do not fire together
+                delay = random.uniform(0, delay)
+            if self.verbose:
+                logger.debug(
+                    f"Request failed ({error.__class__.__name__}), retry {attempt}/{self.max_retries} in {delay:.2f}s; "
+                    f"concurrency limit {int(self.concurrency_limit)}"
+                )
+            await asyncio.sleep(delay)
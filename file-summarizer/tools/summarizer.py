@@ -1,28 +1,46 @@
 #!/usr/bin/env python3
-import tiktoken
-from typing import List
-import concurrent.futures
+from array import array
+from typing import AsyncIterable, AsyncIterator, Callable, List, Optional, Tuple
+import asyncio
 import os
+import time
+from openai import AsyncOpenAI
 from tools.helper import setup_logger
+from tools.cache import make_cache_key
+from tools.reduction import OrderedTreeReducer
+from tools.retrieval import select_relevant_passages
+from tools.scheduler import RequestScheduler
+from tools.metrics import add_to_trace, current_span, span
+from tools.planner import get_reduction_ratio, get_working_limits
+from tools.chunking import ChunkingStrategy, TextChunkingStrategy
+from tools.tokens import decode, encode, get_encoder
 
 logger = setup_logger(__name__)
 
-MAX_CONTEXT_TOKENS = 128000
-MAX_OUTPUT_TOKENS = 16384
+MODEL = os.getenv("OBOT_DEFAULT_LLM_MODEL", "gpt-4o")
+# the working limits of MODEL; tools.planner.plan_summarization picks smaller chunks and outputs per document
+MAX_CONTEXT_TOKENS, MAX_OUTPUT_TOKENS = get_working_limits(MODEL)
 OVERHEAD_TOKENS = 2000
 MAX_CHUNK_TOKENS = MAX_CONTEXT_TOKENS - MAX_OUTPUT_TOKENS - OVERHEAD_TOKENS
 CHUNK_OVERLAP_TOKENS = 0
 MAX_WORKERS = 4
+# upper bound on in-flight model calls when using an AsyncOpenAI client
+MAX_CONCURRENCY = int(os.getenv("FILE_SUMMARIZER_MAX_CONCURRENCY", "32"))
 
-MODEL = os.getenv("OBOT_DEFAULT_LLM_MODEL", "gpt-4o")
-TIKTOKEN_MODEL = "gpt-4o"
+# bump whenever the summarization prompts change so that cached summaries are not reused
+PROMPT_VERSION = "1"
+# placed between passages that are not adjacent in the document when summarizing for a topic
+PASSAGE_GAP = "\n\n[...]\n\n"
 
 
 class DocumentSummarizer:
     """
-    Summarizes very large documents with hierarchical chunking using gpt-4o.
-    Supports parallel calls to speed up summarization.
-    Optionally uses a 'topic' for specialized focus and structure.
+    Summarizes very large documents with hierarchical chunking using MODEL (default: gpt-4o).
+    Supports parallel calls to speed up summarization. The engine is asyncio-native:
+    pass an AsyncOpenAI client and await summarize_async() to keep many chunk calls in flight
+    without a thread per request. A blocking OpenAI client still works; its calls are run in threads.
+    Optionally uses a 'topic' for specialized focus: only the passages most relevant to it (ranked locally
+    with BM25, see tools.retrieval) are summarized, with prompts that focus on it.
     """
 
     def __init__(
@@ -35,29 +53,66 @@ class DocumentSummarizer:
         max_chunk_tokens: int = MAX_CHUNK_TOKENS,
         chunk_overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
         max_workers: int = MAX_WORKERS,
+        max_concurrency: int = None,
+        cache=None,
+        chunking_strategy: ChunkingStrategy = None,
+        scheduler: RequestScheduler = None,
+        max_final_input_tokens: int = None,
+        summary_tree=None,
+        topic: str = None,
+        topic_token_budget: int = None,
+        reduction_ratio: float = None,
         verbose: bool = True,
     ):
         """
-        :param client: An OpenAI() client instance (from openai import OpenAI).
+        :param client: An OpenAI() or AsyncOpenAI() client instance.
         :param model: Model name (e.g., 'gpt-4o')
-        :param max_context_tokens: Maximum context length for GPT-4o (default: 128000).
-        :param max_output_tokens: Maximum tokens GPT-4o can generate (default: 16384).
+        :param max_context_tokens: Maximum context length of the model (default: MAX_CONTEXT_TOKENS, from tools.planner.get_working_limits).
+        :param max_output_tokens: Maximum tokens the model generates per call (default: MAX_OUTPUT_TOKENS).
         :param overhead_tokens: Token buffer for system/developer instructions, etc. (default: 2000).
         :param max_chunk_tokens: Maximum tokens per chunk (default: max_context_tokens - max_output_tokens - overhead_tokens).
-        :param max_workers: Number of parallel threads for summarization calls (default: 4).
+        :param max_workers: Number of parallel threads for summarization calls with a blocking client (default: 4).
+        :param max_concurrency: Maximum number of in-flight model calls (default: MAX_CONCURRENCY for an async client, max_workers otherwise).
+        :param cache: Optional cache (e.g. tools.cache.SQLiteLRUCache) for chunk and final summaries.
+        :param chunking_strategy: Where chunks are cut (default: TextChunkingStrategy; see tools.chunking.get_chunking_strategy).
+        :param scheduler: Rate-limit aware scheduler for model calls (default: a RequestScheduler bounded by max_concurrency).
+        :param max_final_input_tokens: Maximum tokens given to the final reduction. Documents and reduction levels up to this size
+            go to the final reduction in a single call instead of being merged first (default: max_context_tokens - max_output_tokens - overhead_tokens).
+        :param summary_tree: Optional tools.summary_tree.SummaryTree of a previous run, whose chunk cuts and merge groups are reused
+            where the document did not change; pass it as the cache too to reuse its summaries.
+        :param topic: Optional topic or question to focus the summary on.
+        :param topic_token_budget: With a topic, the maximum tokens of the passages that are summarized (default: max_final_input_tokens,
+            i.e. a single call).
+        :param reduction_ratio: How many times smaller than its input each chunk or merge call's output budget is
+            (default: from tools.planner.get_reduction_ratio; raised per document when its size is known).
         :param verbose: Whether to print additional logs and progress information.
         """
         self.client = client
+        self.cache = cache
+        self.summary_tree = summary_tree
+        self.topic = topic or None
+        self.chunking_strategy = (
+            chunking_strategy if chunking_strategy is not None else TextChunkingStrategy()
+        )
         self.model = model
         self.max_context_tokens = max_context_tokens
         self.max_output_tokens = max_output_tokens
         self.overhead_tokens = overhead_tokens
         self.max_workers = max_workers
+        self.is_async_client = isinstance(client, AsyncOpenAI)
+        if max_concurrency is None:
+            max_concurrency = MAX_CONCURRENCY if self.is_async_client else max_workers
+        self.max_concurrency = max_concurrency
+        self.scheduler = (
+            scheduler
+            if scheduler is not None
+            else RequestScheduler(max_concurrency, verbose=verbose)
+        )
         self.verbose = verbose
         self.chunk_overlap_tokens = chunk_overlap_tokens
 
         # always use gpt-4o for tokenization
-        self.enc = tiktoken.encoding_for_model(TIKTOKEN_MODEL)
+        self.enc = get_encoder()
 
         self.max_chunk_size = (
             max_chunk_tokens
@@ -67,6 +122,25 @@ class DocumentSummarizer:
             )
         )
 
+        self.max_final_input_tokens = max(
+            self.max_chunk_size,
+            max_final_input_tokens
+            if max_final_input_tokens is not None
+            else self.max_context_tokens - self.max_output_tokens - self.overhead_tokens,
+        )
+
+        self.reduction_ratio = (
+            reduction_ratio
+            if reduction_ratio is not None
+            else get_reduction_ratio(
+                0, self.max_chunk_size, self.max_output_tokens, self.max_final_input_tokens
+            )
+        )
+
+        self.topic_token_budget = (
+            topic_token_budget if topic_token_budget is not None else self.max_final_input_tokens
+        )
+
         if self.max_chunk_size <= 0:
             raise ValueError(
                 "Calculated or provided max_chunk_size is non-positive. "
@@ -79,30 +153,93 @@ class DocumentSummarizer:
             logger.debug(f"max_output_tokens: {self.max_output_tokens}")
             logger.debug(f"overhead_tokens: {self.overhead_tokens}")
             logger.debug(f"max_chunk_size: {self.max_chunk_size}")
+            logger.debug(f"max_final_input_tokens: {self.max_final_input_tokens}")
+            logger.debug(f"reduction_ratio: {self.reduction_ratio:.1f}")
             logger.debug(f"max_workers: {self.max_workers}")
+            logger.debug(f"max_concurrency: {self.max_concurrency}")
+            logger.debug(f"chunking_strategy: {self.chunking_strategy.name}")
+            if self.topic:
+                logger.debug(f"topic: {self.topic} (token budget {self.topic_token_budget})")
 
-    def chunk_text(self, text: str) -> List[str]:
+    def chunk_text(self, text: str, tokens: array = None) -> List[str]:
         """
         Splits text into token-based chunks, ensuring each chunk fits within
         (max_context_tokens - overhead_tokens - max_output_tokens).
+        Pass the text's tokens if they are already known to skip re-encoding it.
         """
-        tokens = self.enc.encode(text)
-        chunks = []
+        if tokens is None:
+            tokens = encode(text)
 
         if self.verbose:
             logger.debug(f"Total tokens in document: {len(tokens)}")
             logger.debug("Splitting into chunks...")
 
-        for i in range(0, len(tokens), self.max_chunk_size - self.chunk_overlap_tokens):
-            chunk_slice = tokens[i : i + self.max_chunk_size]
-            chunk_text = self.enc.decode(chunk_slice)
-            chunks.append(chunk_text)
+        chunks = [decode(chunk_slice) for chunk_slice in self.chunk_tokens(tokens)]
 
         if self.verbose:
             logger.debug(f"Created {len(chunks)} chunk(s).")
 
         return chunks
 
+    def chunk_tokens(self, tokens: array) -> List[array]:
+        """
+        Splits a token array into slices of at most max_chunk_size tokens,
+        cut where self.chunking_strategy finds the best boundary.
+        """
+        chunking_start = time.perf_counter()
+        chunks = []
+        start = 0
+        while start < len(tokens):
+            end = start + self.chunking_strategy.chunk_end(
+                tokens[start : start + self.max_chunk_size + 1], self.max_chunk_size
+            )
+            chunks.append(tokens[start:end])
+            if end == len(tokens):
+                break
+            start = self._next_chunk_start(start, end)
+        add_to_trace("chunking_seconds", time.perf_counter() - chunking_start)
+        add_to_trace("chunks", len(chunks))
+        return chunks
+
+    def _next_chunk_start(self, start: int, end: int) -> int:
+        return max(end - self.chunk_overlap_tokens, start + 1)
+
+    async def chunk_stream(
+        self, token_pieces: AsyncIterable[Tuple[str, array]]
+    ) -> AsyncIterator[Tuple[str, array]]:
+        """
+        Streaming chunk_text: consumes (text, tokens) pieces, e.g. from tools.tokens.iter_encoded_pieces,
+        and yields (chunk, chunk_tokens) as soon as more than max_chunk_size tokens are buffered.
+        """
+        buffered = array("I")
+        async for _, piece_tokens in token_pieces:
+            buffered.extend(piece_tokens)
+            while len(buffered) > self.max_chunk_size:
+                yield self._take_chunk(buffered)
+        while len(buffered) > 0:
+            yield self._take_chunk(buffered)
+
+    def _take_chunk(self, buffered: array) -> Tuple[str, array]:
+        """
+        Cut the next chunk off the front of buffered; everything is taken if it fits in a chunk,
+        unless the summary tree knows an earlier cut.
+        """
+        chunking_start = time.perf_counter()
+        window = buffered[: self.max_chunk_size + 1]
+        end = None
+        if self.summary_tree is not None:
+            end = self.summary_tree.find_chunk_end(buffered, self.max_chunk_size)
+        if end is None:
+            end = self.chunking_strategy.chunk_end(window, self.max_chunk_size)
+        chunk_tokens = buffered[:end]
+        chunk = decode(chunk_tokens)
+        add_to_trace("chunking_seconds", time.perf_counter() - chunking_start)
+        add_to_trace("chunks", 1)
+        if self.summary_tree is not None:
+            self.summary_tree.add_chunk(buffered, end)
+        del buffered[: end if end == len(buffered) else self._next_chunk_start(0, end)]
+        return chunk, chunk_tokens
+
     def chat_completion(
         self,
         system_prompt: str,
@@ -121,12 +258,162 @@ class DocumentSummarizer:
         )
         return response.choices[0].message.content.strip()
 
+    async def chat_completion_async(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int = MAX_OUTPUT_TOKENS,
+        temperature: float = 0.1,
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        """
+        Awaitable chat_completion. Calls go through self.scheduler, which bounds concurrency,
+        waits for rate limit budget and retries transient failures.
+        With on_text, the completion is streamed and on_text is called with each piece of text as it arrives
+        (with a blocking client, once with the whole text). Only failures before the first token are retried.
+        """
+        # the scheduler does the retrying
+        create = self.client.with_options(max_retries=0).chat.completions.with_raw_response.create
+        kwargs = dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        stream = on_text is not None and self.is_async_client
+        if stream:
+            kwargs.update(stream=True, stream_options={"include_usage": True})
+
+        async def request():
+            if self.is_async_client:
+                return await create(**kwargs)
+            return await asyncio.to_thread(create, **kwargs)
+
+        # rough prompt size (~4 characters per token) plus the completion budget
+        estimated_tokens = (len(system_prompt) + len(user_prompt)) // 4 + max_tokens
+        start = time.perf_counter()
+        response = await self.scheduler.run(request, estimated_tokens)
+        add_to_trace("model_calls", 1)
+        if stream:
+            return await self._read_stream(response, on_text, start)
+
+        self._record_usage(getattr(response, "usage", None))
+        content = response.choices[0].message.content.strip()
+        if on_text is not None:
+            on_text(content)
+        return content
+
+    async def _read_stream(
+        self, stream, on_text: Callable[[str], None], start: float
+    ) -> str:
+        """
+        Pass the text of a streamed completion to on_text as it arrives, and return all of it.
+        """
+        parts = []
+        usage = None
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            for choice in chunk.choices:
+                delta = choice.delta.content
+                if not parts:
+                    # like the stripped non-streamed text, drop leading whitespace
+                    delta = (delta or "").lstrip()
+                    if not delta:
+                        continue
+                    call_span = current_span()
+                    if call_span is not None:
+                        call_span.set_attribute(
+                            "first_token_seconds", time.perf_counter() - start
+                        )
+                if delta:
+                    parts.append(delta)
+                    on_text(delta)
+        self._record_usage(usage)
+        return "".join(parts).strip()
+
+    def _record_usage(self, usage):
+        if usage is None:
+            return
+        call_span = current_span()
+        if call_span is not None:
+            call_span.set_attribute("prompt_tokens", usage.prompt_tokens)
+            call_span.set_attribute("completion_tokens", usage.completion_tokens)
+        add_to_trace("prompt_tokens", usage.prompt_tokens)
+        add_to_trace("completion_tokens", usage.completion_tokens)
+
+    async def _cached_chat_completion(
+        self,
+        kind: str,
+        text: str,
+        system_prompt: str,
+        user_prompt: str,
+        on_text: Optional[Callable[[str], None]] = None,
+        max_tokens: int = None,
+    ) -> str:
+        """
+        chat_completion_async, memoized in self.cache by a hash of the text, model, prompt version and output limit.
+        A cached result is passed to on_text in one piece.
+        max_tokens defaults to max_output_tokens.
+        """
+        if max_tokens is None:
+            max_tokens = self.max_output_tokens
+        with span("model_call", kind=kind, input_chars=len(text), max_tokens=max_tokens) as call_span:
+            if self.cache is None:
+                return await self.chat_completion_async(
+                    system_prompt,
+                    user_prompt,
+                    max_tokens=max_tokens,
+                    temperature=0.1,
+                    on_text=on_text,
+                )
+
+            key = make_cache_key(
+                kind,
+                PROMPT_VERSION,
+                self.model,
+                max_tokens,
+                *([self.topic] if self.topic else []),
+                text,
+            )
+            cached = self.cache.get(key)
+            if cached is not None:
+                if self.verbose:
+                    logger.debug(f"Cache hit for {kind} summary {key[:12]}")
+                call_span.set_attribute("cache_hit", True)
+                add_to_trace("cache_hits", 1)
+                if on_text is not None:
+                    on_text(cached)
+                return cached
+
+            result = await self.chat_completion_async(
+                system_prompt,
+                user_prompt,
+                max_tokens=max_tokens,
+                temperature=0.1,
+                on_text=on_text,
+            )
+            self.cache.set(key, result)
+            return result
+
     def summarize_chunk(self, chunk: str) -> str:
         """
         Summarizes a single chunk using an intensive, detail-preserving prompt.
         """
+        return asyncio.run(self.summarize_chunk_async(chunk))
+
+    async def summarize_chunk_async(self, chunk: str, max_tokens: int = None) -> str:
+        """
+        Awaitable summarize_chunk.
+        :param max_tokens: The output token budget of this call (default: max_output_tokens).
+        """
+        if max_tokens is None:
+            max_tokens = self.max_output_tokens
         system_prompt = f"""You are an expert in information preservation and technical documentation.
-Your task is to create a dense, detailed retention of the input content with less than {self.max_output_tokens // 2} words.
+Your task is to create a dense, detailed retention of the input content with less than {max_tokens // 2} words.
 
 Critical rules:
 
@@ -156,35 +443,43 @@ Critical rules:
 3. Use direct quotes where precision matters
 4. Maintain hierarchical structure if it exists
 5. Keep lists, tables, or structured data in original format if feasible"""
+        if self.topic:
+            system_prompt += f"""
+
+The reader is interested in: {self.topic}
+Preserve everything relevant to it in full detail; condense the rest to a brief mention."""
 
         user_prompt = f"""content to summarize:
 
 {chunk}
 """
 
-        return self.chat_completion(
-            system_prompt,
-            user_prompt,
-            max_tokens=self.max_output_tokens,
-            temperature=0.1,
+        return await self._cached_chat_completion(
+            "chunk", chunk, system_prompt, user_prompt, max_tokens=max_tokens
         )
 
     def summarize_chunks_in_parallel(self, chunks: List[str]) -> List[str]:
         """
-        Summarize multiple chunks in parallel using ThreadPoolExecutor.
+        Summarize multiple chunks in parallel.
+        """
+        return asyncio.run(self.summarize_chunks_in_parallel_async(chunks))
+
+    async def summarize_chunks_in_parallel_async(self, chunks: List[str]) -> List[str]:
+        """
+        Summarize multiple chunks concurrently on the event loop, bounded by max_concurrency.
+        The summaries are returned in the same order as the chunks.
         """
         if self.verbose:
             logger.debug("Starting multi-pass summarization...")
-        summaries = []
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=self.max_workers
-        ) as executor:
-            # Dispatch summarization tasks
-            future_to_chunk = {
-                executor.submit(self.summarize_chunk, chunk): chunk for chunk in chunks
-            }
-            for future in concurrent.futures.as_completed(future_to_chunk):
-                summaries.append(future.result())
+        tasks = [
+            asyncio.create_task(self.summarize_chunk_async(chunk)) for chunk in chunks
+        ]
+        try:
+            summaries = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
 
         if self.verbose:
             logger.debug(f"Summarized {len(chunks)} chunk(s) in parallel.")
@@ -196,6 +491,15 @@ Critical rules:
         Produces a final, consolidated version of the retained information.
         Maintains maximum detail in a cohesive format.
         """
+        return asyncio.run(self.final_reduction_async(text))
+
+    async def final_reduction_async(
+        self, text: str, on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Awaitable final_reduction.
+        :param on_text: Called with each piece of the final summary as it is generated.
+        """
 
         system_prompt = f"""You are creating the final consolidated summary of preserved information.
 Preserve maximum detail and maintain a cohesive structure. You response MUST contain less than {self.max_output_tokens // 2} words.
@@ -213,43 +517,151 @@ Requirements:
    - Procedural steps
    - Configuration details
    - Interrelationships
+"""
+        if self.topic:
+            system_prompt += f"""
+The reader is interested in: {self.topic}
+Address it first and in full detail, using only the given content; mention anything else only briefly.
+The content consists of the excerpts of the file most relevant to it, in their original order.
 """
 
         user_prompt = f"""content to summarize:
 
 {text}"""
 
-        return self.chat_completion(
-            system_prompt,
-            user_prompt,
-            max_tokens=self.max_output_tokens,
-            temperature=0.1,
+        return await self._cached_chat_completion(
+            "final", text, system_prompt, user_prompt, on_text
         )
 
     def iterative_summarize(self, text_to_summarize: str) -> str:
         """
         Recursively summarizes the text and merges the summaries until it is reduced to a single (summary) chunk.
         """
+        return asyncio.run(self.iterative_summarize_async(text_to_summarize))
 
-        chunks = self.chunk_text(text_to_summarize)
-        # if there is only one chunk, we are done
-        if len(chunks) <= 1:
+    async def iterative_summarize_async(
+        self, text_to_summarize: str, tokens: array = None
+    ) -> str:
+        """
+        Awaitable iterative_summarize. The text is encoded only once, and the levels of the reduction
+        tree overlap (see tools.reduction.OrderedTreeReducer) while keeping document order.
+        """
+        if tokens is None:
+            tokens = encode(text_to_summarize)
+
+        # if the whole text fits in the final reduction, we are done
+        if len(tokens) <= self.max_final_input_tokens:
             return text_to_summarize
 
-        # Otherwise, split the text into chunks and summarize them in parallel
-        next_level_summaries = self.summarize_chunks_in_parallel(chunks)
-        if self.verbose:
-            logger.debug(
-                f"Combining {len(next_level_summaries)} summaries into a new text..."
-            )
-        return self.iterative_summarize("\n\n".join(next_level_summaries))
+        async def chunks():
+            for chunk_tokens in self.chunk_tokens(tokens):
+                yield decode(chunk_tokens), chunk_tokens
+
+        # the document's size is known, so the reduction can be kept within the depth cap
+        reduction_ratio = max(
+            self.reduction_ratio,
+            get_reduction_ratio(
+                len(tokens), self.max_chunk_size, self.max_output_tokens, self.max_final_input_tokens
+            ),
+        )
+        return await OrderedTreeReducer(self, reduction_ratio=reduction_ratio).reduce(chunks())
 
     def summarize(self, document_text: str) -> str:
         """
         Main entry point for summarization:
         1) Recursively merge until single summary/chunk with less than MAX_CHUNK_TOKENS remains
         2) Perform final reduction for a cohesive, detail-rich result
+        Must not be called from inside a running event loop; use summarize_async there.
+        """
+        return asyncio.run(self.summarize_async(document_text))
+
+    async def summarize_async(
+        self,
+        document_text: str,
+        tokens: array = None,
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        """
+        Awaitable summarize. Pass the document's tokens if they are already known to skip re-encoding it.
+        Pass on_text to receive the final summary piece by piece while it is generated.
         """
-        reduced_summary = self.iterative_summarize(document_text)
-        final_summary = self.final_reduction(reduced_summary)
+        if self.topic:
+            if tokens is None:
+                tokens = encode(document_text)
+
+            async def document():
+                yield document_text, tokens
+
+            return await self.summarize_stream_async(document(), on_text)
+
+        reduced_summary = await self.iterative_summarize_async(document_text, tokens)
+        final_summary = await self.final_reduction_async(reduced_summary, on_text)
         return final_summary
+
+    async def summarize_stream_async(
+        self,
+        token_pieces: AsyncIterable[Tuple[str, array]],
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        """
+        Streaming summarize: documents up to max_final_input_tokens are summarized in a single pass.
+        For larger ones, chunk summarization starts while the document is still being read and tokenized.
+        At most max_concurrency chunks are held in memory awaiting their summaries, so memory stays
+        proportional to the chunk size rather than the document size.
+        With a topic, the whole document is read and only the passages most relevant to it are summarized.
+        Pass on_text to receive the final summary piece by piece while it is generated.
+        """
+        if self.topic:
+            token_pieces = await self._relevant_pieces(token_pieces)
+
+        # single pass: a document that fits in the final reduction goes straight to it like in summarize_async
+        token_pieces = token_pieces.__aiter__()
+        head: List[Tuple[str, array]] = []
+        head_token_count = 0
+        async for piece in token_pieces:
+            head.append(piece)
+            head_token_count += len(piece[1])
+            if head_token_count > self.max_final_input_tokens:
+                break
+        else:
+            return await self.final_reduction_async(
+                "".join(text for text, _ in head), on_text
+            )
+
+        async def all_pieces():
+            for piece in head:
+                yield piece
+            head.clear()
+            async for piece in token_pieces:
+                yield piece
+
+        reduced_summary = await OrderedTreeReducer(self).reduce(self.chunk_stream(all_pieces()))
+        return await self.final_reduction_async(reduced_summary, on_text)
+
+    async def _relevant_pieces(
+        self, token_pieces: AsyncIterable[Tuple[str, array]]
+    ) -> AsyncIterator[Tuple[str, array]]:
+        """
+        The passages of the document most relevant to self.topic, within topic_token_budget, in document order.
+        If no passage matches the topic at all, the whole document is summarized.
+        """
+        gap_tokens = encode(PASSAGE_GAP)
+        passages, selected = await select_relevant_passages(
+            token_pieces,
+            self.topic,
+            self.chunking_strategy,
+            self.topic_token_budget,
+            separator_tokens=len(gap_tokens),
+        )
+        if selected is None:
+            selected = range(len(passages))
+
+        async def pieces():
+            previous = None
+            for i in selected:
+                if previous is not None and i != previous + 1:
+                    yield PASSAGE_GAP, gap_tokens
+                yield decode(passages[i]), passages[i]
+                previous = i
+
+        return pieces()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+import base64
+import hashlib
+import json
+import os
+from array import array
+from typing import Dict, List, Optional, Tuple
+from tools.helper import setup_logger
+from tools.gptscript_workspace import read_file_in_workspace, write_file_in_workspace
+from tools.metrics import add_to_trace
+from tools.tokens import TIKTOKEN_ENCODING
+
+logger = setup_logger(__name__)
+
+INCREMENTAL_ENABLED = os.getenv("FILE_SUMMARIZER_INCREMENTAL", "true").lower() not in ("0", "false", "off", "no")
+# the summary tree of "notes_summary.md" is stored in "notes_summary.md.tree.json"
+SUMMARY_TREE_SUFFIX = ".tree.json"
+# bump whenever the layout of the tree file changes
+SUMMARY_TREE_VERSION = 1
+# a chunk boundary is recognized by up to this many tokens on each side of it
+ANCHOR_TOKENS = 16
+
+
+def summary_tree_file_name(summary_file: str) -> str:
+    """The workspace file that stores the summary tree behind a summary file."""
+    return summary_file + SUMMARY_TREE_SUFFIX
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class SummaryTree:
+    """
+    The chunk boundaries, summaries and merge groups of the previous summarization of a file,
+    used to re-summarize it incrementally, and those of the current summarization, to be stored for the next one.
+
+    It serves as the summarizer's cache: summaries are looked up by the same fingerprints
+    (a hash of the input text, model, prompt version and output limit), first among the previous run's
+    and then in the fallback cache. So that unchanged parts of the file give the same inputs again,
+    chunks are cut where the previous run cut them (recognized by the ANCHOR_TOKENS tokens on each side of a cut),
+    and summaries are merged in the previous run's groups whenever those still fit.
+    Only new or changed chunks, and the merges and final reduction above them, are then recomputed.
+    """
+
+    def __init__(self, fallback_cache=None, data: Optional[dict] = None):
+        """
+        :param fallback_cache: Cache (e.g. tools.cache.SQLiteLRUCache) to use for summaries that are not in the tree.
+        :param data: The previous run's tree, as produced by to_json, or None to start from scratch.
+        """
+        self.fallback_cache = fallback_cache
+        data = data or {}
+        # the plan of the previous run; keeping it lines the chunks up
+        self.chunk_tokens: Optional[int] = data.get("chunk_tokens")
+        self.output_tokens: Optional[int] = data.get("output_tokens")
+        self.summaries: Dict[str, str] = data.get("summaries", {})
+        # (chunk length, offset of the cut in the anchor, anchor tokens) per chunk, in document order
+        self.chunk_anchors: List[Tuple[int, int, bytes]] = [
+            (length, offset, base64.b64decode(anchor))
+            for length, offset, anchor in data.get("chunk_anchors", [])
+        ]
+        self.group_ends = set(data.get("group_ends", []))
+        self._next_anchor = 0
+
+        self.new_summaries: Dict[str, str] = {}
+        self.new_chunk_anchors: List[Tuple[int, int, bytes]] = []
+        self.new_group_ends: List[str] = []
+        self.reused = 0
+
+    @property
+    def previous_plan(self) -> Optional[Tuple[int, int]]:
+        """(chunk tokens, output tokens) of the previous run, if there was one."""
+        if self.chunk_tokens is None or self.output_tokens is None:
+            return None
+        return self.chunk_tokens, self.output_tokens
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.summaries.get(key)
+        if value is not None:
+            self.reused += 1
+            add_to_trace("reused_summaries", 1)
+        elif self.fallback_cache is not None:
+            value = self.fallback_cache.get(key)
+        if value is not None:
+            self.new_summaries[key] = value
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.new_summaries[key] = value
+        if self.fallback_cache is not None:
+            self.fallback_cache.set(key, value)
+
+    def find_chunk_end(self, tokens: array, max_tokens: int) -> Optional[int]:
+        """
+        Where the previous run cut the chunk that starts at tokens, if that cut is within the first max_tokens.
+        The next expected cut is tried at its previous offset first; otherwise (after an edit) the earliest
+        remaining cut found in the window is used. Cuts are used in document order and at most once.
+
+        :param tokens: The tokens from the start of the chunk, and as many after it as are known.
+        :param max_tokens: The token budget of the chunk.
+        :return: The number of tokens that make up the chunk, or None.
+        """
+        if self._next_anchor >= len(self.chunk_anchors):
+            return None
+        itemsize = tokens.itemsize
+        data = tokens[: max_tokens + ANCHOR_TOKENS].tobytes()
+
+        length, offset, anchor = self.chunk_anchors[self._next_anchor]
+        if length <= max_tokens and data.startswith(anchor, (length - offset) * itemsize):
+            self._next_anchor += 1
+            return length
+
+        best_end, best_index = None, None
+        for index in range(self._next_anchor, len(self.chunk_anchors)):
+            _, offset, anchor = self.chunk_anchors[index]
+            # cuts near the start or end of the file (like the end itself) are too ambiguous to search for
+            if len(anchor) < 2 * ANCHOR_TOKENS * itemsize:
+                continue
+            position = data.find(anchor)
+            # only matches on token boundaries count
+            while position != -1 and position % itemsize:
+                position = data.find(anchor, position + 1)
+            if position == -1:
+                continue
+            end = position // itemsize + offset
+            if 0 < end <= max_tokens and (best_end is None or end < best_end):
+                best_end, best_index = end, index
+        if best_end is None:
+            return None
+        self._next_anchor = best_index + 1
+        return best_end
+
+    def add_chunk(self, tokens: array, end: int) -> None:
+        """Record a chunk of the current run, in document order.
+
+        :param tokens: The tokens from the start of the chunk, and as many after it as are known.
+        :param end: The length of the chunk.
+        """
+        start = max(0, end - ANCHOR_TOKENS)
+        self.new_chunk_anchors.append(
+            (end, end - start, tokens[start : end + ANCHOR_TOKENS].tobytes())
+        )
+
+    def is_group_end(self, summary: str) -> bool:
+        """Whether the previous run ended a merge group with this summary."""
+        return bool(self.group_ends) and _digest(summary) in self.group_ends
+
+    def add_group_end(self, summary: str) -> None:
+        """Record the last summary of a merge group of the current run."""
+        self.new_group_ends.append(_digest(summary))
+
+    def to_json(self) -> str:
+        """The current run's tree."""
+        return json.dumps(
+            {
+                "version": SUMMARY_TREE_VERSION,
+                "encoding": TIKTOKEN_ENCODING,
+                "chunk_tokens": self.chunk_tokens,
+                "output_tokens": self.output_tokens,
+                "chunk_anchors": [
+                    [length, offset, base64.b64encode(anchor).decode("ascii")]
+                    for length, offset, anchor in self.new_chunk_anchors
+                ],
+                "group_ends": self.new_group_ends,
+                "summaries": self.new_summaries,
+            }
+        )
+
+
+async def load_summary_tree(tree_file: str, fallback_cache=None) -> SummaryTree:
+    """Load the summary tree of a previous run from the workspace.
+
+    A missing, unreadable or outdated tree file gives an empty tree, i.e. a summarization from scratch.
+
+    Args:
+        tree_file (str): The workspace file of the tree, see summary_tree_file_name.
+        fallback_cache: Cache to use for summaries that are not in the tree.
+
+    Returns:
+        SummaryTree: The tree.
+    """
+    try:
+        data = json.loads(await read_file_in_workspace(tree_file))
+    except Exception as e:
+        logger.debug(f"No summary tree loaded from {tree_file}: {e}")
+        return SummaryTree(fallback_cache)
+
+    if data.get("version") != SUMMARY_TREE_VERSION or data.get("encoding") != TIKTOKEN_ENCODING:
+        logger.info(f"Ignoring outdated summary tree {tree_file}")
+        return SummaryTree(fallback_cache)
+    logger.info(
+        f"Loaded summary tree {tree_file} with {len(data.get('summaries', {}))} summaries"
+    )
+    return SummaryTree(fallback_cache, data)
+
+
+async def save_summary_tree(tree_file: str, tree: SummaryTree) -> bool:
+    """Store the current run's summary tree in the workspace for the next run.
+
+    Args:
+        tree_file (str): The workspace file of the tree, see summary_tree_file_name.
+        tree (SummaryTree): The tree.
+
+    Returns:
+        bool: Whether the tree was written.
+    """
+    return await write_file_in_workspace(tree_file, tree.to_json())
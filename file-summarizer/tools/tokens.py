@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterable, AsyncIterator, Iterable, List, Optional, Tuple
+import asyncio
+import marshal
+import os
+import sys
+import tempfile
+import time
+from tools.helper import CACHE_DIR, setup_logger
+from tools.metrics import add_to_trace
+
+if TYPE_CHECKING:
+    import tiktoken
+
+logger = setup_logger(__name__)
+
+# always use gpt-4o for tokenization
+TIKTOKEN_MODEL = "gpt-4o"
+# the encoding of TIKTOKEN_MODEL; names the encoder cache file
+TIKTOKEN_ENCODING = "o200k_base"
+
+# if no safe split point shows up within this many pending characters, encode them anyway to bound memory
+MAX_PENDING_CHARS = 4_000_000
+# threads that encode in parallel; tiktoken releases the GIL while encoding, so they scale with cores
+ENCODE_WORKERS = int(os.getenv("FILE_SUMMARIZER_ENCODE_WORKERS", "0")) or os.cpu_count() or 1
+# texts are only split for parallel encoding into parts of at least this many characters
+MIN_ENCODE_PART_CHARS = 256_000
+
+# where the encoder's BPE ranks are kept once loaded, in lookup order; the first writable one is populated.
+# The tool-local directory is filled at image build time (python -m tools.tokens), so reads work offline.
+ENCODER_CACHE_DIRS = [
+    d
+    for d in (
+        os.getenv("FILE_SUMMARIZER_ENCODER_CACHE_DIR"),
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".encoder-cache"),
+        os.path.join(CACHE_DIR, "encoder"),
+    )
+    if d
+]
+
+_encoder = None
+_encode_pool = None
+
+
+def _encoder_cache_file(directory: str) -> str:
+    # marshal's format is only stable within one Python version
+    return os.path.join(
+        directory, f"{TIKTOKEN_ENCODING}.py{sys.version_info[0]}{sys.version_info[1]}.marshal"
+    )
+
+
+def _load_cached_encoder() -> Optional["tiktoken.Encoding"]:
+    """Build the encoder from the first cached copy of its ranks, or None if there is none."""
+    import tiktoken
+
+    for directory in ENCODER_CACHE_DIRS:
+        try:
+            with open(_encoder_cache_file(directory), "rb") as f:
+                params = marshal.loads(f.read())
+            return tiktoken.Encoding(**params)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable encoder cache in {directory}: {e}")
+    return None
+
+
+def _save_cached_encoder(encoder: "tiktoken.Encoding") -> None:
+    """Write the encoder's ranks to the first writable cache directory, atomically."""
+    params = {
+        "name": encoder.name,
+        "pat_str": encoder._pat_str,
+        "mergeable_ranks": encoder._mergeable_ranks,
+        "special_tokens": encoder._special_tokens,
+    }
+    for directory in ENCODER_CACHE_DIRS:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    marshal.dump(params, f)
+                # readable by whichever user runs the tool, e.g. when built into an image as root
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, _encoder_cache_file(directory))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            return
+        except OSError:
+            continue
+    logger.warning("No writable encoder cache directory; the encoder will be rebuilt next time")
+
+
+def get_encoder() -> "tiktoken.Encoding":
+    """Get the tiktoken encoder shared by the reader and the summarizer.
+
+    tiktoken is imported on first use. The BPE ranks are read from the local encoder cache when present,
+    which skips tiktoken's download and base64 parsing; otherwise they are loaded through tiktoken once
+    and cached for the next invocation.
+
+    Returns:
+        tiktoken.Encoding: The encoder for TIKTOKEN_MODEL.
+    """
+    global _encoder
+    if _encoder is None:
+        start = time.perf_counter()
+        _encoder = _load_cached_encoder()
+        if _encoder is None:
+            import tiktoken
+
+            _encoder = tiktoken.encoding_for_model(TIKTOKEN_MODEL)
+            _save_cached_encoder(_encoder)
+        add_to_trace("encoder_load_seconds", time.perf_counter() - start)
+    return _encoder
+
+
+def _get_encode_pool() -> ThreadPoolExecutor:
+    global _encode_pool
+    if _encode_pool is None:
+        _encode_pool = ThreadPoolExecutor(ENCODE_WORKERS, thread_name_prefix="encode")
+    return _encode_pool
+
+
+def _encode_part(text: str) -> Tuple[List[int], float]:
+    # runs in the encode pool, where the trace is not available; the caller records the time
+    start = time.perf_counter()
+    tokens = get_encoder().encode(text, disallowed_special=())
+    return tokens, time.perf_counter() - start
+
+
+def split_for_encoding(text: str, parts: Optional[int] = None) -> List[str]:
+    """Split text at safe split points (see find_safe_split) into at most `parts` pieces
+    of at least MIN_ENCODE_PART_CHARS characters, whose encodings concatenate to the encoding of text.
+
+    Args:
+        text (str): The text to split.
+        parts (Optional[int]): The maximum number of pieces; defaults to ENCODE_WORKERS.
+
+    Returns:
+        List[str]: The pieces, in order; just [text] if it is too short or has no safe split points.
+    """
+    parts = min(parts or ENCODE_WORKERS, len(text) // MIN_ENCODE_PART_CHARS)
+    if parts <= 1:
+        return [text]
+    pieces = []
+    start = 0
+    for i in range(1, parts):
+        split = find_safe_split(text, len(text) * i // parts)
+        if split - start >= MIN_ENCODE_PART_CHARS and len(text) - split >= MIN_ENCODE_PART_CHARS:
+            pieces.append(text[start:split])
+            start = split
+    pieces.append(text[start:])
+    return pieces
+
+
+def encode(text: str) -> array:
+    """Encode text into a compact array of token ids.
+
+    Special-token markers (e.g. "<|endoftext|>") in the text are encoded as plain text
+    instead of raising, since file content is arbitrary user data.
+    Large texts are split at safe split points and their parts encoded on ENCODE_WORKERS threads;
+    the result is identical to encoding the text in one call.
+
+    Args:
+        text (str): The text to encode.
+
+    Returns:
+        array: The token ids, as an array('I').
+    """
+    parts = split_for_encoding(text)
+    if len(parts) == 1:
+        part_results = [_encode_part(text)]
+    else:
+        # load the encoder before the threads use it
+        get_encoder()
+        part_results = list(_get_encode_pool().map(_encode_part, parts))
+    tokens = array("I")
+    for part_tokens, seconds in part_results:
+        tokens.extend(part_tokens)
+        add_to_trace("tokenize_seconds", seconds)
+    add_to_trace("tokenized_chars", len(text))
+    return tokens
+
+
+async def encode_async(text: str) -> array:
+    """Awaitable encode that runs on the encode pool, so the event loop keeps going while text is encoded."""
+    get_encoder()
+    part_tokens, seconds = await asyncio.get_running_loop().run_in_executor(
+        _get_encode_pool(), _encode_part, text
+    )
+    add_to_trace("tokenize_seconds", seconds)
+    add_to_trace("tokenized_chars", len(text))
+    return array("I", part_tokens)
+
+
+def decode(tokens: Iterable[int]) -> str:
+    """Decode token ids back into text.
+
+    Args:
+        tokens (Iterable[int]): The token ids, e.g. an array('I') or a slice of one.
+
+    Returns:
+        str: The decoded text.
+    """
+    return get_encoder().decode(tokens)
+
+
+# text is scanned in slices of this many characters, so that bounds can stop early on large pieces
+BOUNDS_SLICE_CHARS = 65536
+
+_ASCII_WHITESPACE = frozenset(b" \t\n\r\x0b\x0c")
+_NEWLINES = frozenset(b"\r\n")
+_SLASH = ord("/")
+
+
+class TokenCountBounds:
+    """
+    Guaranteed bounds on the token count of a text that arrives in pieces, computed without tokenizing it.
+
+    Every token is at least one UTF-8 byte, so the byte length is an upper bound. The tokenizer's
+    pre-tokenization never merges two whitespace-separated words, except that a punctuation run can absorb
+    newlines and "/" (see find_safe_split), so the word count minus such "\n/" joins is a lower bound.
+    """
+
+    def __init__(self):
+        self.lower = 0
+        self.upper = 0
+        self._last_byte = None
+
+    def add(self, text: str, stop_above: int = None):
+        """
+        :param text: The next piece of the text.
+        :param stop_above: Stop scanning once the lower bound exceeds this; upper then only covers what was scanned.
+        """
+        for start in range(0, len(text), BOUNDS_SLICE_CHARS):
+            data = text[start : start + BOUNDS_SLICE_CHARS].encode("utf-8")
+            words = len(data.split()) - data.count(b"\n/") - data.count(b"\r/")
+            if self._last_byte is not None:
+                if self._last_byte not in _ASCII_WHITESPACE and data[0] not in _ASCII_WHITESPACE:
+                    # the first word continues the last one of the previous slice
+                    words -= 1
+                elif self._last_byte in _NEWLINES and data[0] == _SLASH:
+                    words -= 1
+            self.lower += words
+            self.upper += len(data)
+            self._last_byte = data[-1]
+            if stop_above is not None and self.lower > stop_above:
+                return
+
+
+def find_safe_split(text: str, end: int = None) -> int:
+    """Find the last position in text[:end] where the text can be split without changing its tokenization.
+
+    A newline that is followed by a character other than whitespace or "/" is never merged with the
+    following character by the tokenizer's pre-tokenization, so splitting right after it encodes identically.
+
+    Args:
+        text (str): The text to split.
+        end (int): Only consider split points before this index (default: len(text)).
+
+    Returns:
+        int: The split index (the piece before it ends with a newline), or -1 if there is none.
+    """
+    if end is None:
+        end = len(text)
+    if end < 2:
+        # rfind would read a negative end as counted from the end of the text
+        return -1
+    pos = text.rfind("\n", 0, end - 1)
+    while pos != -1:
+        if not text[pos + 1].isspace() and text[pos + 1] != "/":
+            return pos + 1
+        pos = text.rfind("\n", 0, pos)
+    return -1
+
+
+async def iter_encoded_pieces(
+    pieces: AsyncIterable[str],
+) -> AsyncIterator[Tuple[str, array]]:
+    """Incrementally encode a stream of text pieces.
+
+    Incoming text is buffered only until a safe split point, so memory stays proportional to the piece size.
+    Up to ENCODE_WORKERS pieces are encoded in parallel on the encode pool and yielded in order.
+
+    Args:
+        pieces (AsyncIterable[str]): Consecutive pieces of a text.
+
+    Yields:
+        tuple[str, array]: Consecutive (text, tokens) pieces whose concatenation is the whole text and its tokens.
+    """
+    in_flight = deque()
+    pending = ""
+    async for piece in pieces:
+        pending += piece
+        split = find_safe_split(pending)
+        if split == -1:
+            if len(pending) < MAX_PENDING_CHARS:
+                continue
+            split = len(pending)
+        text, pending = pending[:split], pending[split:]
+        in_flight.append((text, asyncio.ensure_future(encode_async(text))))
+        if len(in_flight) >= ENCODE_WORKERS:
+            text, tokens = in_flight.popleft()
+            yield text, await tokens
+    if pending:
+        in_flight.append((pending, asyncio.ensure_future(encode_async(pending))))
+    while in_flight:
+        text, tokens = in_flight.popleft()
+        yield text, await tokens
+
+
+if __name__ == "__main__":
+    # pre-populate the encoder cache, e.g. at image build time
+    get_encoder()
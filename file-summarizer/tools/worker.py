@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+import asyncio
+import contextvars
+import hashlib
+import io
+import json
+import logging
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional
+from tools.helper import CACHE_DIR, reset_call_environment, set_call_environment, setup_logger
+
+logger = setup_logger(__name__)
+
+# "off": always run in-process; "on": use a running worker if there is one;
+# "spawn": also start one in the background if there is none
+WORKER_MODE = os.getenv("FILE_SUMMARIZER_WORKER", "off").lower()
+# a worker exits after this many seconds without requests
+WORKER_IDLE_SECONDS = float(os.getenv("FILE_SUMMARIZER_WORKER_IDLE_SECONDS", "900"))
+# the tool's parameters; they are sent with each request
+REQUEST_VARIABLES = ("INPUT_FILE", "OUTPUT_FILE", "TOPIC")
+# variables that configure a run (credentials, endpoints, models, workspace) and all FILE_SUMMARIZER_* settings:
+# a worker only serves callers whose values are the same as its own, so that it never needs to switch environments
+ENVIRONMENT_VARIABLES = (
+    "OPENAI_API_KEY",
+    "OPENAI_BASE_URL",
+    "OBOT_DEFAULT_LLM_MODEL",
+    "OBOT_DEFAULT_VISION_MODEL",
+    "GPTSCRIPT_WORKSPACE_ID",
+    "GPTSCRIPT_URL",
+)
+SETTINGS_PREFIX = "FILE_SUMMARIZER_"
+# settings that only concern the worker itself
+IGNORED_VARIABLES = ("FILE_SUMMARIZER_WORKER", "FILE_SUMMARIZER_WORKER_IDLE_SECONDS")
+# variables that differ from call to call (run, thread, token, server versions, ...): they are sent with each
+# request and override the worker's own for that request (see tools.helper.getenv)
+CALL_VARIABLE_PREFIXES = ("OBOT_", "GPTSCRIPT_")
+# the tool's input, which is already sent as REQUEST_VARIABLES
+CALL_IGNORED_VARIABLES = ("GPTSCRIPT_INPUT",)
+# requests and responses are JSON lines; a response line can hold a whole summary
+MAX_LINE_BYTES = 64 * 1024 * 1024
+# main.py, which serves with --serve
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+# sends what is printed or logged while a request is being served to its caller, given the kind of output
+# ("output" or "log") and the text
+_request_output: contextvars.ContextVar[Optional[Callable[[str, str], None]]] = contextvars.ContextVar(
+    "request_output", default=None
+)
+
+
+def environment_key(environ=None) -> str:
+    """A hash of the variables that configure a run, and of the tool's location (i.e. its version)."""
+    environ = os.environ if environ is None else environ
+    variables = sorted(
+        (name, value)
+        for name, value in environ.items()
+        if name in ENVIRONMENT_VARIABLES or (name.startswith(SETTINGS_PREFIX) and name not in IGNORED_VARIABLES)
+    )
+    return hashlib.sha256(json.dumps([MAIN_SCRIPT, variables]).encode("utf-8")).hexdigest()[:32]
+
+
+def call_variables(environ=None) -> Dict[str, str]:
+    """The variables of the current call that are sent with a request, i.e. those that are not part of its
+    environment key."""
+    environ = os.environ if environ is None else environ
+    return {
+        name: value
+        for name, value in environ.items()
+        if name.startswith(CALL_VARIABLE_PREFIXES)
+        and name not in ENVIRONMENT_VARIABLES
+        and name not in CALL_IGNORED_VARIABLES
+    }
+
+
+def worker_socket_path(environ=None) -> str:
+    """The Unix socket of the worker for the current environment."""
+    path = os.path.join(CACHE_DIR, "workers", environment_key(environ) + ".sock")
+    # socket paths are limited to about 100 bytes
+    if len(path.encode("utf-8")) > 100:
+        path = os.path.join(
+            tempfile.gettempdir(), f"obot-file-summarizer-{os.getuid()}", environment_key(environ) + ".sock"
+        )
+    return path
+
+
+def _is_private_directory(directory: str) -> bool:
+    # requests carry credentials: a directory that another user owns or can write to may hold their socket
+    try:
+        st = os.lstat(directory)
+    except OSError:
+        return False
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and stat.S_IMODE(st.st_mode) & 0o077 == 0
+
+
+def _make_private_directory(directory: str) -> bool:
+    """Create the directory of the worker sockets, and check that only this user can use it.
+
+    Returns:
+        bool: Whether workers can use the directory; if not, a warning is logged.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and stat.S_IMODE(st.st_mode) & 0o077:
+        # this user's own directory, e.g. created with a looser umask
+        os.chmod(directory, 0o700)
+    if _is_private_directory(directory):
+        return True
+    logger.warning(f"Not using {directory} for file summarizer workers: it is not a directory that only this user can access")
+    return False
+
+
+def _is_private_socket(path: str) -> bool:
+    try:
+        owner = os.lstat(path).st_uid
+    except OSError:
+        return False
+    return owner == os.getuid() and _is_private_directory(os.path.dirname(path))
+
+
+def workers_supported() -> bool:
+    return hasattr(asyncio, "open_unix_connection") and hasattr(os, "getuid")
+
+
+async def run_in_worker(
+    request: Dict[str, str], write: Callable[[str], None], log: Optional[Callable[[str], None]] = None
+) -> bool:
+    """Run a request in the worker for the current environment, if one is running.
+
+    Args:
+        request (Dict[str, str]): The tool's parameters, see REQUEST_VARIABLES.
+        write (Callable[[str], None]): Called with each piece of the output as the worker prints it.
+        log (Optional[Callable[[str], None]]): Called with each piece of the worker's log for this request
+            (default: written to stderr, as when running in-process).
+
+    Raises:
+        Exception: With the worker's error message, if the request failed.
+
+    Returns:
+        bool: Whether the worker ran the request; if not, nothing was written and it should run in-process.
+    """
+    if WORKER_MODE == "off" or not workers_supported():
+        return False
+    path = worker_socket_path()
+    if not os.path.exists(path):
+        return False
+    if not _is_private_socket(path):
+        logger.warning(f"Not using the file summarizer worker at {path}: it does not belong to this user")
+        return False
+    if log is None:
+
+        def log(text: str):
+            sys.stderr.write(text)
+            sys.stderr.flush()
+
+    try:
+        reader, writer = await asyncio.open_unix_connection(path, limit=MAX_LINE_BYTES)
+    except OSError as e:
+        logger.debug(f"No worker at {path}: {e}")
+        return False
+
+    written = False
+    try:
+        message = {"request": request, "environment": call_variables()}
+        writer.write(json.dumps(message).encode("utf-8") + b"\n")
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                if written:
+                    raise Exception("ERROR: The file summarizer worker stopped before finishing")
+                # the worker went away before doing anything, e.g. because it was idle for too long
+                logger.info("The file summarizer worker closed the connection; running in-process")
+                return False
+            message = json.loads(line)
+            if "output" in message:
+                write(message["output"])
+                written = True
+            elif "log" in message:
+                log(message["log"])
+            elif "error" in message:
+                raise Exception(message["error"])
+            else:
+                return True
+    except ConnectionError as e:
+        if written:
+            raise Exception(f"ERROR: Lost the connection to the file summarizer worker: {e}")
+        return False
+    finally:
+        writer.close()
+
+
+def spawn_worker() -> None:
+    """Start a worker for the current environment in the background, unless one is already running.
+
+    The worker serves requests from the next call on; its log is next to its socket.
+    """
+    if not workers_supported():
+        return
+    path = worker_socket_path()
+    if os.path.exists(path) or not _make_private_directory(os.path.dirname(path)):
+        return
+    with open(path[: -len(".sock")] + ".log", "ab") as log:
+        subprocess.Popen(
+            [sys.executable, MAIN_SCRIPT, "--serve"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=log,
+            start_new_session=True,
+        )
+    logger.info(f"Started a file summarizer worker at {path}")
+
+
+class _RequestOutput(io.TextIOBase):
+    """Sends what is written to stdout or stderr while serving a request to that request's caller."""
+
+    def __init__(self, stream, kind: str):
+        """
+        :param stream: Where the text goes outside of requests.
+        :param kind: "output" for stdout, "log" for stderr.
+        """
+        self.stream = stream
+        self.kind = kind
+
+    def write(self, text: str) -> int:
+        send = _request_output.get()
+        if send is None:
+            return self.stream.write(text)
+        send(self.kind, text)
+        return len(text)
+
+    def flush(self):
+        if _request_output.get() is None:
+            self.stream.flush()
+
+
+def _redirect_log_handlers(stream, replacement) -> None:
+    # loggers made with tools.helper.setup_logger write to the sys.stderr of when they were set up
+    loggers = [logging.getLogger()] + [
+        each for each in logging.Logger.manager.loggerDict.values() if isinstance(each, logging.Logger)
+    ]
+    for each in loggers:
+        for handler in each.handlers:
+            if isinstance(handler, logging.StreamHandler) and handler.stream is stream:
+                handler.setStream(replacement)
+
+
+async def serve(
+    handler: Callable[[Dict[str, str]], Awaitable[None]],
+    idle_seconds: float = WORKER_IDLE_SECONDS,
+) -> None:
+    """Serve requests for the current environment on a Unix socket until idle for idle_seconds.
+
+    Requests are served concurrently, each in its own task; what they print and log goes back to their callers.
+    Only one worker serves an environment: if another one holds the lock, this returns at once.
+
+    Args:
+        handler (Callable[[Dict[str, str]], Awaitable[None]]): Runs one request, given the tool's parameters.
+        idle_seconds (float): How long to wait for the next request before exiting.
+    """
+    import fcntl
+
+    path = worker_socket_path()
+    if not _make_private_directory(os.path.dirname(path)):
+        return
+    lock = open(path[: -len(".sock")] + ".lock", "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        logger.info(f"Another file summarizer worker is serving {path}")
+        lock.close()
+        return
+
+    active = 0
+    last_request = time.monotonic()
+    loop = asyncio.get_running_loop()
+    loop_thread = threading.get_ident()
+
+    async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        nonlocal active, last_request
+        active += 1
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            request = message["request"]
+
+            def send(kind: str, text: str):
+                data = json.dumps({kind: text}).encode("utf-8") + b"\n"
+                # e.g. logged from a thread the request's work was handed to
+                if threading.get_ident() == loop_thread:
+                    writer.write(data)
+                else:
+                    loop.call_soon_threadsafe(writer.write, data)
+
+            token = _request_output.set(send)
+            environment_token = set_call_environment(message.get("environment", {}))
+            try:
+                await handler(request)
+                response = {"done": True}
+            except Exception as e:
+                logger.error(f"Request {request} failed: {e}")
+                response = {"error": str(e)}
+            finally:
+                reset_call_environment(environment_token)
+                _request_output.reset(token)
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+        except (ConnectionError, ValueError, KeyError) as e:
+            logger.warning(f"Dropped a request: {e}")
+        finally:
+            active -= 1
+            last_request = time.monotonic()
+            writer.close()
+
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _RequestOutput(stdout, "output"), _RequestOutput(stderr, "log")
+    _redirect_log_handlers(stderr, sys.stderr)
+    if os.path.exists(path):
+        # left behind by a worker that did not exit cleanly; the lock shows it is gone
+        os.unlink(path)
+    umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(on_connection, path, limit=MAX_LINE_BYTES)
+    finally:
+        os.umask(umask)
+    logger.info(f"File summarizer worker serving {path}")
+    try:
+        while active or time.monotonic() - last_request < idle_seconds:
+            await asyncio.sleep(min(1.0, idle_seconds))
+        server.close()
+        # a request may have been accepted just before closing
+        while active:
+            await asyncio.sleep(0.1)
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+        _redirect_log_handlers(sys.stderr, stderr)
+        sys.stdout, sys.stderr = stdout, stderr
+        lock.close()
+    logger.info(f"File summarizer worker at {path} exited after {idle_seconds:.0f}s without requests")
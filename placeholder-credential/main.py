@@ -15,14 +15,26 @@ if os.getenv("ENV_VARS") is None:
 
 
 async def main():
-    g = GPTScript()
-    env_vars = dict()
+    env_names = [env.strip() for env in os.getenv("ENV_VARS").split(";") if env.strip()]
+    if not env_names:
+        print(json.dumps({"env": {}}))
+        return
+
+    # prompt for all the variables at once, so that the user is only asked once however many there are
+    prompt_input = json.dumps({
+        "message": "Please enter the values for " + ", ".join(env_names),
+        "fields": ",".join(env_names),
+        "sensitive": "true",
+    })
 
-    for env in os.getenv("ENV_VARS").split(";"):
-        out = await g.run("sys.prompt", Options(input=f'{{"message":"Please enter the value for {env}", "env":"{env}", "fields":"{env}","sensitive":"true"}}')).text()
-        env_vars.update(json.loads(out))
+    g = GPTScript()
+    try:
+        out = await g.run("sys.prompt", Options(input=prompt_input)).text()
+    finally:
+        g.close()
 
-    print(json.dumps({"env": env_vars}))
+    env_vars = json.loads(out)
+    print(json.dumps({"env": {env: env_vars.get(env, "") for env in env_names}}))
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
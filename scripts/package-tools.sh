@@ -47,6 +47,9 @@ fi
 source /obot-tools/venv/bin/activate
 uv pip install -r /obot-tools/tools/requirements.txt
 
+# pre-populate file-summarizer's tokenizer cache so that it starts fast and works offline
+(cd /obot-tools/tools/file-summarizer && python -m tools.tokens)
+
 cd /obot-tools
 cat <<EOF >.envrc.tools.${REPO_NAME}
 export GPTSCRIPT_SYSTEM_TOOLS_DIR=/obot-tools/